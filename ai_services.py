@@ -3,10 +3,10 @@ import os
 # from google.cloud import vision
 import io
 import re
-import requests
-from bs4 import BeautifulSoup
 import json
 
+from instrumentation import traced
+
 # Simulação de IA para fins de demonstração
 # Em um ambiente real seria utilizado Google Cloud Vision, Amazon Rekognition, etc.
 
@@ -14,6 +14,7 @@ class DocumentAIService:
     """Serviço de análise de documentos usando IA"""
     
     @staticmethod
+    @traced('ai.verify_identity_document')
     def verify_identity_document(file_path, expected_name=None, expected_cpf=None):
         """
         Verifica se um documento de identidade é válido e pertence à pessoa informada.
@@ -40,6 +41,7 @@ class DocumentAIService:
             }
     
     @staticmethod
+    @traced('ai.match_selfie_with_document')
     def match_selfie_with_document(selfie_path, document_path):
         """
         Compara uma selfie com a foto do documento para verificar se é a mesma pessoa.
@@ -66,6 +68,7 @@ class SocialMediaAnalyzer:
     """Serviço de análise de perfis em redes sociais"""
     
     @staticmethod
+    @traced('ai.analyze_social_profile')
     def analyze_social_profile(platform, username, access_token=None):
         """
         Analisa perfil de rede social para extrair informações relevantes sobre e-sports.
@@ -93,7 +96,12 @@ class SocialMediaAnalyzer:
 class EsportsProfileValidator:
     """Valida perfis em plataformas de e-sports"""
     
+    # HttpFetcher (ver fetcher.py) usado para ler as páginas reais dos perfis.
+    # Quando None, apenas a simulação é usada.
+    fetcher = None
+    
     @staticmethod
+    @traced('ai.validate_profile_url')
     def validate_profile_url(platform, url):
         """
         Verifica se uma URL de perfil é válida para a plataforma especificada.
@@ -113,6 +121,7 @@ class EsportsProfileValidator:
         return bool(re.match(r'https?://[\w\.-]+\.\w+/.*', url))
     
     @staticmethod
+    @traced('ai.analyze_esports_profile')
     def analyze_esports_profile(platform, url):
         """
         Analisa um perfil de e-sports para extrair informações relevantes.
@@ -121,10 +130,16 @@ class EsportsProfileValidator:
         Esta é uma simulação para fins de demonstração.
         """
         try:
-            # Em um cenário real, faria web scraping ou usaria APIs
-            # Aqui apenas simulamos o resultado
+            # Dados lidos da página do perfil, quando a coleta real está habilitada
+            scraped = {}
+            # Só páginas dos hosts conhecidos das plataformas com extrator: a URL vem do usuário
+            from fetcher import extract_profile, is_fetchable
+            if EsportsProfileValidator.fetcher is not None and is_fetchable(platform, url):
+                page = EsportsProfileValidator.fetcher.fetch(url)
+                scraped = extract_profile(platform, page.text)
             
-            return {
+            # As estatísticas ainda são simuladas
+            result = {
                 'success': True,
                 'username': 'gamer_detected',
                 'games_played': ['Counter-Strike 2', 'Valorant'],
@@ -137,6 +152,8 @@ class EsportsProfileValidator:
                 'relevance_score': 0.85,
                 'is_relevant_to_esports': True
             }
+            result.update(scraped)
+            return result
         except Exception as e:
             return {
                 'success': False,
@@ -1,113 +1,212 @@
 import os
-import secrets
+import time
+import weakref
 from datetime import datetime
-from flask import Flask, render_template, url_for, flash, redirect, request, jsonify
+from functools import wraps
+import click
+from flask import Flask, Response, abort, current_app, render_template, url_for, flash, redirect, request, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from flask.cli import with_appcontext
 from flask_login import LoginManager, current_user, login_user, logout_user, login_required
 
-from models import db, User, Profile, Document, SocialAccount, EsportsProfile
+from models import db, normalize_email, User, Profile, Document, SocialAccount, EsportsProfile, BackgroundJob, FanInvite
 from forms import RegistrationForm, LoginForm, ProfileForm, DocumentUploadForm, SocialAccountForm, EsportsProfileForm
-from ai_services import DocumentAIService, SocialMediaAnalyzer, EsportsProfileValidator
-
-# Cria e configura a aplicação
-app = Flask(__name__, instance_relative_config=True)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'desenvolvimento-temporario')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI', 'sqlite:///knowyourfan.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max upload
-
-# Garantir que a pasta de uploads existe
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'documents'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'profiles'), exist_ok=True)
-
-# Criar também uma pasta de uploads dentro de static para imagens acessíveis pela web
-os.makedirs(os.path.join('static', 'uploads'), exist_ok=True)
-os.makedirs(os.path.join('static', 'uploads', 'profiles'), exist_ok=True)
-os.makedirs(os.path.join('static', 'uploads', 'documents'), exist_ok=True)
-
-# Inicializar SQLAlchemy com o app
-db.init_app(app)
-
-# Inicializar Flask-Login
+from jobs import job_queue, job_to_dict
+from storage import storage, PROFILE_ORIGINALS_FOLDER
+from social_cache import social_cache
+from batch import batch_runner, parse_batch_items, to_ndjson, analyze_social_item, analyze_esports_item
+from segments import segment_index, SegmentError
+from migrations import db_upgrade_command, run_migrations
+from document_store import store_document, acquire_blob, cached_verification, apply_verification, flag_duplicates
+from identity import identity_cache
+from instrumentation import metrics, query_counter
+from hashing import password_hasher
+from availability import availability
+from export import ExportError, export_fans, export_fans_command, get_format, parse_since
+from scoring import fan_scorer, score_to_dict
+from static_assets import static_assets
+from phash import document_hashes, hash_document
+from fan_import import import_fans_command, invite_token_hash
+from fan_stats import fan_stats
+from search import SearchError, fan_search
+from cpf import format_cpf, normalize as normalize_cpf, validate_batch as validate_cpf_batch
+
+# Extensão de login; create_app() a associa à aplicação
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Por favor, faça login para acessar esta página.'
 
+# Exibida no lugar da foto de perfil enquanto as variantes não foram geradas
+PROFILE_PICTURE_PLACEHOLDER = 'images/profile-placeholder.svg'
+
+# Rotas registradas na aplicação por create_app(). O endpoint continua sendo o
+# nome da função, então url_for('dashboard') e os templates não mudam
+ROUTES = []
+
+def route(rule, **options):
+    """Equivalente a ``app.route`` para as rotas registradas por ``create_app``"""
+    def decorator(f):
+        ROUTES.append((rule, f, options))
+        return f
+    return decorator
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# Cria as tabelas do banco de dados se elas não existirem
-with app.app_context():
-    db.create_all()
-    print("Banco de dados inicializado com sucesso!")
+    return identity_cache.load_user(int(user_id))
 
 # Funções auxiliares
 def save_picture(form_picture, folder):
-    random_hex = secrets.token_hex(8)
     _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    picture_path = os.path.join(app.config['UPLOAD_FOLDER'], folder, picture_fn)
-    form_picture.save(picture_path)
     
-    # Salvar também na pasta static para acesso web
-    static_path = os.path.join('static', 'uploads', folder, picture_fn)
-    form_picture.seek(0)  # Voltar ao início do arquivo
-    try:
-        with open(static_path, 'wb') as f:
-            f.write(form_picture.read())
-    except Exception as e:
-        print(f"Erro ao salvar imagem em static: {e}")
+    # O nome do arquivo é o SHA-256 do conteúdo: reenvios não são gravados de novo.
+    # A gravação é única, em blocos; a cópia em static/uploads é um hardlink
+    stored = storage.save_hashed(form_picture.stream, folder, f_ext)
     
-    return picture_fn
+    return stored.filename
+
+def enqueue_document_verification(stored, document_id=None):
+    """Agenda a verificação do documento com IA para o usuário atual"""
+    return job_queue.enqueue(
+        'verify_document',
+        {
+            'path': storage.local_path('documents', stored.filename),
+            'digest': stored.digest,
+            'expected_name': current_user.name,
+            'expected_cpf': current_user.cpf
+        },
+        user_id=current_user.id,
+        document_id=document_id
+    )
+
+def is_admin(user):
+    return user.is_authenticated and user.email in current_app.config['ADMIN_EMAILS']
+
+def admin_required(f):
+    """Restringe a rota aos e-mails listados em ADMIN_EMAILS"""
+    @wraps(f)
+    @login_required
+    def decorated_function(*args, **kwargs):
+        if not is_admin(current_user):
+            return jsonify({'success': False, 'error': 'Acesso restrito a administradores'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
 
 # Rotas
-@app.route("/")
+@route("/")
 def home():
     return render_template("home.html")
 
-@app.route("/about")
+@route("/uploads/<any(profiles):folder>/<path:filename>")
+def uploaded_file(folder, filename):
+    return storage.send(folder, filename)
+
+def profile_picture_url(profile, size=256, fmt='webp'):
+    """URL da variante da foto de perfil adequada a ``size`` pixels (uma imagem genérica até as variantes existirem)"""
+    filename = profile.picture_for(size, fmt) if profile is not None else None
+    if not filename:
+        return url_for('static', filename=PROFILE_PICTURE_PLACEHOLDER)
+    return url_for('uploaded_file', folder='profiles', filename=filename)
+
+@route("/uploads/documents/<path:filename>")
+@login_required
+def uploaded_document(filename):
+    # Só o dono de um Document com esse arquivo ou um administrador; para os demais o arquivo não existe
+    if not is_admin(current_user):
+        owned = db.session.query(Document.id).filter_by(user_id=current_user.id, filename=filename).first()
+        if owned is None:
+            abort(404)
+    return storage.send('documents', filename)
+
+@route("/about")
 def about():
     return render_template("about.html")
 
-@app.route("/register", methods=['GET', 'POST'])
+@route("/register", methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
     form = RegistrationForm()
     if form.validate_on_submit():
-        # Verificar se o e-mail já existe no banco de dados
-        existing_user_email = User.query.filter_by(email=form.email.data).first()
-        if existing_user_email:
+        # E-mail guardado em minúsculas: Alice@X.com e alice@x.com são a mesma conta
+        email = normalize_email(form.email.data)
+        # Recusa nomes/e-mails já usados antes de calcular o hash da senha, que é lento
+        available = availability.check(username=form.username.data, email=email)
+        if all(available.values()):
+            # As restrições UNIQUE do banco decidem; evita a corrida entre verificar e inserir
+            user = User(username=form.username.data, email=email)
+            user.set_password(form.password.data)
+            db.session.add(user)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                available = availability.check(username=form.username.data, email=email)
+            else:
+                flash('Sua conta foi criada com sucesso! Agora você pode fazer login.', 'success')
+                return redirect(url_for('login'))
+        if not available['email']:
             flash('Este e-mail já está cadastrado. Por favor, use outro e-mail ou faça login.', 'danger')
-            return render_template('register.html', title='Cadastro', form=form)
-            
-        # Verificar se o nome de usuário já existe
-        existing_user_name = User.query.filter_by(username=form.username.data).first()
-        if existing_user_name:
+        else:
             flash('Este nome de usuário já está em uso. Por favor, escolha outro nome de usuário.', 'danger')
-            return render_template('register.html', title='Cadastro', form=form)
-            
-        # Se nem o e-mail nem o nome de usuário existem, criar o novo usuário
-        user = User(username=form.username.data, email=form.email.data)
-        user.set_password(form.password.data)
-        db.session.add(user)
-        db.session.commit()
-        flash('Sua conta foi criada com sucesso! Agora você pode fazer login.', 'success')
-        return redirect(url_for('login'))
     return render_template('register.html', title='Cadastro', form=form)
 
-@app.route("/login", methods=['GET', 'POST'])
+@route("/api/check_availability")
+def api_check_availability():
+    # Só nomes de usuário: responder sobre e-mails revelaria quem tem conta. O e-mail é
+    # verificado no envio do cadastro
+    username = request.args.get('username')
+    if username is None:
+        return jsonify({'error': 'Informe username'}), 400
+    if len(username) > 80:
+        return jsonify({'error': 'Valor muito longo'}), 400
+    return jsonify(availability.check(username=username))
+
+@route("/api/invites/accept", methods=['POST'])
+def api_accept_invite():
+    """Fã importado em massa (flask import-fans) define a senha com o token do convite"""
+    data = request.json or {}
+    token = data.get('token')
+    password = data.get('password') or ''
+    if not token or len(password) < 6:
+        return jsonify({'success': False, 'error': 'Informe o token e uma senha com ao menos 6 caracteres'}), 400
+    
+    invite = FanInvite.query.filter_by(token_hash=invite_token_hash(token)).first()
+    if invite is None or invite.used_at is not None or invite.expires_at < datetime.utcnow():
+        return jsonify({'success': False, 'error': 'Convite inválido ou expirado'}), 404
+    
+    # O hash (lento) fica fora da transação; o UPDATE condicional garante um único uso do convite
+    password_hash = password_hasher.hash(password)
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(FanInvite)
+        .where(FanInvite.id == invite.id, FanInvite.used_at.is_(None), FanInvite.expires_at >= now)
+        .values(used_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Convite inválido ou expirado'}), 404
+    
+    user = db.session.get(User, invite.user_id)
+    user.password_hash = password_hash
+    db.session.commit()
+    login_user(user)
+    return jsonify({'success': True, 'redirect': url_for('profile')})
+
+@route("/login", methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
+        user = User.query.filter_by(email=normalize_email(form.email.data)).first()
         if user and user.check_password(form.password.data):
+            # Refaz o hash se o algoritmo ou os parâmetros configurados mudaram
+            if password_hasher.needs_rehash(user.password_hash):
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
             flash('Login efetuado com sucesso!', 'success')
@@ -116,17 +215,17 @@ def login():
             flash('Login falhou. Por favor verifique email e senha.', 'danger')
     return render_template('login.html', title='Login', form=form)
 
-@app.route("/logout")
+@route("/logout")
 def logout():
     logout_user()
     return redirect(url_for('home'))
 
-@app.route("/dashboard")
+@route("/dashboard")
 @login_required
 def dashboard():
     return render_template('dashboard.html', title='Dashboard')
 
-@app.route("/profile", methods=['GET', 'POST'])
+@route("/profile", methods=['GET', 'POST'])
 @login_required
 def profile():
     form = ProfileForm()
@@ -136,7 +235,7 @@ def profile():
         if current_user.name:
             form.name.data = current_user.name
         if current_user.cpf:
-            form.cpf.data = current_user.cpf
+            form.cpf.data = format_cpf(current_user.cpf)
         if current_user.birth_date:
             form.birth_date.data = current_user.birth_date
         if current_user.address:
@@ -146,31 +245,22 @@ def profile():
                 form.interests.data = current_user.profile.interests
             if current_user.profile.fan_story:
                 form.fan_story.data = current_user.profile.fan_story
-            if current_user.profile.favorite_games:
-                favorite_games = current_user.profile.favorite_games.split(',')
-                form.favorite_games.data = [game.strip() for game in favorite_games if game.strip()]
+            if current_user.profile.favorite_game_list:
+                form.favorite_games.data = current_user.profile.favorite_game_list
             if current_user.profile.other_games:
                 form.other_games.data = current_user.profile.other_games
-            if current_user.profile.favorite_teams:
-                favorite_teams = current_user.profile.favorite_teams.split(',')
-                form.favorite_teams.data = [team.strip() for team in favorite_teams if team.strip()]
+            if current_user.profile.favorite_team_list:
+                form.favorite_teams.data = current_user.profile.favorite_team_list
             if current_user.profile.other_teams:
                 form.other_teams.data = current_user.profile.other_teams
-            if current_user.profile.events_attended:
-                events_attended = current_user.profile.events_attended.split(',')
-                form.events_attended.data = [event.strip() for event in events_attended if event.strip()]
+            if current_user.profile.events_attended_list:
+                form.events_attended.data = current_user.profile.events_attended_list
             if current_user.profile.other_events:
                 form.other_events.data = current_user.profile.other_events
             if current_user.profile.purchases:
                 form.purchases.data = current_user.profile.purchases
     
     if form.validate_on_submit():
-        # Atualizar dados do usuário
-        current_user.name = form.name.data
-        current_user.cpf = form.cpf.data
-        current_user.birth_date = form.birth_date.data
-        current_user.address = form.address.data
-        
         # Verificar se o perfil já existe ou criar um novo
         if not current_user.profile:
             profile = Profile(user_id=current_user.id)
@@ -181,56 +271,80 @@ def profile():
         # Atualizar dados do perfil
         profile.interests = form.interests.data
         profile.fan_story = form.fan_story.data
-        profile.favorite_games = ','.join(form.favorite_games.data) if form.favorite_games.data else ''
+        profile.favorite_game_list = form.favorite_games.data
         profile.other_games = form.other_games.data
-        profile.favorite_teams = ','.join(form.favorite_teams.data) if form.favorite_teams.data else ''
+        profile.favorite_team_list = form.favorite_teams.data
         profile.other_teams = form.other_teams.data
-        profile.events_attended = ','.join(form.events_attended.data) if form.events_attended.data else ''
+        profile.events_attended_list = form.events_attended.data
         profile.other_events = form.other_events.data
         profile.purchases = form.purchases.data
         
         # Salvar foto de perfil, se enviada
+        new_picture = None
         if form.profile_picture.data:
-            picture_file = save_picture(form.profile_picture.data, 'profiles')
-            profile.profile_picture = picture_file
+            # O original (com EXIF) fica privado; só as variantes geradas pela tarefa são publicadas
+            picture_file = save_picture(form.profile_picture.data, PROFILE_ORIGINALS_FOLDER)
+            if picture_file != profile.profile_picture:
+                profile.profile_picture = picture_file
+                profile.picture_variants = None
+                new_picture = picture_file
         
-        db.session.commit()
+        # Atualizar dados do usuário (por último: um CPF repetido só falha no commit)
+        current_user.name = form.name.data
+        # CPF guardado na forma canônica (só os 11 dígitos), a chave única indexada
+        current_user.cpf = normalize_cpf(form.cpf.data)
+        current_user.birth_date = form.birth_date.data
+        current_user.address = form.address.data
+        
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('Este CPF já está cadastrado em outra conta.', 'danger')
+            return render_template('profile.html', title='Perfil', form=form,
+                                   picture_url=profile_picture_url(current_user.profile))
+        
+        # Miniaturas (64/256/512 px, WebP e JPEG, sem EXIF) geradas em segundo plano
+        if new_picture:
+            job_queue.enqueue('profile_picture', {'profile_id': profile.id, 'filename': new_picture},
+                              user_id=current_user.id)
         flash('Seu perfil foi atualizado com sucesso!', 'success')
         return redirect(url_for('dashboard'))
     
-    return render_template('profile.html', title='Perfil', form=form)
+    return render_template('profile.html', title='Perfil', form=form,
+                           picture_url=profile_picture_url(current_user.profile))
 
-@app.route("/documents", methods=['GET', 'POST'])
+@route("/documents", methods=['GET', 'POST'])
 @login_required
 def documents():
     form = DocumentUploadForm()
     if form.validate_on_submit():
-        # Salvar o documento
-        document_file = save_picture(form.document.data, 'documents')
+        # Salvar o documento (arquivos repetidos reaproveitam o já armazenado)
+        stored = acquire_blob(store_document(form.document.data))
         document = Document(
             user_id=current_user.id,
-            filename=document_file,
+            filename=stored.filename,
+            digest=stored.digest,
             doc_type=form.doc_type.data
         )
+        # Hash perceptual para achar a mesma foto enviada por outras contas (ver phash.py)
+        hash_document(document)
         db.session.add(document)
-        db.session.commit()
-        
-        # Verificar documento com IA
-        document_path = os.path.join(app.config['UPLOAD_FOLDER'], 'documents', document_file)
-        verification_result = DocumentAIService.verify_identity_document(
-            document_path, 
-            expected_name=current_user.name, 
-            expected_cpf=current_user.cpf
-        )
         
-        # Atualizar status de verificação do documento
-        if verification_result['is_valid']:
-            document.verified = True
-            document.verification_date = datetime.utcnow()
+        # Reenvio de um documento já aprovado com os mesmos dados: reaproveitar o resultado
+        verification_result = cached_verification(stored.digest, current_user.name, current_user.cpf)
+        if verification_result is not None:
+            apply_verification(document, verification_result)
+            db.session.flush()
+            flag_duplicates(document)
             db.session.commit()
             flash('Documento enviado e verificado com sucesso!', 'success')
-        else:
-            flash('Documento enviado, mas não foi possível verificar automaticamente. Nossa equipe fará uma verificação manual.', 'warning')
+            return redirect(url_for('documents'))
+        db.session.commit()
+        
+        # Verificar documento com IA em segundo plano
+        enqueue_document_verification(stored, document_id=document.id)
+        flash('Documento enviado com sucesso! A verificação automática está em andamento.', 'success')
         
         return redirect(url_for('documents'))
     
@@ -239,7 +353,19 @@ def documents():
     
     return render_template('documents.html', title='Documentos', form=form, documents=user_documents)
 
-@app.route("/social", methods=['GET', 'POST'])
+@route("/documents/<int:document_id>/delete", methods=['POST'])
+@login_required
+def delete_document(document_id):
+    document = db.session.get(Document, document_id)
+    if document is None or document.user_id != current_user.id:
+        abort(404)
+    # O arquivo é compartilhado por conteúdo: só sai do disco quando nenhum Document o usa (document_store.py)
+    db.session.delete(document)
+    db.session.commit()
+    flash('Documento removido.', 'success')
+    return redirect(url_for('documents'))
+
+@route("/social", methods=['GET', 'POST'])
 @login_required
 def social():
     form = SocialAccountForm()
@@ -266,8 +392,8 @@ def social():
             db.session.add(account)
             db.session.commit()
             
-            # Analisar perfil social com IA
-            analysis = SocialMediaAnalyzer.analyze_social_profile(
+            # Analisar perfil social com IA (usa o cache quando a análise ainda é recente)
+            analysis = social_cache.get(
                 form.platform.data,
                 form.username.data
             )
@@ -286,9 +412,10 @@ def social():
     
     return render_template('social.html', title='Redes Sociais', form=form, accounts=social_accounts)
 
-@app.route("/esports", methods=['GET', 'POST'])
+@route("/esports", methods=['GET', 'POST'])
 @login_required
 def esports():
+    from ai_services import EsportsProfileValidator
     form = EsportsProfileForm()
     if form.validate_on_submit():
         # Validar URL do perfil
@@ -326,7 +453,7 @@ def esports():
     
     return render_template('esports.html', title='Perfis de E-Sports', form=form, profiles=esports_profiles)
 
-@app.route("/api/verify_document", methods=['POST'])
+@route("/api/verify_document", methods=['POST'])
 @login_required
 def api_verify_document():
     if 'document' not in request.files:
@@ -336,30 +463,67 @@ def api_verify_document():
     if file.filename == '':
         return jsonify({'success': False, 'error': 'Nenhum arquivo selecionado'})
     
-    document_file = save_picture(file, 'documents')
-    document_path = os.path.join(app.config['UPLOAD_FOLDER'], 'documents', document_file)
+    doc_type = request.form.get('doc_type', 'id')
+    if doc_type not in dict(DocumentUploadForm.doc_type.kwargs['choices']):
+        return jsonify({'success': False, 'error': 'Tipo de documento inválido'}), 400
     
-    # Verificar documento com IA
-    verification_result = DocumentAIService.verify_identity_document(
-        document_path, 
-        expected_name=current_user.name, 
-        expected_cpf=current_user.cpf
+    stored = acquire_blob(store_document(file))
+    document = Document(
+        user_id=current_user.id,
+        filename=stored.filename,
+        digest=stored.digest,
+        doc_type=doc_type
     )
+    hash_document(document)
+    db.session.add(document)
+    
+    # Reenvio de um documento já aprovado com os mesmos dados: responder na hora
+    verification_result = cached_verification(stored.digest, current_user.name, current_user.cpf)
+    if verification_result is not None:
+        apply_verification(document, verification_result)
+        db.session.flush()
+        possible_duplicates = flag_duplicates(document)
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'cached': True,
+            'document_id': document.id,
+            'verification': dict(verification_result, possible_duplicates=possible_duplicates)
+        })
+    db.session.commit()
+    
+    # Verificar documento com IA em segundo plano
+    job = enqueue_document_verification(stored, document_id=document.id)
     
     return jsonify({
         'success': True,
-        'verification': verification_result
+        'document_id': document.id,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('api_job_status', job_id=job.id)
+    }), 202
+
+@route("/api/jobs/<int:job_id>")
+@login_required
+def api_job_status(job_id):
+    job = db.session.get(BackgroundJob, job_id)
+    if job is None or job.user_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job_to_dict(job)
     })
 
-@app.route("/api/analyze_social", methods=['POST'])
+@route("/api/analyze_social", methods=['POST'])
 @login_required
 def api_analyze_social():
     data = request.json
     if not data or 'platform' not in data or 'username' not in data:
         return jsonify({'success': False, 'error': 'Dados incompletos'})
     
-    # Analisar perfil social com IA
-    analysis = SocialMediaAnalyzer.analyze_social_profile(
+    # Analisar perfil social com IA (usa o cache quando a análise ainda é recente)
+    analysis = social_cache.get(
         data['platform'],
         data['username']
     )
@@ -369,9 +533,29 @@ def api_analyze_social():
         'analysis': analysis
     })
 
-@app.route("/api/validate_esports_profile", methods=['POST'])
+@route("/api/analyze_social/batch", methods=['POST'])
+@login_required
+def api_analyze_social_batch():
+    items, error = parse_batch_items(request.json, ('platform', 'username'), current_app.config['BATCH_MAX_ITEMS'])
+    if error:
+        return jsonify({'success': False, 'error': error})
+    
+    # Resultados transmitidos em NDJSON conforme cada análise termina
+    results = batch_runner.run(items, analyze_social_item)
+    return Response(stream_with_context(to_ndjson(results, items)), mimetype='application/x-ndjson')
+
+@route("/api/social_cache/stats")
+@login_required
+def api_social_cache_stats():
+    return jsonify({
+        'success': True,
+        'stats': social_cache.stats()
+    })
+
+@route("/api/validate_esports_profile", methods=['POST'])
 @login_required
 def api_validate_esports_profile():
+    from ai_services import EsportsProfileValidator
     data = request.json
     if not data or 'platform' not in data or 'url' not in data:
         return jsonify({'success': False, 'error': 'Dados incompletos'})
@@ -392,7 +576,126 @@ def api_validate_esports_profile():
         'analysis': analysis
     })
 
-@app.route("/demo")
+@route("/api/validate_esports_profile/batch", methods=['POST'])
+@login_required
+def api_validate_esports_profile_batch():
+    items, error = parse_batch_items(request.json, ('platform', 'url'), current_app.config['BATCH_MAX_ITEMS'])
+    if error:
+        return jsonify({'success': False, 'error': error})
+    
+    # Resultados transmitidos em NDJSON conforme cada análise termina
+    results = batch_runner.run(items, analyze_esports_item)
+    return Response(stream_with_context(to_ndjson(results, items)), mimetype='application/x-ndjson')
+
+@route("/api/segments/query", methods=['POST'])
+@admin_required
+def api_segments_query():
+    data = request.json
+    if not data or 'segment' not in data:
+        return jsonify({'success': False, 'error': 'Dados incompletos'})
+    
+    start = time.perf_counter()
+    try:
+        members = segment_index.query(data['segment'])
+    except SegmentError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    response = {
+        'success': True,
+        'count': len(members),
+        'elapsed_us': round((time.perf_counter() - start) * 1e6)
+    }
+    if data.get('members'):
+        try:
+            offset = max(int(data.get('offset', 0)), 0)
+            limit = min(max(int(data.get('limit', 100)), 1), 10000)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'offset e limit devem ser inteiros'}), 400
+        response['members'] = members.slice(offset, limit)
+    return jsonify(response)
+
+@route("/api/segments")
+@admin_required
+def api_segments():
+    return jsonify({
+        'success': True,
+        'counts': segment_index.counts()
+    })
+
+@route("/api/admin/stats")
+@admin_required
+def api_admin_stats():
+    # Lê só a tabela fan_stat: o custo não cresce com a quantidade de fãs
+    return jsonify({
+        'success': True,
+        'stats': fan_stats.summary()
+    })
+
+@route("/api/admin/search")
+@admin_required
+def api_admin_search():
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    try:
+        found = fan_search.search(request.args.get('q', ''), limit=limit, offset=offset)
+    except SearchError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify(dict({'success': True}, **found))
+
+@route("/api/leaderboard")
+@login_required
+def api_leaderboard():
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    return jsonify({
+        'success': True,
+        'leaderboard': [score_to_dict(user) for user in fan_scorer.leaderboard(limit, offset)],
+        'me': score_to_dict(current_user)
+    })
+
+@route("/api/admin/fans/by_cpf", methods=['POST'])
+@admin_required
+def api_fans_by_cpf():
+    data = request.json
+    if not data or not isinstance(data.get('cpfs'), list):
+        return jsonify({'success': False, 'error': 'Informe a lista cpfs'}), 400
+    if len(data['cpfs']) > 10000:
+        return jsonify({'success': False, 'error': 'No máximo 10000 CPFs por consulta'}), 400
+    
+    # Valida todos de uma vez e busca os válidos numa única consulta pelo índice de User.cpf
+    canonical, valid = validate_cpf_batch(data['cpfs'])
+    lookup = list({value for value, ok in zip(canonical, valid) if ok})
+    users = {user.cpf: user for user in User.query.filter(User.cpf.in_(lookup))} if lookup else {}
+    results = []
+    for original, value, ok in zip(data['cpfs'], canonical, valid):
+        user = users.get(value) if ok else None
+        results.append({
+            'cpf': original,
+            'canonical': value if ok else None,
+            'valid': bool(ok),
+            'user_id': user.id if user else None,
+            'username': user.username if user else None
+        })
+    return jsonify({'success': True, 'results': results})
+
+@route("/api/export/fans")
+@admin_required
+def api_export_fans():
+    try:
+        fmt = request.args.get('format', 'ndjson')
+        _, mimetype, extension = get_format(fmt)
+        since = parse_since(request.args.get('since'))
+    except ExportError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    # O início da exportação é a marca d'água para a próxima exportação incremental (?since=)
+    watermark = datetime.utcnow()
+    response = Response(stream_with_context(export_fans(fmt, since)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=fans-{watermark:%Y%m%dT%H%M%S}.{extension}'
+    response.headers['X-Export-Watermark'] = watermark.isoformat()
+    return response
+
+@route("/demo")
 def demo():
     """Rota especial para modo demonstração, cria um usuário de teste se não existir"""
     demo_email = "demo@furia.com"
@@ -412,11 +715,11 @@ def demo():
         profile = Profile(
             user_id=demo_user.id,
             interests="Counter-Strike 2, Valorant, e-sports competitivo",
-            fan_story="Sou fã da FURIA desde sua fundação em 2017, acompanhando principalmente o time de CS.",
-            favorite_games="cs2,valorant",
-            favorite_teams="furia_cs2,furia_valorant",
-            events_attended="major_copenhagen_2024"
+            fan_story="Sou fã da FURIA desde sua fundação em 2017, acompanhando principalmente o time de CS."
         )
+        profile.favorite_game_list = ['cs2', 'valorant']
+        profile.favorite_team_list = ['furia_cs2', 'furia_valorant']
+        profile.events_attended_list = ['major_copenhagen_2024']
         db.session.add(profile)
         
         # Adicionar uma conta social de exemplo
@@ -435,8 +738,179 @@ def demo():
     login_user(demo_user)
     return redirect(url_for('dashboard'))
 
+def load_config(app):
+    """Configuração a partir das variáveis de ambiente"""
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'desenvolvimento-temporario')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI', 'sqlite:///knowyourfan.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max upload
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    app.config['JOB_BACKOFF_BASE'] = float(os.environ.get('JOB_BACKOFF_BASE', 2.0))
+    app.config['JOB_AUTOSTART'] = os.environ.get('JOB_AUTOSTART', '1') == '1'
+    app.config['ESPORTS_LIVE_FETCH'] = os.environ.get('ESPORTS_LIVE_FETCH', '0') == '1'
+    app.config['FETCH_CACHE_DIR'] = os.path.join(app.instance_path, 'http_cache')
+    app.config['FETCH_POOL_SIZE'] = int(os.environ.get('FETCH_POOL_SIZE', 4))
+    app.config['ADMIN_EMAILS'] = [normalize_email(email) for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()]
+    app.config['SEGMENT_SNAPSHOT_PATH'] = os.environ.get('SEGMENT_SNAPSHOT_PATH')
+    app.config['IDENTITY_CACHE_TTL'] = float(os.environ.get('IDENTITY_CACHE_TTL', 5.0))
+    app.config['SQL_QUERY_COUNT_HEADER'] = os.environ.get('SQL_QUERY_COUNT_HEADER', '0') == '1'
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_POOL_SIZE'] = int(os.environ.get('PASSWORD_HASH_POOL_SIZE', 2))
+    app.config['IMAGE_QUALITY'] = int(os.environ.get('IMAGE_QUALITY', 80))
+    app.config['IMAGE_VARIANT_FORMATS'] = os.environ.get('IMAGE_VARIANT_FORMATS', 'webp,jpeg').split(',')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['METRICS_SERVER_TIMING'] = os.environ.get('METRICS_SERVER_TIMING', '0') == '1'
+    if os.environ.get('PROFILE_SLOW_REQUESTS'):
+        app.config['PROFILE_SLOW_REQUESTS'] = float(os.environ['PROFILE_SLOW_REQUESTS'])
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+    # "host=req/s:rajada,..." (ver fetcher.parse_rate_limits); sem a variável valem os limites do fetcher.py
+    app.config['FETCH_RATE_LIMITS'] = os.environ.get('FETCH_RATE_LIMITS')
+
+def create_app(config=None):
+    """Cria e configura a aplicação (sem acessar o banco de dados)"""
+    app = Flask(__name__, instance_relative_config=True)
+    load_config(app)
+    if config:
+        app.config.update(config)
+
+    # Inicializar SQLAlchemy com o app
+    db.init_app(app)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(export_fans_command)
+    app.cli.add_command(import_fans_command)
+
+    # Hash de senhas em um pool de processos
+    password_hasher.init_app(app)
+
+    # Disponibilidade de username/e-mail para o cadastro
+    availability.init_app(app)
+
+    # Fila de tarefas em segundo plano (verificação de documentos)
+    job_queue.init_app(app)
+
+    # Armazenamento dos uploads (disco local por padrão)
+    storage.init_app(app)
+
+    # Busca de documentos duplicados pelo hash perceptual
+    document_hashes.init_app(app)
+
+    # Arquivos estáticos e uploads servidos pelo WhiteNoise (cache imutável, .br/.gz)
+    static_assets.init_app(app)
+
+    # Cache das análises de perfis sociais
+    social_cache.init_app(app)
+
+    # Execução em lote das APIs de análise
+    batch_runner.init_app(app)
+
+    # Índice de bitmaps para segmentação do público
+    segment_index.init_app(app)
+
+    # Pontuação de engajamento dos fãs (flask score-fans)
+    fan_scorer.init_app(app)
+
+    # Contagens agregadas da base de fãs (tabela fan_stat, flask rebuild-fan-stats)
+    fan_stats.init_app(app)
+
+    # Busca textual nas histórias e interesses dos fãs (flask rebuild-search-index)
+    fan_search.init_app(app)
+
+    # Usuário autenticado com carregamento antecipado e cache curto
+    identity_cache.init_app(app)
+
+    # Contagem de comandos SQL por requisição (cabeçalho X-SQL-Queries)
+    query_counter.init_app(app)
+
+    # Histogramas por endpoint, SQL e spans, expostos em /metrics (formato Prometheus)
+    metrics.init_app(app)
+
+    # Coleta real das páginas de perfis de e-sports (desabilitada por padrão)
+    if app.config['ESPORTS_LIVE_FETCH']:
+        from ai_services import EsportsProfileValidator
+        from fetcher import HttpFetcher, parse_rate_limits
+        EsportsProfileValidator.fetcher = HttpFetcher(
+            cache_dir=app.config['FETCH_CACHE_DIR'],
+            rate_limits=parse_rate_limits(app.config['FETCH_RATE_LIMITS']),
+            pool_size=app.config['FETCH_POOL_SIZE']
+        )
+
+    # Fotos de perfil nos templates pela variante do tamanho exibido: profile_picture_url(profile, 64)
+    app.jinja_env.globals['profile_picture_url'] = profile_picture_url
+
+    # Inicializar Flask-Login
+    login_manager.init_app(app)
+
+    for rule, view_func, options in ROUTES:
+        app.add_url_rule(rule, view_func=view_func, **options)
+
+    _apps.add(app)
+    return app
+
+# Aplicações criadas neste processo, para o gancho de fork abaixo
+_apps = weakref.WeakSet()
+
+def _dispose_engines():
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+# Workers criados por fork (gunicorn --preload) não reaproveitam conexões do processo pai.
+# Registrado uma vez por processo, e não a cada create_app()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_engines)
+
+def init_db():
+    """Cria as pastas de upload e o esquema do banco; roda uma vez por deploy"""
+    for folder in ('documents', 'profiles', PROFILE_ORIGINALS_FOLDER):
+        os.makedirs(os.path.join(current_app.config['UPLOAD_FOLDER'], folder), exist_ok=True)
+        if folder in current_app.config['STORAGE_PUBLIC_FOLDERS']:
+            os.makedirs(os.path.join(current_app.config['STORAGE_PUBLIC_DIR'], folder), exist_ok=True)
+        elif storage.unpublish(folder):
+            # Cópias públicas deixadas por versões que publicavam também os documentos
+            click.echo(f"Removidas as cópias públicas de uploads/{folder}")
+    db.create_all()
+    run_migrations(db.engine, echo=click.echo)
+    moved = unpublish_profile_originals()
+    if moved:
+        click.echo(f"Movidas {moved} fotos de perfil originais para uploads/{PROFILE_ORIGINALS_FOLDER}")
+
+def unpublish_profile_originals():
+    """
+    Move para a pasta privada as fotos originais que versões anteriores
+    publicavam em ``profiles`` e agenda as variantes que faltarem. Retorna quantas
+    """
+    moved = 0
+    for profile in Profile.query.filter(Profile.profile_picture.isnot(None)):
+        filename = profile.profile_picture
+        if storage.exists('profiles', filename):
+            if not storage.exists(PROFILE_ORIGINALS_FOLDER, filename):
+                with storage.open('profiles', filename) as f:
+                    storage.save(f, PROFILE_ORIGINALS_FOLDER, filename)
+            storage.delete('profiles', filename)
+            moved += 1
+            if not profile.picture_variants:
+                job_queue.enqueue('profile_picture', {'profile_id': profile.id, 'filename': filename},
+                                  user_id=profile.user_id)
+    return moved
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create upload folders, tables and apply pending migrations."""
+    init_db()
+    click.echo("Banco de dados inicializado com sucesso!")
+
+app = create_app()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     host = os.environ.get("HOST", "0.0.0.0")
     debug = os.environ.get("FLASK_DEBUG", "0") == "1"
+    # Servidor de desenvolvimento: prepara o banco antes de subir
+    with app.app_context():
+        init_db()
     app.run(host=host, port=port, debug=debug)
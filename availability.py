@@ -0,0 +1,192 @@
+"""
+Disponibilidade de nomes de usuário e e-mails para o cadastro.
+
+Um filtro de Bloom em memória com todos os nomes de usuário e e-mails
+cadastrados responde "disponível" sem consultar o banco na grande maioria
+das verificações (um filtro de Bloom nunca dá falso negativo). Quando o
+filtro indica que o valor pode existir, uma única consulta (username OR
+email) confirma.
+
+O filtro é construído a partir do banco no primeiro uso, recebe os usuários
+inseridos por este processo no commit e, a cada ``AVAILABILITY_SYNC_INTERVAL``
+segundos, incorpora os usuários inseridos por outros processos (ids acima do
+maior id já visto).
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, func, or_, select
+from sqlalchemy.orm import Session
+
+from models import db, User
+
+
+def normalize(value):
+    return value.strip().lower()
+
+
+class BloomFilter:
+    """Filtro de Bloom sobre um bytearray, com ``k`` posições por item (double hashing)"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] >> (position & 7) & 1 for position in self._positions(key))
+
+    def __len__(self):
+        return self.count
+
+
+class AvailabilityIndex:
+    """Verificação de disponibilidade de username/e-mail com filtro de Bloom"""
+
+    def __init__(self, app=None):
+        self.usernames = None
+        self.emails = None
+        self.last_user_id = 0
+        self.synced_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'checks': 0, 'filter_answers': 0, 'confirm_queries': 0, 'false_positives': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AVAILABILITY_BLOOM_CAPACITY', 100000)
+        app.config.setdefault('AVAILABILITY_BLOOM_ERROR_RATE', 0.01)
+        app.config.setdefault('AVAILABILITY_SYNC_INTERVAL', 5.0)
+        app.extensions['availability'] = self
+        if not event.contains(Session, 'after_flush', _collect_new_users):
+            event.listen(Session, 'after_flush', _collect_new_users)
+            event.listen(Session, 'after_commit', _add_new_users)
+            event.listen(Session, 'after_rollback', _discard_new_users)
+
+    @property
+    def ready(self):
+        return self.usernames is not None
+
+    def build(self):
+        """Reconstrói os filtros com todos os usuários do banco"""
+        with db.engine.connect() as conn:
+            total = conn.execute(select(func.count(User.id))).scalar()
+            capacity = max(current_app.config['AVAILABILITY_BLOOM_CAPACITY'], total * 2)
+            error_rate = current_app.config['AVAILABILITY_BLOOM_ERROR_RATE']
+            usernames = BloomFilter(capacity, error_rate)
+            emails = BloomFilter(capacity, error_rate)
+            last_user_id = 0
+            for user_id, username, email in conn.execute(
+                    select(User.id, User.username, User.email)).yield_per(10000):
+                usernames.add(normalize(username))
+                emails.add(normalize(email))
+                last_user_id = max(last_user_id, user_id)
+        with self._lock:
+            self.usernames = usernames
+            self.emails = emails
+            self.last_user_id = last_user_id
+            self.synced_at = time.monotonic()
+
+    def ensure_ready(self):
+        if not self.ready:
+            self.build()
+        elif time.monotonic() - self.synced_at >= current_app.config['AVAILABILITY_SYNC_INTERVAL']:
+            self.sync()
+
+    def sync(self):
+        """Incorpora usuários inseridos desde a última sincronização (inclusive por outros processos)"""
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                select(User.id, User.username, User.email).where(User.id > self.last_user_id)
+            ).all()
+        self.add_users(rows)
+        self.synced_at = time.monotonic()
+
+    def add_users(self, rows):
+        if not self.ready:
+            return
+        with self._lock:
+            for user_id, username, email in rows:
+                self.usernames.add(normalize(username))
+                self.emails.add(normalize(email))
+                self.last_user_id = max(self.last_user_id, user_id)
+            full = len(self.usernames) > self.usernames.capacity
+        if full:
+            # A taxa de falsos positivos sobe além da configurada: reconstrói com o dobro
+            self.build()
+
+    def check(self, username=None, email=None):
+        """
+        Retorna ``{'username': bool, 'email': bool}`` (True = disponível) para
+        os campos informados. Faz no máximo uma consulta ao banco.
+        """
+        self.ensure_ready()
+        self._stats['checks'] += 1
+        result = {}
+        suspects = []
+        if username is not None:
+            result['username'] = normalize(username) not in self.usernames
+            if not result['username']:
+                suspects.append(User.username == username)
+        if email is not None:
+            result['email'] = normalize(email) not in self.emails
+            if not result['email']:
+                suspects.append(User.email == email)
+        if not suspects:
+            self._stats['filter_answers'] += 1
+            return result
+
+        self._stats['confirm_queries'] += 1
+        with db.engine.connect() as conn:
+            rows = conn.execute(select(User.username, User.email).where(or_(*suspects)).limit(2)).all()
+        if username is not None and not result['username']:
+            result['username'] = not any(row.username == username for row in rows)
+        if email is not None and not result['email']:
+            result['email'] = not any(row.email == email for row in rows)
+        if all(result.values()):
+            self._stats['false_positives'] += 1
+        return result
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['users'] = len(self.usernames) if self.ready else 0
+        return stats
+
+
+availability = AvailabilityIndex()
+
+
+def _collect_new_users(session, flush_context):
+    new_users = [obj for obj in session.new if isinstance(obj, User)]
+    if new_users:
+        session.info.setdefault('availability_users', []).extend(
+            (user.id, user.username, user.email) for user in new_users
+        )
+
+
+def _add_new_users(session):
+    rows = session.info.pop('availability_users', None)
+    if rows:
+        availability.add_users(rows)
+
+
+def _discard_new_users(session):
+    session.info.pop('availability_users', None)
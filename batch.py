@@ -0,0 +1,118 @@
+"""
+Execução em lote das análises sociais e de e-sports.
+
+Os itens são distribuídos por um pool de threads limitado, respeitando um
+limite de chamadas simultâneas por plataforma, e os resultados são
+devolvidos à medida que ficam prontos (para serem transmitidos como NDJSON).
+"""
+
+import json
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from flask import current_app
+
+from social_cache import social_cache
+
+DEFAULT_PLATFORM_CONCURRENCY = {
+    'default': 4,
+}
+
+
+class BatchRunner:
+    """Executa ``func(item)`` para cada item com concorrência limitada por plataforma"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BATCH_MAX_ITEMS', 1000)
+        app.config.setdefault('BATCH_MAX_WORKERS', 16)
+        app.config.setdefault('BATCH_PLATFORM_CONCURRENCY', DEFAULT_PLATFORM_CONCURRENCY)
+        app.extensions['batch_runner'] = self
+
+    def run(self, items, func):
+        """
+        Gera ``(índice, resultado)`` na ordem em que as tarefas terminam.
+
+        Cada chamada roda dentro de um contexto da aplicação; exceções viram
+        ``{'success': False, 'error': ...}`` em vez de interromper o lote.
+        """
+        # As threads do pool recebem a aplicação da requisição que iniciou o lote
+        app = current_app._get_current_object()
+        limits = app.config['BATCH_PLATFORM_CONCURRENCY']
+        pending = defaultdict(deque)
+        for index, item in enumerate(items):
+            pending[item.get('platform')].append((index, item))
+        in_flight = defaultdict(int)
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=app.config['BATCH_MAX_WORKERS'],
+                                thread_name_prefix='batch') as executor:
+            def submit_ready():
+                for platform, queue in pending.items():
+                    limit = limits.get(platform, limits.get('default', 4))
+                    while queue and in_flight[platform] < limit:
+                        index, item = queue.popleft()
+                        in_flight[platform] += 1
+                        futures[executor.submit(self._call, app, func, item)] = (index, platform)
+
+            submit_ready()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, platform = futures.pop(future)
+                    in_flight[platform] -= 1
+                    yield index, future.result()
+                submit_ready()
+
+    def _call(self, app, func, item):
+        try:
+            with app.app_context():
+                return func(item)
+        except Exception as e:
+            app.logger.exception('Erro ao processar item do lote')
+            return {'success': False, 'error': str(e)}
+
+
+batch_runner = BatchRunner()
+
+
+def parse_batch_items(data, required_fields, max_items):
+    """Valida o corpo da requisição; retorna (itens, mensagem de erro)"""
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return None, 'Envie uma lista de itens em "items"'
+    if len(items) > max_items:
+        return None, f'No máximo {max_items} itens por lote'
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return None, f'Item {index}: esperado um objeto com os campos {", ".join(required_fields)}'
+        # Os campos viram chaves de cache e partes de URL: só texto não vazio
+        invalid = [field for field in required_fields
+                   if not isinstance(item.get(field), str) or not item[field].strip()]
+        if invalid:
+            return None, f'Item {index}: {", ".join(invalid)} deve ser texto não vazio'
+    return items, None
+
+
+def to_ndjson(results, items):
+    """Converte os resultados do ``BatchRunner`` em linhas NDJSON"""
+    for index, result in results:
+        line = {'index': index, 'item': items[index]}
+        line.update(result)
+        yield json.dumps(line) + '\n'
+
+
+def analyze_social_item(item):
+    analysis = social_cache.get(item['platform'], item['username'])
+    return {'success': analysis.get('success', False), 'analysis': analysis}
+
+
+def analyze_esports_item(item):
+    from ai_services import EsportsProfileValidator
+    if not EsportsProfileValidator.validate_profile_url(item['platform'], item['url']):
+        return {'success': False, 'error': 'URL inválida para a plataforma'}
+    analysis = EsportsProfileValidator.analyze_esports_profile(item['platform'], item['url'])
+    return {'success': analysis.get('success', False), 'analysis': analysis}
@@ -0,0 +1 @@
+"""Benchmarks de desempenho do Know Your Fan (execute com ``python -m benchmarks.<nome>``)."""
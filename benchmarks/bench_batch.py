@@ -0,0 +1,63 @@
+"""
+Compara chamadas sequenciais a /api/analyze_social com o endpoint em lote
+/api/analyze_social/batch, usando um backend local com latência simulada.
+
+Uso:
+    python -m benchmarks.bench_batch --items 200 --latency 0.05
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import bench_app, print_table, write_results
+from benchmarks.stubs import StubSocialMediaAnalyzer
+
+PLATFORMS = ('twitter', 'instagram', 'facebook', 'twitch')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='Latência simulada por chamada (s)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Limite por plataforma')
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-batch-')
+    os.environ.setdefault('DATABASE_URI', f'sqlite:///{os.path.join(workdir, "bench.db")}')
+
+    from app import social_cache
+    app = bench_app()
+    social_cache.analyzer = StubSocialMediaAnalyzer(args.latency)
+    app.config['BATCH_PLATFORM_CONCURRENCY'] = {'default': args.concurrency}
+    client = app.test_client()
+    client.get('/demo')
+
+    def items(prefix):
+        return [{'platform': PLATFORMS[i % len(PLATFORMS)], 'username': f'{prefix}_{i}'}
+                for i in range(args.items)]
+
+    start = time.perf_counter()
+    for item in items('seq'):
+        client.post('/api/analyze_social', json=item)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = client.post('/api/analyze_social/batch', json={'items': items('batch')})
+    lines = [json.loads(line) for line in response.iter_encoded() if line.strip()]
+    batched = time.perf_counter() - start
+    assert len(lines) == args.items
+
+    results = [
+        {'mode': 'sequential', 'items': args.items, 'seconds': sequential, 'items_per_sec': args.items / sequential},
+        {'mode': 'batch', 'items': args.items, 'seconds': batched, 'items_per_sec': args.items / batched},
+    ]
+    print_table(results, ['mode', 'items', 'seconds', 'items_per_sec'])
+    write_results('batch', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
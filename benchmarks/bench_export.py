@@ -0,0 +1,64 @@
+"""
+Mede a exportação de fãs (flask export-fans) para bases de tamanhos
+diferentes: vazão e pico de memória (tracemalloc). O pico deve ficar estável
+com o aumento do número de fãs, já que só um bloco fica em memória.
+
+Uso:
+    python -m benchmarks.bench_export --sizes 5000,20000,50000 --format ndjson
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from flask import Flask
+
+from benchmarks.common import print_table, write_results
+from benchmarks.datagen import seed
+from migrations import run_migrations
+from models import db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='5000,20000,50000')
+    parser.add_argument('--format', default='ndjson')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    from export import export_fans
+
+    results = []
+    for size in [int(value) for value in args.sizes.split(',')]:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-export-'), 'export.db')
+        db.init_app(app)
+        with app.app_context():
+            run_migrations(db.engine, echo=lambda message: None)
+            seed(size)
+
+            stats = {}
+            written = 0
+            tracemalloc.start()
+            start = time.perf_counter()
+            for data in export_fans(args.format, chunk_size=args.chunk_size, stats=stats):
+                written += len(data)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            db.engine.dispose()
+
+        results.append({'fans': stats['rows'], 'format': args.format, 'seconds': elapsed,
+                        'rows_per_sec': stats['rows'] / elapsed, 'output_mb': written / 2 ** 20,
+                        'peak_kib': peak / 1024})
+
+    print_table(results, ['fans', 'format', 'seconds', 'rows_per_sec', 'output_mb', 'peak_kib'])
+    write_results('export', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Mede a geração das variantes das fotos de perfil (images.py): imagens por
+segundo em um processo e por núcleo com um pool de processos, comparando com a
+decodificação completa (sem o modo draft). ``decoded_mpix`` é o tamanho da
+imagem decodificada, que determina a memória usada por foto.
+
+As fotos de teste são JPEGs sintéticos do tamanho de uma foto de celular, com
+EXIF (orientação e GPS), gerados em memória.
+
+Uso:
+    python -m benchmarks.bench_images --count 40 --size 4032x3024 --workers 1,2,4
+"""
+
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+from benchmarks.common import print_table, write_results
+from images import DEFAULT_FORMATS, DEFAULT_QUALITY, DEFAULT_SIZES, encode, make_variants
+
+
+def synthetic_photo(width, height, seed=0):
+    """JPEG com gradiente e ruído (comprime como uma foto) e EXIF de orientação/GPS"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40 + seed % 20)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: girar 90°
+    exif[0x0110] = 'Celular de teste'  # Model
+    exif[0x8825] = {1: 'S', 2: (23.0, 33.0, 1.0), 3: 'W', 4: (46.0, 38.0, 2.0)}  # GPSInfo
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=92, exif=exif)
+    return buffer.getvalue()
+
+
+def full_decode_variants(data, sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS, quality=DEFAULT_QUALITY):
+    """Referência: decodifica a imagem inteira e reduz cada variante a partir do original"""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)).convert('RGB'))
+    return {size: {fmt: encode(ImageOps.fit(image, (size, size), Image.LANCZOS), fmt, quality)
+                   for fmt in formats}
+            for size in sizes}
+
+
+def draft_variants(data):
+    return make_variants(io.BytesIO(data))
+
+
+MODES = {
+    'full_decode': full_decode_variants,
+    'draft': draft_variants,
+}
+
+
+def decoded_megapixels(data, draft):
+    image = Image.open(io.BytesIO(data))
+    if draft:
+        image.draft('RGB', (max(DEFAULT_SIZES),) * 2)
+    image.load()
+    return image.size[0] * image.size[1] / 1e6
+
+
+def run_serial(func, photos):
+    start = time.perf_counter()
+    for data in photos:
+        func(data)
+    return time.perf_counter() - start
+
+
+def run_pool(func, photos, workers):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(func, photos[:workers]))  # aquece os processos
+        start = time.perf_counter()
+        list(pool.map(func, photos))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=40, help='Fotos por medição')
+    parser.add_argument('--size', default='4032x3024', help='Resolução das fotos (LxA)')
+    parser.add_argument('--workers', default=f'1,{os.cpu_count() or 1}', help='Processos do pool (lista)')
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.size.split('x'))
+    photos = [synthetic_photo(width, height, seed) for seed in range(min(args.count, 8))]
+    photos = [photos[i % len(photos)] for i in range(args.count)]
+
+    results = []
+    for mode, func in MODES.items():
+        elapsed = run_serial(func, photos)
+        results.append({'mode': mode, 'workers': 1, 'pool': False, 'images': args.count,
+                        'images_per_sec': args.count / elapsed, 'per_core': args.count / elapsed,
+                        'decoded_mpix': decoded_megapixels(photos[0], mode == 'draft')})
+
+    for workers in sorted({int(value) for value in args.workers.split(',')}):
+        elapsed = run_pool(draft_variants, photos, workers)
+        results.append({'mode': 'draft', 'workers': workers, 'pool': True, 'images': args.count,
+                        'images_per_sec': args.count / elapsed,
+                        'per_core': args.count / elapsed / min(workers, os.cpu_count() or 1),
+                        'decoded_mpix': decoded_megapixels(photos[0], True)})
+
+    print_table(results, ['mode', 'workers', 'pool', 'images', 'images_per_sec', 'per_core', 'decoded_mpix'])
+    write_results('images', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
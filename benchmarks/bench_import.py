@@ -0,0 +1,96 @@
+"""
+Mede a importação em massa de fãs (flask import-fans): linhas por segundo
+para um arquivo gerado com CPFs válidos, escolhas de eventos e uma fração de
+linhas inválidas ou repetidas. Sem ``--password-fraction`` todos os fãs
+recebem convite; com ela, parte das linhas traz senha e passa pelo pool de
+processos de hash.
+
+Uso:
+    python -m benchmarks.bench_import --fans 100000 --format csv
+    python -m benchmarks.bench_import --fans 2000 --password-fraction 0.5 --workers 4
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+
+from benchmarks.common import bench_app, print_table, write_results
+
+EVENTS = ['major_austin_2025', 'major_copenhagen_2024', 'blast_premier_2025', 'esl_pro_league_s19']
+GAMES = ['cs2', 'valorant', 'lol', 'r6']
+FIELDS = ['username', 'email', 'name', 'cpf', 'birth_date', 'password', 'favorite_games', 'events_attended']
+
+
+def make_cpf(rng):
+    digits = [rng.randint(0, 9) for _ in range(9)]
+    for weights in (range(10, 1, -1), range(11, 1, -1)):
+        digit = sum(d * w for d, w in zip(digits, weights)) * 10 % 11
+        digits.append(0 if digit == 10 else digit)
+    return '{}{}{}.{}{}{}.{}{}{}-{}{}'.format(*digits)
+
+
+def generate(path, fans, fmt, password_fraction, invalid_fraction, seed=42):
+    """Gera ``fans`` linhas determinísticas; ``invalid_fraction`` delas com CPF ou e-mail inválido"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, FIELDS) if fmt == 'csv' else None
+        if writer:
+            writer.writeheader()
+        for i in range(fans):
+            row = {
+                'username': f'fan{i}',
+                'email': f'fan{i}@example.com',
+                'name': f'Fã {i}',
+                'cpf': make_cpf(rng),
+                'birth_date': f'{rng.randint(1970, 2008)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                'password': f'senha-{i}' if rng.random() < password_fraction else '',
+                'favorite_games': ';'.join(rng.sample(GAMES, 2)),
+                'events_attended': ';'.join(rng.sample(EVENTS, rng.randint(1, 2))),
+            }
+            if rng.random() < invalid_fraction:
+                row[rng.choice(['cpf', 'email'])] = 'invalido'
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fans', type=int, default=20000)
+    parser.add_argument('--format', default='csv', choices=['csv', 'ndjson'])
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--password-fraction', type=float, default=0.0)
+    parser.add_argument('--invalid-fraction', type=float, default=0.01)
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-import-')
+    os.environ.setdefault('DATABASE_URI', f'sqlite:///{os.path.join(workdir, "bench.db")}')
+    os.environ.setdefault('JOB_AUTOSTART', '0')
+    source = os.path.join(workdir, f'fans.{args.format}')
+    generate(source, args.fans, args.format, args.password_fraction, args.invalid_fraction)
+
+    from fan_import import import_fans
+
+    app = bench_app()
+    with app.app_context():
+        stats = import_fans(source, args.format, args.chunk_size, args.workers)
+
+    results = [{
+        'fans': args.fans, 'format': args.format, 'chunk_size': args.chunk_size,
+        'password_fraction': args.password_fraction, 'inserted': stats['inserted'],
+        'rejected': stats['rejected'], 'invites': stats['invites'], 'seconds': stats['seconds'],
+        'rows_per_sec': stats['rows_per_sec']
+    }]
+    print_table(results, ['fans', 'format', 'password_fraction', 'inserted', 'rejected', 'invites', 'seconds',
+                          'rows_per_sec'])
+    write_results('import', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
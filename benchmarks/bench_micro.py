@@ -0,0 +1,127 @@
+"""
+Micro-benchmarks das funções chamadas em todo envio de formulário:
+``save_picture`` (upload novo e reenvio do mesmo arquivo), a validação de CPF
+do ``ProfileForm`` (e a validação em lote de ``cpf.validate_batch``),
+``EsportsProfileValidator.validate_profile_url`` e o hash/verificação de
+senha com o algoritmo configurado.
+
+Uso:
+    python -m benchmarks.bench_micro
+    python -m benchmarks.bench_micro --only cpf,url --number 20000
+    python -m benchmarks.bench_micro --hash-method pbkdf2:sha256:600000 --output micro.json
+"""
+
+import argparse
+import io
+import os
+import random
+import tempfile
+
+from werkzeug.datastructures import FileStorage
+from wtforms.validators import ValidationError
+
+from benchmarks.common import measure, print_table, write_results
+from benchmarks.datagen import cpf_for
+
+GROUPS = ('picture', 'cpf', 'url', 'password')
+
+
+def picture_cases(picture_kb):
+    from app import create_app, save_picture
+
+    root = tempfile.mkdtemp(prefix='bench-micro-')
+    app = create_app({'UPLOAD_FOLDER': os.path.join(root, 'uploads'),
+                      'STORAGE_PUBLIC_DIR': os.path.join(root, 'public'), 'JOB_AUTOSTART': False})
+    payload = random.Random(42).randbytes(picture_kb * 1024)
+    counter = iter(range(10 ** 9))
+
+    def upload(data):
+        return FileStorage(stream=io.BytesIO(data), filename='foto.jpg', content_type='image/jpeg')
+
+    def new_picture():
+        # Conteúdo diferente a cada chamada: hash + gravação + hardlink
+        save_picture(upload(next(counter).to_bytes(8, 'big') + payload), 'profiles')
+
+    def same_picture():
+        # Mesmo conteúdo: só o hash, o arquivo já existe
+        save_picture(upload(payload), 'profiles')
+
+    with app.app_context():
+        same_picture()
+        yield 'save_picture', f'novo ({picture_kb} KB)', new_picture, 0.02
+        yield 'save_picture', f'repetido ({picture_kb} KB)', same_picture, 0.02
+
+
+def cpf_cases():
+    from cpf import format_cpf, validate_batch
+    from forms import ProfileForm
+
+    class Field:
+        def __init__(self, data):
+            self.data = data
+
+    formatted = Field(format_cpf(cpf_for(123456)))
+    invalid = Field('123.456.789-00')
+    batch = [cpf_for(i) for i in range(1, 10001)]
+
+    def validate_invalid():
+        try:
+            ProfileForm.validate_cpf(None, invalid)
+        except ValidationError:
+            pass
+
+    yield 'ProfileForm.validate_cpf', 'válido', lambda: ProfileForm.validate_cpf(None, formatted), 1
+    yield 'ProfileForm.validate_cpf', 'inválido', validate_invalid, 1
+    yield 'cpf.validate_batch', '10k CPFs', lambda: validate_batch(batch), 0.01
+
+
+def url_cases():
+    from ai_services import EsportsProfileValidator
+
+    validate = EsportsProfileValidator.validate_profile_url
+    yield 'validate_profile_url', 'válida', lambda: validate('steam', 'https://steamcommunity.com/id/fan123'), 1
+    yield 'validate_profile_url', 'inválida', lambda: validate('steam', 'steamcommunity/fan123'), 1
+
+
+def password_cases(method):
+    from hashing import hash_password, normalize_method, verify_password
+
+    method = normalize_method(method)
+    pwhash = hash_password(method, 'senha-de-teste-123')
+    yield 'hash_password', method, lambda: hash_password(method, 'senha-de-teste-123'), 0.0005
+    yield 'verify_password', method, lambda: verify_password(pwhash, 'senha-de-teste-123'), 0.0005
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', default=','.join(GROUPS), help=f'Grupos a medir ({", ".join(GROUPS)})')
+    parser.add_argument('--number', type=int, default=10000, help='Chamadas por rodada das funções rápidas')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--picture-kb', type=int, default=256)
+    parser.add_argument('--hash-method', default='scrypt:32768:8:1', help='PASSWORD_HASH_METHOD')
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URI', 'sqlite://')
+    os.environ.setdefault('JOB_AUTOSTART', '0')
+    groups = {
+        'picture': lambda: picture_cases(args.picture_kb),
+        'cpf': cpf_cases,
+        'url': url_cases,
+        'password': lambda: password_cases(args.hash_method),
+    }
+
+    results = []
+    for group in args.only.split(','):
+        # Cada caso informa a fração de --number adequada ao seu custo
+        for function, case, func, scale in groups[group]():
+            stats = measure(func, number=max(1, int(args.number * scale)), repeat=args.repeat)
+            results.append(dict({'function': function, 'case': case}, **stats))
+            print(f'  {function} [{case}]: {stats["median_us"]:.1f} µs')
+
+    print_table(results, ['function', 'case', 'calls', 'median_us', 'best_us', 'ops_per_sec'])
+    write_results('micro', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
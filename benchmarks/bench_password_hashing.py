@@ -0,0 +1,81 @@
+"""
+Mede logins por segundo em POST /login com diferentes tamanhos do pool de
+hash de senhas (``PASSWORD_HASH_POOL_SIZE``; 0 = hash na própria thread).
+
+Cada cliente simulado faz logins em sequência numa thread própria, como
+os workers com threads do gunicorn.
+
+Uso:
+    python -m benchmarks.bench_password_hashing --logins 200 --clients 8 --pool-sizes 0,1,2,4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import bench_app, print_table, write_results
+
+PASSWORD = 'senha-de-teste-123'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200, help='Logins por tamanho de pool')
+    parser.add_argument('--clients', type=int, default=8, help='Clientes concorrentes')
+    parser.add_argument('--pool-sizes', default='0,1,2,4')
+    parser.add_argument('--method', default='scrypt:32768:8:1', help='PASSWORD_HASH_METHOD')
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-hashing-')
+    os.environ.setdefault('DATABASE_URI', f'sqlite:///{os.path.join(workdir, "bench.db")}')
+    os.environ['PASSWORD_HASH_METHOD'] = args.method
+
+    from sqlalchemy import insert
+    from hashing import hash_password, normalize_method, password_hasher
+    from models import db, User
+
+    app = bench_app()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['JOB_AUTOSTART'] = False
+    with app.app_context():
+        pwhash = hash_password(normalize_method(args.method), PASSWORD)
+        db.session.execute(insert(User), [
+            {'username': f'login{i}', 'email': f'login{i}@example.com', 'password_hash': pwhash}
+            for i in range(args.clients)
+        ])
+        db.session.commit()
+
+    def client_logins(index, count):
+        client = app.test_client()
+        for _ in range(count):
+            response = client.post('/login', data={'email': f'login{index}@example.com', 'password': PASSWORD})
+            assert response.status_code == 302, response.status_code
+            client.get('/logout')
+
+    results = []
+    for pool_size in [int(size) for size in args.pool_sizes.split(',')]:
+        password_hasher.shutdown()
+        password_hasher.pool_size = pool_size
+        if pool_size:
+            # Sobe os processos antes de medir
+            password_hasher.verify(pwhash, PASSWORD)
+        per_client = max(1, args.logins // args.clients)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            list(executor.map(client_logins, range(args.clients), [per_client] * args.clients))
+        elapsed = time.perf_counter() - start
+        total = per_client * args.clients
+        results.append({'pool_size': pool_size, 'logins': total, 'seconds': elapsed,
+                        'logins_per_sec': total / elapsed})
+    password_hasher.shutdown()
+
+    print_table(results, ['pool_size', 'logins', 'seconds', 'logins_per_sec'])
+    write_results('password_hashing', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Mede a busca de documentos quase duplicados pelo hash perceptual (phash.py)
+em bases de tamanhos diferentes: consulta pelos pedaços indexados contra a
+varredura de todos os hashes. Cada consulta é um hash já cadastrado com
+alguns bits trocados, então deve sempre encontrar o original.
+
+Uso:
+    python -m benchmarks.bench_phash --sizes 10000,100000 --queries 200 --distance 6
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flask import Flask
+from sqlalchemy import insert, select
+
+from benchmarks.common import print_table, write_results
+from migrations import run_migrations
+from models import db, Document
+from phash import DocumentHashIndex, hamming, to_chunks
+
+
+def seed_hashes(count, rng):
+    values = [rng.getrandbits(64) for _ in range(count)]
+    rows = []
+    for i, value in enumerate(values):
+        chunks = to_chunks(value)
+        rows.append({'user_id': i + 1, 'filename': f'{i}.jpg', 'phash': f'{value:016x}',
+                     'phash_0': chunks[0], 'phash_1': chunks[1], 'phash_2': chunks[2], 'phash_3': chunks[3]})
+    for start in range(0, len(rows), 5000):
+        db.session.execute(insert(Document), rows[start:start + 5000])
+    db.session.commit()
+    return values
+
+
+def flip_bits(value, bits, rng):
+    for bit in rng.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+
+def linear_scan(value, max_distance):
+    return [document_id for document_id, phash in db.session.execute(select(Document.id, Document.phash))
+            if hamming(value, int(phash, 16)) <= max_distance]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--distance', type=int, default=6)
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    results = []
+    for size in [int(value) for value in args.sizes.split(',')]:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-phash-'), 'phash.db')
+        db.init_app(app)
+        index = DocumentHashIndex(app)
+        with app.app_context():
+            run_migrations(db.engine, echo=lambda message: None)
+            values = seed_hashes(size, rng)
+            queries = [flip_bits(rng.choice(values), rng.randint(0, args.distance), rng)
+                       for _ in range(args.queries)]
+
+            found = 0
+            start = time.perf_counter()
+            for value in queries:
+                found += bool(index.find_similar(value, max_distance=args.distance))
+            indexed = (time.perf_counter() - start) / len(queries)
+
+            scan_queries = queries[:max(1, len(queries) // 20)]
+            start = time.perf_counter()
+            for value in scan_queries:
+                linear_scan(value, args.distance)
+            scan = (time.perf_counter() - start) / len(scan_queries)
+            db.engine.dispose()
+
+        results.append({'documents': size, 'distance': args.distance, 'recall': found / len(queries),
+                        'indexed_ms': indexed * 1000, 'scan_ms': scan * 1000, 'speedup': scan / indexed})
+
+    print_table(results, ['documents', 'distance', 'recall', 'indexed_ms', 'scan_ms', 'speedup'])
+    write_results('phash', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Conta os comandos SQL emitidos por requisição autenticada nas páginas que
+usam ``current_user`` e seus relacionamentos.
+
+Compara três modos de carregar o usuário:
+
+- ``legacy``: ``User.query.get`` + carregamento preguiçoso de cada relacionamento
+- ``eager``: carregamento antecipado por rota, sem cache (``IDENTITY_CACHE_TTL=0``)
+- ``cached``: carregamento antecipado + cache de curta duração entre requisições
+
+Como os templates não fazem parte deste benchmark, cada rota é simulada
+acessando os mesmos atributos que seu template usa.
+
+Uso:
+    python -m benchmarks.bench_query_counts --requests 50
+"""
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import bench_app, print_table, write_results
+
+# Atributos do current_user tocados pelo template de cada rota
+ROUTE_ACCESS = {
+    'dashboard': lambda user: (user.profile and user.profile.fan_story, len(user.documents),
+                               len(user.social_accounts), len(user.esports_profiles)),
+    'profile': lambda user: (user.profile.favorite_game_list, user.profile.favorite_team_list,
+                             user.profile.events_attended_list),
+    'documents': lambda user: user.profile and user.profile.profile_picture,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50, help='Requisições por rota e modo')
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-queries-')
+    os.environ.setdefault('DATABASE_URI', f'sqlite:///{os.path.join(workdir, "bench.db")}')
+
+    from flask import session
+    from flask_login import current_user
+    from app import login_manager
+    from identity import identity_cache
+    from instrumentation import query_counter
+    from models import db, User
+
+    app = bench_app()
+    app.config['JOB_AUTOSTART'] = False
+    app.test_client().get('/demo')
+    with app.app_context():
+        user_id = User.query.filter_by(email='demo@furia.com').first().id
+
+    def legacy_loader(user_id):
+        return db.session.get(User, int(user_id))
+
+    modes = {
+        'legacy': (legacy_loader, 0),
+        'eager': (lambda user_id: identity_cache.load_user(int(user_id)), 0),
+        'cached': (lambda user_id: identity_cache.load_user(int(user_id)), 5.0),
+    }
+
+    results = []
+    for mode, (loader, ttl) in modes.items():
+        login_manager.user_loader(loader)
+        app.config['IDENTITY_CACHE_TTL'] = ttl
+        for endpoint, access in ROUTE_ACCESS.items():
+            identity_cache.clear()
+            total = 0
+            for _ in range(args.requests):
+                with app.test_request_context(f'/{endpoint}'):
+                    session['_user_id'] = str(user_id)
+                    access(current_user._get_current_object())
+                    total += query_counter.current()
+                    db.session.remove()
+            results.append({'mode': mode, 'route': endpoint,
+                            'queries_per_request': total / args.requests})
+
+    print_table(results, ['mode', 'route', 'queries_per_request'])
+    write_results('query_counts', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
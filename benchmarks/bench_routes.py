@@ -0,0 +1,375 @@
+"""
+Teste de carga multiusuário de todas as rotas de ``app.py``.
+
+Popula o banco com ``benchmarks.datagen`` e solta ``--clients`` usuários
+virtuais, cada um numa thread e autenticado como um fã diferente
+(``fan1``, ``fan2``...). Cada iteração percorre o cenário completo: páginas
+públicas, cadastro, login, formulários de perfil/documentos/redes
+sociais/e-sports, APIs (inclusive as administrativas, com os fãs do teste em
+``ADMIN_EMAILS``), ``/metrics`` e logout. Rotas novas em ``app.py`` sem passo
+no cenário são listadas no início da execução.
+
+Alvos:
+
+- ``testclient`` (padrão): cliente de teste do Flask, no mesmo processo,
+  sem CSRF.
+- ``gunicorn``: sobe ``gunicorn --preload --worker-class gthread app:app`` local com
+  ``--workers`` e ``--threads`` apontando para o banco gerado; os formulários usam o token
+  CSRF lido das páginas. Uploads vão para a pasta ``uploads/`` da aplicação.
+- ``--url``: servidor já em execução, com banco populado por
+  ``benchmarks.datagen`` e os fãs do teste em ``ADMIN_EMAILS``.
+
+Uso:
+    python -m benchmarks.bench_routes --scale 10k --clients 8 --iterations 5
+    python -m benchmarks.bench_routes --target gunicorn --workers 2 --threads 4 --clients 16
+    python -m benchmarks.bench_routes --url http://localhost:8000 --clients 8
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.common import percentiles, print_table, write_results
+from benchmarks.datagen import PASSWORD, SCALES, cpf_for
+from cpf import format_cpf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSRF_TOKEN = re.compile(rb'name="csrf_token"[^>]*value="([^"]+)"')
+# Servidos pelo WhiteNoise antes do Flask; não entram na verificação de cobertura
+UNCOVERED_ENDPOINTS = {'static'}
+# /metrics só existe com METRICS_TOKEN; com --url, use o token do servidor
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', 'bench-metrics')
+
+
+def fake_jpeg(seed):
+    """Bytes com cabeçalho JPEG; o conteúdo não é decodificado pelas rotas medidas"""
+    return b'\xff\xd8\xff\xe0' + random.Random(seed).randbytes(32 * 1024) + b'\xff\xd9'
+
+
+class TestClientSession:
+    """Requisições pelo cliente de teste do Flask"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None, json=None, files=None, headers=None):
+        data = dict(form or {})
+        for name, (filename, content) in (files or {}).items():
+            data[name] = (io.BytesIO(content), filename)
+        kwargs = {'json': json} if json is not None else {'data': data}
+        response = self.client.open(path, method=method, headers=headers, **kwargs)
+        return response.status_code, response.get_data()
+
+    def csrf_token(self, path):
+        return None
+
+
+class HttpSession:
+    """Requisições HTTP reais, com cookies e token CSRF lido das páginas"""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, form=None, json=None, files=None, headers=None):
+        response = self.session.request(method, self.base_url + path, data=form, json=json, files=files,
+                                        headers=headers, allow_redirects=False, timeout=60)
+        return response.status_code, response.content
+
+    def csrf_token(self, path):
+        _, body = self.request('GET', path)
+        match = CSRF_TOKEN.search(body)
+        return match.group(1).decode() if match else None
+
+
+class VirtualUser:
+    """Um fã percorrendo o cenário; guarda (endpoint, método, status, segundos) de cada passo"""
+
+    def __init__(self, index, session, fan_id, since):
+        self.index = index
+        self.session = session
+        self.fan_id = fan_id
+        self.since = since
+        self.records = []
+        self.csrf = None
+        self.job_id = 0
+        self.document = fake_jpeg(f'document-{index}')
+        self.picture = fake_jpeg(f'picture-{index}')
+
+    def call(self, endpoint, method, path, form=None, json=None, files=None, headers=None):
+        if form is not None and self.csrf:
+            form = dict(form, csrf_token=self.csrf)
+        start = time.perf_counter()
+        try:
+            status, body = self.session.request(method, path, form=form, json=json, files=files, headers=headers)
+        except Exception:
+            status, body = 'exception', b''
+        self.records.append((endpoint, method, status, time.perf_counter() - start))
+        return status, body
+
+    def run(self, iteration):
+        fan = self.fan_id
+        email = f'fan{fan}@example.com'
+        tag = f'{self.index}x{iteration}x{random.randrange(10 ** 9)}'
+
+        # Páginas públicas, cadastro e login
+        self.call('home', 'GET', '/')
+        self.call('about', 'GET', '/about')
+        self.call('api_check_availability', 'GET', f'/api/check_availability?username=fan{fan}')
+        self.call('register', 'GET', '/register')
+        self.csrf = self.session.csrf_token('/register')
+        self.call('register', 'POST', '/register', form={
+            'username': f'lt{tag}'[:20], 'email': f'lt{tag}@example.com',
+            'password': PASSWORD, 'confirm_password': PASSWORD})
+        self.call('api_accept_invite', 'POST', '/api/invites/accept', json={'token': f'invalido-{tag}',
+                                                                           'password': PASSWORD})
+        self.call('login', 'GET', '/login')
+        self.csrf = self.session.csrf_token('/login')
+        self.call('login', 'POST', '/login', form={'email': email, 'password': PASSWORD})
+
+        # Páginas e formulários autenticados
+        self.call('dashboard', 'GET', '/dashboard')
+        self.call('profile', 'GET', '/profile')
+        self.csrf = self.session.csrf_token('/profile')
+        self.call('profile', 'POST', '/profile', form={
+            'name': f'Fã {fan}', 'cpf': format_cpf(cpf_for(fan)), 'birth_date': '1995-05-17',
+            'address': 'Rua das Flores, 100, São Paulo, SP', 'favorite_games': ['cs2', 'valorant'],
+            'favorite_teams': ['furia_cs2'], 'events_attended': ['major_austin_2025'],
+            'interests': 'CS2', 'purchases': 'camisa'}, files={'profile_picture': ('foto.jpg', self.picture)})
+        # O original é privado: a rota responde 404 para ele (as variantes têm nomes próprios)
+        self.call('uploaded_file', 'GET', f'/uploads/profiles/{hashlib.sha256(self.picture).hexdigest()}.jpg')
+        self.call('documents', 'GET', '/documents')
+        self.call('documents', 'POST', '/documents', form={'doc_type': 'id'},
+                  files={'document': ('documento.jpg', self.document)})
+        self.call('uploaded_document', 'GET', f'/uploads/documents/{hashlib.sha256(self.document).hexdigest()}.jpg')
+        self.call('social', 'GET', '/social')
+        self.call('social', 'POST', '/social', form={'platform': 'twitter', 'username': f'lt{tag}'})
+        self.call('esports', 'GET', '/esports')
+        self.call('esports', 'POST', '/esports', form={
+            'platform': 'faceit', 'profile_url': f'https://www.faceit.com/pt/players/lt{tag}', 'username': f'lt{tag}'})
+
+        # APIs
+        status, body = self.call('api_verify_document', 'POST', '/api/verify_document',
+                                 files={'document': ('documento.jpg', fake_jpeg(tag))})
+        match = re.search(rb'"job_id":\s*(\d+)', body)
+        if match:
+            self.job_id = int(match.group(1))
+        self.call('api_job_status', 'GET', f'/api/jobs/{self.job_id}')
+        self.call('api_analyze_social', 'POST', '/api/analyze_social',
+                  json={'platform': 'twitter', 'username': f'fan{fan}_twitter'})
+        self.call('api_analyze_social_batch', 'POST', '/api/analyze_social/batch', json={'items': [
+            {'platform': 'twitter', 'username': f'fan{fan + n}_twitter'} for n in range(5)]})
+        self.call('api_social_cache_stats', 'GET', '/api/social_cache/stats')
+        self.call('api_validate_esports_profile', 'POST', '/api/validate_esports_profile',
+                  json={'platform': 'steam', 'url': f'https://steamcommunity.com/id/fan{fan}'})
+        self.call('api_validate_esports_profile_batch', 'POST', '/api/validate_esports_profile/batch', json={
+            'items': [{'platform': 'steam', 'url': f'https://steamcommunity.com/id/fan{fan + n}'} for n in range(5)]})
+        self.call('api_segments_query', 'POST', '/api/segments/query',
+                  json={'segment': {'and': [{'game': 'cs2'}, {'team': 'furia_cs2'}]}})
+        self.call('api_segments', 'GET', '/api/segments')
+        self.call('api_admin_stats', 'GET', '/api/admin/stats')
+        self.call('api_leaderboard', 'GET', '/api/leaderboard')
+        self.call('api_fans_by_cpf', 'POST', '/api/admin/fans/by_cpf',
+                  json={'cpfs': [cpf_for(fan + n) for n in range(100)]})
+        self.call('api_export_fans', 'GET', f'/api/export/fans?since={self.since}')
+        self.call('metrics', 'GET', '/metrics', headers={'Authorization': f'Bearer {METRICS_TOKEN}'})
+        self.call('logout', 'GET', '/logout')
+
+        # Modo demonstração (entra como o usuário demo)
+        self.call('demo', 'GET', '/demo')
+        self.call('logout', 'GET', '/logout')
+
+
+def scenario_endpoints():
+    """Endpoints chamados pelo cenário (lidos do código de ``VirtualUser.run``)"""
+    import inspect
+    return set(re.findall(r"self\.call\('(\w+)'", inspect.getsource(VirtualUser.run)))
+
+
+def prepare(database_uri, users, clients, testclient):
+    """Cria o banco, popula os fãs e devolve a aplicação configurada"""
+    os.environ['DATABASE_URI'] = database_uri
+    os.environ['ADMIN_EMAILS'] = ','.join(f'fan{i}@example.com' for i in range(1, clients + 1))
+    os.environ.setdefault('JOB_AUTOSTART', '1')
+    os.environ.setdefault('METRICS_TOKEN', METRICS_TOKEN)
+
+    from app import create_app, init_db
+    from benchmarks.datagen import seed
+
+    root = tempfile.mkdtemp(prefix='bench-routes-')
+    config = {'WTF_CSRF_ENABLED': False} if testclient else {}
+    if testclient:
+        config.update(UPLOAD_FOLDER=os.path.join(root, 'uploads'), STORAGE_PUBLIC_DIR=os.path.join(root, 'public'))
+    app = create_app(config)
+    with app.app_context():
+        init_db()
+        start = time.perf_counter()
+        inserted = seed(users, password_method=app.config['PASSWORD_HASH_METHOD'])
+        if inserted:
+            print(f'{inserted} fãs gerados em {time.perf_counter() - start:.1f}s')
+    return app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workers, threads):
+    import requests
+
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--preload', '--worker-class', 'gthread',
+               '--workers', str(workers), '--threads', str(threads),
+               '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app']
+    process = subprocess.Popen(command, cwd=ROOT, env=dict(os.environ))
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + '/api/check_availability?username=ping', timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            if process.poll() is not None:
+                raise SystemExit('gunicorn terminou antes de aceitar conexões')
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('gunicorn não respondeu em 60s')
+
+
+def failed(status):
+    return status == 'exception' or status >= 500
+
+
+def summarize(records, elapsed):
+    """
+    Linhas por rota e a linha TOTAL. Os tempos (média e percentis) só contam as
+    respostas sem erro: uma rota que falha rápido não puxa a latência para baixo.
+    """
+    by_route = defaultdict(list)
+    for endpoint, method, status, seconds in records:
+        by_route[endpoint, method].append((status, seconds))
+    rows = []
+    for (endpoint, method), calls in sorted(by_route.items()):
+        statuses = Counter(str(status) for status, _ in calls)
+        rows.append(dict({
+            'endpoint': endpoint, 'method': method, 'requests': len(calls),
+            'errors': sum(1 for status, _ in calls if failed(status)), 'statuses': dict(statuses),
+        }, **latency_stats([seconds for status, seconds in calls if not failed(status)])))
+    rows.append(dict({
+        'endpoint': 'TOTAL', 'method': '*', 'requests': len(records), 'errors': sum(row['errors'] for row in rows),
+        'requests_per_sec': len(records) / elapsed,
+    }, **latency_stats([seconds for _, _, status, seconds in records if not failed(status)])))
+    return rows
+
+
+def latency_stats(seconds):
+    if not seconds:
+        return {'mean_ms': None, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    latencies = [value * 1000 for value in seconds]
+    return dict({'mean_ms': sum(latencies) / len(latencies)},
+                **{f'{name}_ms': value for name, value in percentiles(latencies).items()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['testclient', 'gunicorn'], default='testclient')
+    parser.add_argument('--url', help='Servidor já em execução (ignora --target e não popula o banco)')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    parser.add_argument('--users', type=int, help='Quantidade exata de fãs (em vez de --scale)')
+    parser.add_argument('--database-uri', help='Banco a usar (padrão: SQLite temporário)')
+    parser.add_argument('--clients', type=int, default=8, help='Usuários virtuais simultâneos')
+    parser.add_argument('--iterations', type=int, default=3, help='Cenários completos por usuário virtual')
+    parser.add_argument('--warmup', type=int, default=1, help='Iterações iniciais fora da medição')
+    parser.add_argument('--workers', type=int, default=2, help='Workers do gunicorn')
+    parser.add_argument('--threads', type=int, default=4, help='Threads por worker do gunicorn')
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    parser.add_argument('--allow-errors', action='store_true',
+                        help='Termina com sucesso mesmo com respostas 5xx ou exceções')
+    args = parser.parse_args()
+
+    users = args.users or SCALES[args.scale]
+    if args.clients > users:
+        parser.error('--clients não pode passar da quantidade de fãs')
+    database_uri = args.database_uri or \
+        'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-routes-db-'), 'fans.db')
+
+    server = None
+    if args.url:
+        target = args.url
+        make_session = lambda: HttpSession(args.url)
+    else:
+        app = prepare(database_uri, users, args.clients, args.target == 'testclient')
+        missing = {rule.endpoint for rule in app.url_map.iter_rules()} - scenario_endpoints() - UNCOVERED_ENDPOINTS
+        if missing:
+            print(f'Rotas sem passo no cenário: {", ".join(sorted(missing))}')
+        if args.target == 'gunicorn':
+            server, target = start_gunicorn(args.workers, args.threads)
+            make_session = lambda: HttpSession(target)
+        else:
+            target = 'testclient'
+            make_session = lambda: TestClientSession(app)
+
+    since = datetime.utcnow().isoformat(timespec='seconds')
+    # Fãs dos usuários virtuais espalhados pela base (os primeiros são os administradores)
+    virtual_users = [VirtualUser(index, make_session(), index + 1, since) for index in range(args.clients)]
+    measured_from = {}
+    started = {}
+    # A medição começa quando todos terminam o aquecimento
+    barrier = threading.Barrier(args.clients, action=lambda: started.setdefault('at', time.perf_counter()))
+
+    def run(user):
+        for iteration in range(args.warmup):
+            user.run(iteration)
+        measured_from[user.index] = len(user.records)
+        barrier.wait()
+        for iteration in range(args.warmup, args.warmup + args.iterations):
+            user.run(iteration)
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            list(executor.map(run, virtual_users))
+        elapsed = time.perf_counter() - started['at']
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    records = [record for user in virtual_users for record in user.records[measured_from[user.index]:]]
+    rows = summarize(records, elapsed)
+    print_table(rows, ['endpoint', 'method', 'requests', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'])
+    print(f'{rows[-1]["requests_per_sec"]:.1f} req/s com {args.clients} usuários virtuais ({target})')
+    write_results('routes', rows, args.output, config={
+        'target': target, 'users': users, 'clients': args.clients, 'iterations': args.iterations,
+        'warmup': args.warmup, 'workers': args.workers, 'threads': args.threads,
+        'database': database_uri.split(':', 1)[0],
+    })
+
+    failing = [row for row in rows[:-1] if row['errors']]
+    if failing:
+        print(f'\nERRO: {rows[-1]["errors"]} requisição(ões) com 5xx ou exceção, fora dos tempos medidos:',
+              file=sys.stderr)
+        for row in failing:
+            print(f'  {row["method"]} {row["endpoint"]}: {row["errors"]}/{row["requests"]} {row["statuses"]}',
+                  file=sys.stderr)
+        if not args.allow_errors:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
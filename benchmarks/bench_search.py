@@ -0,0 +1,92 @@
+"""
+Mede a busca textual de ``/api/admin/search`` (``search.fan_search``) em
+bases de tamanhos diferentes, com termos raros, comuns, frases e páginas
+profundas. Para comparação, a mesma consulta com a varredura por LIKE (o
+caminho usado em bancos sem índice textual) roda nas bases de até
+``--like-max`` fãs.
+
+Uso:
+    python -m benchmarks.bench_search --sizes 10000,100000
+    python -m benchmarks.bench_search --sizes 1000000 --like-max 0 --output search-1m.json
+    python -m benchmarks.bench_search --database-uri postgresql://localhost/kyf_bench --sizes 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import percentiles, print_table, write_results
+from benchmarks.datagen import seed
+
+# (caso, consulta, offset)
+QUERIES = [
+    ('raro', 'cosplay', 0),
+    ('raro, curto', 'arT', 0),
+    ('comum', 'furia', 0),
+    ('plural/gênero', 'amigas', 0),
+    ('acento', 'comeco', 0),
+    ('frase', '"iem rio"', 0),
+    ('dois termos', 'valorant competitivo', 0),
+    ('página profunda', 'furia', 2000),
+    ('sem resultado', 'xyzzy', 0),
+]
+
+
+def latencies(func, repeat):
+    values = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        values.append((time.perf_counter() - start) * 1000)
+    return result, values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--database-uri', help='Banco a usar (padrão: um SQLite temporário por tamanho)')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--like-max', type=int, default=100000, help='Maior base medida também com LIKE')
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    from app import create_app, init_db
+    from models import db
+    from search import FanSearch, parse_query
+
+    results = []
+    for size in [int(value) for value in args.sizes.split(',')]:
+        database_uri = args.database_uri or \
+            'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-search-'), 'search.db')
+        root = tempfile.mkdtemp(prefix='bench-search-files-')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri, 'JOB_AUTOSTART': False,
+                          'UPLOAD_FOLDER': os.path.join(root, 'uploads'),
+                          'STORAGE_PUBLIC_DIR': os.path.join(root, 'public')})
+        searcher = app.extensions['fan_search']
+        with app.app_context():
+            init_db()
+            seed(size, progress=lambda last: print(f'  {last} fãs', end='\r', flush=True))
+            print()
+            for case, query, offset in QUERIES:
+                found, values = latencies(lambda: searcher.search(query, args.limit, offset), args.repeat)
+                row = dict({'fans': size, 'case': case, 'query': query, 'offset': offset,
+                            'hits': len(found['results']), 'has_more': found['has_more']},
+                           **{f'{key}_ms': value for key, value in percentiles(values).items()})
+                if size <= args.like_max:
+                    params = {'limit': args.limit + 1, 'offset': offset}
+                    terms = parse_query(query)
+                    _, values = latencies(lambda: FanSearch._like_search(terms, params), max(args.repeat // 10, 3))
+                    row['like_p50_ms'] = percentiles(values)['p50']
+                results.append(row)
+                print(f'  {size} [{case}]: p50 {row["p50_ms"]:.2f} ms')
+            db.session.remove()
+            db.engine.dispose()
+
+    print_table(results, ['fans', 'case', 'hits', 'has_more', 'p50_ms', 'p95_ms', 'p99_ms', 'like_p50_ms'])
+    write_results('search', results, args.output, config={'repeat': args.repeat, 'limit': args.limit})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Mede o custo de inicialização de um worker: tempo de ``import app`` e da
+primeira requisição (GET /demo com o usuário de demonstração já criado),
+cada medição num processo Python novo.
+
+Com ``--baseline REV`` a mesma medição roda também numa cópia da revisão
+``REV`` do git, para comparar antes/depois.
+
+Uso:
+    python -m benchmarks.bench_startup --runs 10
+    python -m benchmarks.bench_startup --runs 10 --baseline HEAD~1
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import print_table, write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cria as tabelas e o usuário de demonstração (fora da medição)
+SETUP = """
+import app as module
+if hasattr(module, 'init_db'):
+    with module.app.app_context():
+        module.init_db()
+module.app.test_client().get('/demo')
+"""
+
+MEASURE = """
+import json, time
+started = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+response = module.app.test_client().get('/demo')
+finished = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'first_request_ms': (finished - imported) * 1000,
+                  'status': response.status_code}))
+"""
+
+
+def export_revision(revision):
+    """Extrai ``revision`` do repositório para um diretório temporário"""
+    directory = tempfile.mkdtemp(prefix='bench-startup-')
+    archive = subprocess.run(['git', 'archive', revision], cwd=ROOT, check=True, capture_output=True).stdout
+    subprocess.run(['tar', '-x', '-C', directory], input=archive, check=True)
+    return directory
+
+
+def measure(tree, runs):
+    env = dict(os.environ, JOB_AUTOSTART='0', PASSWORD_HASH_POOL_SIZE='0',
+               DATABASE_URI=f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="bench-startup-db-"), "bench.db")}')
+    subprocess.run([sys.executable, '-c', SETUP], cwd=tree, env=env, check=True, capture_output=True)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', MEASURE], cwd=tree, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'import_ms': statistics.median(sample['import_ms'] for sample in samples),
+        'first_request_ms': statistics.median(sample['first_request_ms'] for sample in samples),
+        'status': samples[-1]['status'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Processos medidos por árvore')
+    parser.add_argument('--baseline', help='Revisão do git para comparação (ex.: HEAD~1)')
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    trees = []
+    if args.baseline:
+        trees.append((args.baseline, export_revision(args.baseline)))
+    trees.append(('working tree', ROOT))
+
+    results = []
+    for name, tree in trees:
+        results.append(dict(tree=name, runs=args.runs, **measure(tree, args.runs)))
+
+    print_table(results, ['tree', 'runs', 'import_ms', 'first_request_ms', 'status'])
+    write_results('startup', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
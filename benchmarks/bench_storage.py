@@ -0,0 +1,103 @@
+"""
+Compara a gravação de uploads do ``save_picture`` antigo (duas gravações e
+leitura integral em memória) com a gravação única em blocos do ``storage``.
+
+Uso:
+    python -m benchmarks.bench_storage --size-mb 8 --uploads 20
+"""
+
+import argparse
+import os
+import secrets
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from werkzeug.datastructures import FileStorage
+
+from storage import LocalStorage
+from benchmarks.common import print_table, write_results
+
+
+def legacy_save_picture(form_picture, folder, upload_root, static_root):
+    """Cópia fiel do save_picture original, com as raízes parametrizadas"""
+    random_hex = secrets.token_hex(8)
+    _, f_ext = os.path.splitext(form_picture.filename)
+    picture_fn = random_hex + f_ext
+    picture_path = os.path.join(upload_root, folder, picture_fn)
+    form_picture.save(picture_path)
+
+    static_path = os.path.join(static_root, folder, picture_fn)
+    form_picture.seek(0)
+    with open(static_path, 'wb') as f:
+        f.write(form_picture.read())
+    return picture_fn
+
+
+def make_upload(payload):
+    """Simula o FileStorage que o werkzeug entrega para uploads grandes (arquivo temporário)"""
+    stream = tempfile.TemporaryFile()
+    stream.write(payload)
+    stream.seek(0)
+    return FileStorage(stream=stream, filename='foto.jpg', content_type='image/jpeg')
+
+
+def run(label, save, payload, uploads):
+    files = [make_upload(payload) for _ in range(uploads)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    for upload in files:
+        save(upload)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for upload in files:
+        upload.stream.close()
+
+    total_mb = len(payload) * uploads / (1024 * 1024)
+    return {
+        'implementation': label,
+        'uploads': uploads,
+        'size_mb': len(payload) / (1024 * 1024),
+        'seconds': elapsed,
+        'uploads_per_sec': uploads / elapsed,
+        'mb_per_sec': total_mb / elapsed,
+        'peak_memory_mb': peak / (1024 * 1024)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=8)
+    parser.add_argument('--uploads', type=int, default=20)
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    args = parser.parse_args()
+
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    workdir = tempfile.mkdtemp(prefix='bench-storage-')
+    try:
+        upload_root = os.path.join(workdir, 'uploads')
+        static_root = os.path.join(workdir, 'static', 'uploads')
+        for root in (upload_root, static_root):
+            os.makedirs(os.path.join(root, 'profiles'))
+
+        storage = LocalStorage(upload_root, public_root=static_root)
+
+        def new_save(upload):
+            storage.save(upload.stream, 'profiles', secrets.token_hex(8) + '.jpg')
+
+        results = [
+            run('legacy', lambda upload: legacy_save_picture(upload, 'profiles', upload_root, static_root),
+                payload, args.uploads),
+            run('storage', new_save, payload, args.uploads),
+        ]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results, ['implementation', 'uploads', 'seconds', 'uploads_per_sec', 'mb_per_sec', 'peak_memory_mb'])
+    write_results('storage', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
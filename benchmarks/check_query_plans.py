@@ -0,0 +1,103 @@
+"""
+Verifica, via EXPLAIN, que as consultas mais frequentes das páginas usam
+índices em vez de varrer as tabelas.
+
+Popula um banco (SQLite temporário por padrão) com ``--users`` fãs do
+gerador de ``benchmarks.datagen``, aplica as migrações e inspeciona o plano
+de cada consulta. Termina com código 1 se alguma consulta fizer varredura
+completa.
+
+Uso:
+    python -m benchmarks.check_query_plans --users 50000
+    python -m benchmarks.check_query_plans --database-uri postgresql://... --users 200000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from flask import Flask
+from sqlalchemy import text
+
+from benchmarks.datagen import cpf_for, digest_for, seed
+from models import db, User, Profile, Document, SocialAccount, EsportsProfile
+from migrations import run_migrations
+
+
+def make_app(database_uri):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def hot_queries(user_id):
+    """Consultas emitidas pelas rotas /documents, /social, /esports e afins"""
+    return {
+        'documents by user': Document.query.filter_by(user_id=user_id),
+        'social accounts by user': SocialAccount.query.filter_by(user_id=user_id),
+        'social account lookup': SocialAccount.query.filter_by(
+            user_id=user_id, platform='twitter', username=f'fan{user_id}_twitter'),
+        'esports profiles by user': EsportsProfile.query.filter_by(user_id=user_id),
+        'document by digest': Document.query.filter_by(digest=digest_for(user_id)),
+        'profiles by game': Profile.query_by_choices(game='cs2'),
+        'leaderboard': User.query.filter(User.engagement_score.isnot(None))
+        .order_by(User.engagement_score.desc(), User.id).limit(20),
+        'dirty fans': User.query.filter(User.score_dirty.is_(True)).with_entities(User.id),
+        'user by cpf': User.query.filter(User.cpf.in_([cpf_for(user_id), cpf_for(user_id + 1)])),
+    }
+
+
+def explain(query):
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+        plan = [row[-1] for row in rows]
+        full_scans = [line for line in plan if line.startswith('SCAN') and 'USING' not in line]
+    else:
+        rows = db.session.execute(text('EXPLAIN ' + sql)).all()
+        plan = [row[0] for row in rows]
+        full_scans = [line for line in plan if 'Seq Scan' in line]
+    return plan, full_scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--database-uri', help='Banco a usar (padrão: SQLite temporário)')
+    args = parser.parse_args()
+
+    database_uri = args.database_uri
+    if database_uri is None:
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='query-plans-'), 'plans.db')
+
+    app = make_app(database_uri)
+    with app.app_context():
+        run_migrations(db.engine, echo=lambda message: None)
+        if User.query.count() < args.users:
+            print(f'Populando {args.users} usuários...')
+            seed(args.users)
+        # Atualiza as estatísticas usadas pelo otimizador
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+        failures = 0
+        for name, query in hot_queries(args.users // 2).items():
+            plan, full_scans = explain(query)
+            status = 'FAIL' if full_scans else 'ok'
+            failures += bool(full_scans)
+            print(f'[{status}] {name}')
+            for line in plan:
+                print(f'        {line}')
+
+    if failures:
+        print(f'{failures} consulta(s) sem índice.')
+        sys.exit(1)
+    print('Todas as consultas usam índices.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Utilitários compartilhados pelos benchmarks."""
+
+import json
+import os
+import platform
+import statistics
+import time
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def timed(func, *args, **kwargs):
+    """Executa ``func`` e retorna (resultado, segundos)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def measure(func, number=1000, repeat=5):
+    """
+    Executa ``func()`` ``number`` vezes em cada uma das ``repeat`` rodadas.
+    Retorna o tempo por chamada (mediana e melhor rodada, em µs) e chamadas por segundo.
+    """
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        per_call.append((time.perf_counter() - start) / number)
+    median = statistics.median(per_call)
+    return {'calls': number * repeat, 'median_us': median * 1e6, 'best_us': min(per_call) * 1e6,
+            'ops_per_sec': 1 / median if median else float('inf')}
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Percentis de ``values`` (lista não vazia), como {'p50': ..., 'p95': ...}"""
+    ordered = sorted(values)
+    return {f'p{point}': ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] for point in points}
+
+
+def bench_app():
+    """Aplicação de ``app.py`` com o banco de ``DATABASE_URI`` já inicializado (``flask init-db``)"""
+    from app import app, init_db
+    with app.app_context():
+        init_db()
+    return app
+
+
+def write_results(name, results, output=None, config=None):
+    """
+    Grava os resultados em JSON (``benchmarks/results/<name>-<data>.json``) e retorna o caminho.
+    ``config`` registra os parâmetros da execução, para comparar execuções equivalentes.
+    """
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        output = os.path.join(RESULTS_DIR, f'{name}-{stamp}.json')
+    document = {
+        'benchmark': name,
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'config': config or {},
+        'results': results
+    }
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f'Resultados salvos em {output}')
+    return output
+
+
+def print_table(rows, columns):
+    """Imprime uma lista de dicionários como tabela simples"""
+    widths = [max(len(col), *(len(_fmt(row.get(col))) for row in rows)) for col in columns]
+    print('  '.join(col.ljust(w) for col, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(_fmt(row.get(col)).ljust(w) for col, w in zip(columns, widths)))
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f'{value:.3f}'
+    return str(value)
@@ -0,0 +1,80 @@
+"""
+Compara dois arquivos de resultados gravados por ``write_results``.
+
+As linhas são casadas pelos campos de texto (por exemplo ``endpoint`` +
+``method`` ou ``function`` + ``case``) e, para cada campo numérico, mostra o
+valor antigo, o novo e a variação. Variações acima de ``--threshold`` em
+campos de tempo (``*_ms``, ``*_us``, ``seconds``) são marcadas como
+regressão; o código de saída é 1 se houver alguma.
+
+Uso:
+    python -m benchmarks.compare benchmarks/results/routes-A.json benchmarks/results/routes-B.json
+    python -m benchmarks.compare antigo.json novo.json --fields p95_ms,mean_ms --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks.common import print_table
+
+TIME_SUFFIXES = ('_ms', '_us', 'seconds')
+
+
+def row_key(row):
+    return tuple((field, value) for field, value in row.items() if isinstance(value, str))
+
+
+def numeric_fields(row):
+    return [field for field, value in row.items() if isinstance(value, (int, float)) and not isinstance(value, bool)]
+
+
+def compare(old, new, fields=None, threshold=0.1):
+    """Linhas da comparação e quantidade de regressões"""
+    old_rows = {row_key(row): row for row in old['results']}
+    rows = []
+    regressions = 0
+    for row in new['results']:
+        key = row_key(row)
+        previous = old_rows.get(key)
+        if previous is None:
+            continue
+        label = ' '.join(value for _, value in key)
+        for field in fields or numeric_fields(row):
+            before, after = previous.get(field), row.get(field)
+            if not isinstance(before, (int, float)) or not isinstance(after, (int, float)):
+                continue
+            change = (after - before) / before if before else 0.0
+            regression = field.endswith(TIME_SUFFIXES) and change > threshold
+            regressions += regression
+            rows.append({'row': label, 'field': field, 'old': before, 'new': after,
+                         'change': f'{change:+.1%}', 'flag': 'REGRESSÃO' if regression else ''})
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--fields', help='Campos numéricos a comparar (padrão: todos)')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Piora relativa tolerada nos tempos')
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if old['benchmark'] != new['benchmark']:
+        parser.error(f'benchmarks diferentes: {old["benchmark"]} e {new["benchmark"]}')
+    if old.get('config') != new.get('config'):
+        print(f'Atenção: parâmetros diferentes\n  antigo: {old.get("config")}\n  novo:   {new.get("config")}')
+
+    rows, regressions = compare(old, new, args.fields.split(',') if args.fields else None, args.threshold)
+    print_table(rows, ['row', 'field', 'old', 'new', 'change', 'flag'])
+    if regressions:
+        print(f'{regressions} regressão(ões) acima de {args.threshold:.0%}.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
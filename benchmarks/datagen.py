@@ -0,0 +1,183 @@
+"""
+Gerador determinístico de fãs sintéticos para benchmarks e testes de carga.
+
+Cada fã ``i`` (a partir de 1) tem ``username`` ``fan{i}``, e-mail
+``fan{i}@example.com``, senha ``PASSWORD`` e um CPF válido derivado de
+``i`` (``cpf_for``), além de perfil com jogos/times/eventos das opções do
+``ProfileForm``, de 1 a 3 documentos (``digest_for``), contas sociais
+(``fan{i}_{plataforma}``) e perfis de e-sports. A mesma semente e o mesmo
+``i`` geram sempre os mesmos dados, independentemente do tamanho do lote,
+então bases de 10k, 100k e 1M são prefixos umas das outras.
+
+A inserção usa INSERTs em lote direto na conexão (sem o ORM) e termina
+reconstruindo ``fan_stat``, que os hooks da sessão não veem nesse caminho.
+
+Uso:
+    python -m benchmarks.datagen --scale 100k --database-uri sqlite:////tmp/fans.db
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import func, insert, select, text
+
+from fan_stats import rebuild as rebuild_fan_stats
+from forms import DocumentUploadForm, EsportsProfileForm, ProfileForm, SocialAccountForm
+from hashing import DEFAULT_METHOD, hash_password, normalize_method
+from models import db, User, Profile, ProfileGame, ProfileTeam, ProfileEvent, Document, SocialAccount, EsportsProfile
+
+SCALES = {'10k': 10000, '100k': 100000, '1m': 1000000}
+PASSWORD = 'senha-de-teste-123'
+
+GAMES = [code for code, _ in ProfileForm.favorite_games.kwargs['choices'] if code != 'other']
+TEAMS = [code for code, _ in ProfileForm.favorite_teams.kwargs['choices']]
+EVENTS = [code for code, _ in ProfileForm.events_attended.kwargs['choices'] if code != 'other']
+DOC_TYPES = [code for code, _ in DocumentUploadForm.doc_type.kwargs['choices']]
+SOCIAL_PLATFORMS = [code for code, _ in SocialAccountForm.platform.kwargs['choices']]
+ESPORTS_PLATFORMS = [code for code, _ in EsportsProfileForm.platform.kwargs['choices'] if code != 'other']
+
+FIRST_NAMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+               'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sofia', 'Thiago', 'Vitória', 'Yuri']
+LAST_NAMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima', 'Gomes',
+              'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Araújo']
+CITIES = ['São Paulo, SP', 'Rio de Janeiro, RJ', 'Belo Horizonte, MG', 'Curitiba, PR', 'Porto Alegre, RS',
+          'Recife, PE', 'Salvador, BA', 'Fortaleza, CE', 'Brasília, DF', 'Goiânia, GO']
+CREATED_START = datetime(2023, 1, 1)
+
+# Textos livres do perfil, com termos raros e comuns para a busca textual
+STORY_FRAGMENTS = ['Vi o arT jogar ao vivo na IEM Rio.', 'Chorei com a campanha no Major de Antuérpia.',
+                   'Acompanho o KSCERATO desde o começo.', 'Meu primeiro campeonato foi a ESL Pro League.',
+                   'Assisto todas as partidas com meus irmãos.', 'Já fui em três finais de campeonatos.',
+                   'Comecei jogando Counter-Strike com amigos da escola.', 'Sou fã do yuurih e do FalleN.',
+                   'Joguei competitivo de Valorant por dois anos.', 'Coleciono camisas oficiais das temporadas.',
+                   'A torcida na arena é a melhor do mundo.', 'Faço cosplay nos eventos de e-sports.']
+OTHER_GAMES = ['', '', 'Dota 2', 'Fortnite', 'PUBG', 'Free Fire', 'Apex Legends']
+OTHER_EVENTS = ['', '', '', 'Gamescom Latam', 'Brasil Game Show', 'CCXP', 'BLAST Premier em Lisboa']
+
+
+def cpf_for(i):
+    """CPF válido (11 dígitos) do fã ``i``: os 9 primeiros dígitos são ``i``"""
+    digits = [int(d) for d in f'{i:09d}']
+    for weights in (range(10, 1, -1), range(11, 1, -1)):
+        digit = sum(d * w for d, w in zip(digits, weights)) * 10 % 11
+        digits.append(0 if digit == 10 else digit)
+    return ''.join(str(d) for d in digits)
+
+
+def digest_for(i, n=0):
+    """SHA-256 fictício do ``n``-ésimo documento do fã ``i``"""
+    return hashlib.sha256(f'fan{i}-document{n}'.encode('ascii')).hexdigest()
+
+
+def generate(start, stop, seed=42):
+    """
+    Linhas dos fãs ``start`` a ``stop - 1``, por tabela. Cada fã usa um
+    gerador próprio, então o resultado não depende de como os lotes são cortados.
+    """
+    rows = {model: [] for model in (User, Profile, ProfileGame, ProfileTeam, ProfileEvent, Document,
+                                    SocialAccount, EsportsProfile)}
+    for i in range(start, stop):
+        rng = random.Random(f'{seed}-{i}')
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        games = rng.sample(GAMES, rng.randint(1, 4))
+        teams = rng.sample(TEAMS, rng.randint(1, 3))
+        events = rng.sample(EVENTS, rng.randint(0, 3))
+        created_at = CREATED_START + timedelta(minutes=i)
+        # Gerador separado: os textos não alteram os demais dados gerados
+        text_rng = random.Random(f'{seed}-{i}-text')
+        story = ' '.join(text_rng.sample(STORY_FRAGMENTS, text_rng.randint(1, 3)))
+
+        rows[User].append({
+            'id': i, 'username': f'fan{i}', 'email': f'fan{i}@example.com', 'cpf': cpf_for(i),
+            'name': f'{first} {last}', 'address': f'Rua {rng.randint(1, 999)}, {rng.choice(CITIES)}',
+            'birth_date': date(rng.randint(1970, 2008), rng.randint(1, 12), rng.randint(1, 28)),
+            'created_at': created_at,
+        })
+        rows[Profile].append({
+            'id': i, 'user_id': i, 'interests': ', '.join(games),
+            'fan_story': f'Torcedor da FURIA desde {rng.randint(2017, 2024)}. {story}',
+            'other_games': text_rng.choice(OTHER_GAMES) or None, 'other_events': text_rng.choice(OTHER_EVENTS) or None,
+            'favorite_games': ','.join(games), 'favorite_teams': ','.join(teams), 'events_attended': ','.join(events),
+            'purchases': ', '.join(rng.sample(['camisa', 'ingresso', 'skin', 'moletom', 'boné'], rng.randint(0, 3))),
+        })
+        rows[ProfileGame].extend({'profile_id': i, 'game': game} for game in games)
+        rows[ProfileTeam].extend({'profile_id': i, 'team': team} for team in teams)
+        rows[ProfileEvent].extend({'profile_id': i, 'event': event} for event in events)
+        for n, doc_type in enumerate(rng.sample(DOC_TYPES, rng.randint(1, 3))):
+            verified = rng.random() < 0.6
+            rows[Document].append({
+                'user_id': i, 'filename': f'{digest_for(i, n)}.jpg', 'doc_type': doc_type, 'digest': digest_for(i, n),
+                'upload_date': created_at, 'verified': verified, 'verification_date': created_at if verified else None,
+            })
+        rows[SocialAccount].extend({
+            'user_id': i, 'platform': platform, 'username': f'fan{i}_{platform}', 'account_id': f'{platform}-{i}',
+        } for platform in rng.sample(SOCIAL_PLATFORMS, rng.randint(0, 3)))
+        rows[EsportsProfile].extend({
+            'user_id': i, 'platform': platform, 'profile_url': f'https://{platform}.example.com/fan{i}',
+            'username': f'fan{i}', 'verified': rng.random() < 0.3, 'relevance_score': round(rng.random(), 3),
+        } for platform in rng.sample(ESPORTS_PLATFORMS, rng.randint(0, 2)))
+    return rows
+
+
+def seed(users, batch_size=5000, seed=42, password_method=DEFAULT_METHOD, progress=None):
+    """Insere os fãs 1..``users`` que ainda não existem. Retorna a quantidade inserida"""
+    # Um único hash (do mesmo algoritmo da aplicação) serve para todos os fãs
+    password_hash = hash_password(normalize_method(password_method), PASSWORD)
+    existing = db.session.execute(select(func.max(User.id))).scalar() or 0
+    for start in range(existing + 1, users + 1, batch_size):
+        stop = min(start + batch_size, users + 1)
+        rows = generate(start, stop, seed)
+        for user in rows[User]:
+            user['password_hash'] = password_hash
+        for model, model_rows in rows.items():
+            if model_rows:
+                db.session.execute(insert(model), model_rows)
+        db.session.commit()
+        if progress:
+            progress(stop - 1)
+    with db.engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Os ids foram informados explicitamente: as sequências precisam acompanhar
+            for table in (User.__table__, Profile.__table__):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+                                  f"(SELECT COALESCE(MAX(id), 1) FROM \"{table.name}\"))"))
+        rebuild_fan_stats(conn)
+    return max(users - existing, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    parser.add_argument('--users', type=int, help='Quantidade exata de fãs (em vez de --scale)')
+    parser.add_argument('--database-uri', help='Banco a popular (padrão: SQLite temporário)')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from migrations import run_migrations
+
+    users = args.users or SCALES[args.scale]
+    database_uri = args.database_uri or \
+        'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='datagen-'), 'fans.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        run_migrations(db.engine, echo=lambda message: None)
+        start = time.perf_counter()
+        inserted = seed(users, args.batch_size, args.seed,
+                        progress=lambda last: print(f'  {last} fãs', end='\r', flush=True))
+        elapsed = time.perf_counter() - start
+    print()
+    print(f'{inserted} fãs inseridos em {elapsed:.1f}s ({inserted / elapsed if elapsed else 0:.0f}/s) em {database_uri}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""Backends locais que simulam a latência das APIs externas."""
+
+import time
+
+from ai_services import SocialMediaAnalyzer
+
+
+class StubSocialMediaAnalyzer:
+    """Mesma resposta do ``SocialMediaAnalyzer``, com latência artificial por chamada"""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+
+    def analyze_social_profile(self, platform, username, access_token=None):
+        time.sleep(self.latency)
+        return SocialMediaAnalyzer.analyze_social_profile(platform, username, access_token)
+
@@ -0,0 +1,106 @@
+"""
+Usuários alterados em cada flush da sessão.
+
+Vários módulos mantêm dados derivados por usuário (cópia do usuário
+autenticado em ``identity``, bitmaps de ``segments``, ``score_dirty`` de
+``scoring``) e precisam saber quais usuários uma transação alterou. Um único
+hook ``after_flush`` percorre ``new``/``dirty``/``deleted`` uma vez, resolve
+os perfis das escolhas (``ProfileGame``/``ProfileTeam``/``ProfileEvent``) com
+uma só consulta e entrega a cada assinante os ids dos usuários cujos modelos
+de interesse mudaram:
+
+- ``after_flush(session, user_ids)`` na mesma transação (para gravar algo junto);
+- ``after_commit(user_ids)`` com tudo o que a transação alterou, depois do
+  commit; um rollback descarta o acumulado.
+"""
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import User, Profile, ProfileGame, ProfileTeam, ProfileEvent
+
+# Escolhas do perfil: o usuário vem do Profile (uma consulta por flush)
+PROFILE_LINK_MODELS = (ProfileGame, ProfileTeam, ProfileEvent)
+
+
+class Subscription:
+    def __init__(self, models, after_flush, after_commit):
+        self.models = tuple(models)
+        self.after_flush = after_flush
+        self.after_commit = after_commit
+
+
+class ChangedUsers:
+    """Coleta os usuários alterados por flush e os distribui aos assinantes"""
+
+    def __init__(self):
+        self.subscriptions = []
+
+    def subscribe(self, models, after_flush=None, after_commit=None):
+        """Registra os callbacks para mudanças em ``models`` (repetir o registro não duplica)"""
+        for subscription in self.subscriptions:
+            if (subscription.after_flush, subscription.after_commit) == (after_flush, after_commit):
+                return
+        self.subscriptions.append(Subscription(models, after_flush, after_commit))
+        if not event.contains(Session, 'after_flush', _collect):
+            event.listen(Session, 'after_flush', _collect)
+            event.listen(Session, 'after_commit', _dispatch_commit)
+            event.listen(Session, 'after_rollback', _discard)
+
+    def collect(self, session):
+        """``{modelo: ids dos usuários}`` das mudanças pendentes no flush atual"""
+        by_model = {}
+        profile_ids = {}
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            model = type(obj)
+            if isinstance(obj, User):
+                user_id = obj.id
+            elif isinstance(obj, PROFILE_LINK_MODELS):
+                profile_ids.setdefault(model, set()).add(obj.profile_id)
+                continue
+            else:
+                user_id = getattr(obj, 'user_id', None)
+            if user_id is not None:
+                by_model.setdefault(model, set()).add(user_id)
+
+        wanted = {model for subscription in self.subscriptions for model in subscription.models}
+        pending = set().union(*(ids for model, ids in profile_ids.items() if model in wanted)) - {None}
+        if pending:
+            owners = dict(session.connection().execute(
+                select(Profile.id, Profile.user_id).where(Profile.id.in_(pending))
+            ).all())
+            for model, ids in profile_ids.items():
+                user_ids = {owners.get(profile_id) for profile_id in ids} - {None}
+                if user_ids:
+                    by_model[model] = user_ids
+        return by_model
+
+
+changed_users = ChangedUsers()
+
+
+def _collect(session, flush_context):
+    by_model = changed_users.collect(session)
+    if not by_model:
+        return
+    for index, subscription in enumerate(changed_users.subscriptions):
+        user_ids = set()
+        for model in subscription.models:
+            user_ids.update(by_model.get(model, ()))
+        if not user_ids:
+            continue
+        if subscription.after_flush is not None:
+            subscription.after_flush(session, user_ids)
+        if subscription.after_commit is not None:
+            session.info.setdefault('changed_users', {}).setdefault(index, set()).update(user_ids)
+
+
+def _dispatch_commit(session):
+    pending = session.info.pop('changed_users', None)
+    if pending:
+        for index, user_ids in pending.items():
+            changed_users.subscriptions[index].after_commit(user_ids)
+
+
+def _discard(session):
+    session.info.pop('changed_users', None)
@@ -0,0 +1,80 @@
+"""
+CPF: forma canônica, dígitos verificadores e validação em lote.
+
+No banco o CPF é guardado só com os 11 dígitos (``User.cpf``, único e
+indexado); a pontuação ``000.000.000-00`` é apenas para exibição. Assim
+"123.456.789-09" e "12345678909" são a mesma chave e as buscas por CPF usam o
+índice.
+
+``validate_batch`` confere os dígitos verificadores de muitos CPFs de uma vez
+com NumPy (importações em massa, consultas administrativas); ``is_valid`` é o
+mesmo algoritmo para um único valor.
+"""
+
+import re
+
+import numpy as np
+
+NON_DIGITS = re.compile(r'[^0-9]')
+
+# Pesos dos dois dígitos verificadores (10..2 sobre os 9 primeiros, 11..2 sobre os 10 primeiros)
+FIRST_WEIGHTS = np.arange(10, 1, -1)
+SECOND_WEIGHTS = np.arange(11, 1, -1)
+
+
+def normalize(value):
+    """Só os dígitos do CPF, ou None se não houver nenhum"""
+    if value is None:
+        return None
+    digits = NON_DIGITS.sub('', str(value))
+    return digits or None
+
+
+def format_cpf(value):
+    """``12345678909`` -> ``123.456.789-09`` (valores que não têm 11 dígitos voltam como estão)"""
+    digits = normalize(value)
+    if digits is None or len(digits) != 11:
+        return value
+    return f'{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}'
+
+
+def _check_digit(total):
+    digit = (total * 10) % 11
+    return 0 if digit == 10 else digit
+
+
+def is_valid(value):
+    """Confere o tamanho e os dígitos verificadores de um CPF (com ou sem pontuação)"""
+    digits = normalize(value)
+    if digits is None or len(digits) != 11 or digits == digits[0] * 11:
+        return False
+    numbers = [int(d) for d in digits]
+    if numbers[9] != _check_digit(sum(n * w for n, w in zip(numbers[:9], range(10, 1, -1)))):
+        return False
+    return numbers[10] == _check_digit(sum(n * w for n, w in zip(numbers[:10], range(11, 1, -1))))
+
+
+def validate_batch(values):
+    """
+    Valida uma sequência de CPFs (com ou sem pontuação) de uma vez.
+    Retorna ``(canonicos, validos)``: a lista de valores normalizados e um
+    array booleano alinhado com ``values``.
+    """
+    canonical = [normalize(value) for value in values]
+    valid = np.zeros(len(canonical), dtype=bool)
+    positions = [i for i, digits in enumerate(canonical) if digits is not None and len(digits) == 11]
+    if not positions:
+        return canonical, valid
+
+    # Matriz (n, 11) com um dígito por coluna
+    joined = ''.join(canonical[i] for i in positions).encode('ascii')
+    digits = (np.frombuffer(joined, dtype=np.uint8) - ord('0')).reshape(-1, 11).astype(np.int64)
+
+    first = (digits[:, :9] @ FIRST_WEIGHTS) * 10 % 11
+    first[first == 10] = 0
+    second = (digits[:, :10] @ SECOND_WEIGHTS) * 10 % 11
+    second[second == 10] = 0
+    repeated = (digits == digits[:, :1]).all(axis=1)
+
+    valid[positions] = (digits[:, 9] == first) & (digits[:, 10] == second) & ~repeated
+    return canonical, valid
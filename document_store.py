@@ -0,0 +1,177 @@
+"""
+Armazenamento de documentos endereçado por conteúdo.
+
+Cada arquivo é identificado pelo SHA-256 do seu conteúdo: reenvios do mesmo
+RG/CPF reaproveitam o arquivo já gravado (``StoredBlob`` conta quantos
+``Document`` apontam para ele) e o resultado de verificação já obtido para o
+mesmo nome/CPF esperado (``VerificationCache``).
+
+O registro guarda o nome do primeiro arquivo gravado para o conteúdo; o
+mesmo conteúdo enviado com outra extensão (``rg.png`` e depois ``rg.jpg``)
+passa a usar esse arquivo, e a cópia recém-gravada é apagada.
+
+A referência é adquirida explicitamente (``acquire_blob``) ao criar o
+``Document`` e liberada automaticamente quando ele é apagado ou passa a
+apontar para outro arquivo; o arquivo só sai do disco depois do commit, se
+nenhum ``Document`` voltou a usá-lo nesse meio tempo.
+"""
+
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, event, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Document, StoredBlob, VerificationCache
+from phash import document_hashes
+from storage import storage
+
+DOCUMENTS_FOLDER = 'documents'
+
+
+def store_document(file_storage):
+    """Grava o upload (se ainda não existir) e retorna o ``StoredFile``"""
+    _, extension = os.path.splitext(file_storage.filename)
+    return storage.save_hashed(file_storage.stream, DOCUMENTS_FOLDER, extension)
+
+
+def acquire_blob(stored):
+    """
+    Incrementa a contagem de referências do arquivo, criando o registro se
+    necessário. Retorna o ``StoredFile`` com o nome registrado para o conteúdo,
+    que é o que o ``Document`` deve guardar.
+    """
+    if not _increment(stored.digest, 1):
+        try:
+            with db.session.begin_nested():
+                db.session.add(StoredBlob(
+                    digest=stored.digest,
+                    folder=DOCUMENTS_FOLDER,
+                    filename=stored.filename,
+                    size=stored.size,
+                    ref_count=1
+                ))
+            return stored
+        except IntegrityError:
+            # Outra requisição criou o registro ao mesmo tempo
+            _increment(stored.digest, 1)
+    filename = db.session.execute(select(StoredBlob.filename).where(StoredBlob.digest == stored.digest)).scalar()
+    if filename != stored.filename:
+        # Mesmo conteúdo com outra extensão: fica só o arquivo já registrado
+        if stored.created:
+            storage.delete(DOCUMENTS_FOLDER, stored.filename)
+        stored = stored._replace(filename=filename)
+    return stored
+
+
+def release_blob(digest, connection=None, session=None):
+    """
+    Decrementa a contagem de referências; quando ninguém mais usa o arquivo o
+    registro é removido e o arquivo é apagado depois do commit da sessão.
+    """
+    connection = connection if connection is not None else db.session.connection()
+    session = session if session is not None else db.session()
+    connection.execute(
+        update(StoredBlob)
+        .where(StoredBlob.digest == digest)
+        .values(ref_count=StoredBlob.ref_count - 1)
+    )
+    blob = connection.execute(
+        select(StoredBlob.folder, StoredBlob.filename)
+        .where(StoredBlob.digest == digest, StoredBlob.ref_count <= 0)
+    ).first()
+    if blob is not None:
+        connection.execute(delete(StoredBlob).where(StoredBlob.digest == digest, StoredBlob.ref_count <= 0))
+        session.info.setdefault('released_blobs', []).append((digest, blob.folder, blob.filename))
+
+
+@event.listens_for(Document, 'after_delete')
+def _release_deleted_document(mapper, connection, document):
+    if document.digest:
+        release_blob(document.digest, connection, object_session(document))
+
+
+@event.listens_for(Document, 'after_update')
+def _release_replaced_document(mapper, connection, document):
+    # Trocar o arquivo de um Document libera o anterior; o novo é adquirido por quem o trocou
+    previous = inspect(document).attrs.digest.history.deleted
+    if previous and previous[0] and previous[0] != document.digest:
+        release_blob(previous[0], connection, object_session(document))
+
+
+@event.listens_for(Session, 'after_commit')
+def _delete_released_files(session):
+    released = session.info.pop('released_blobs', None)
+    if not released:
+        return
+    with db.engine.connect() as connection:
+        for digest, folder, filename in released:
+            # Um upload do mesmo arquivo depois da liberação recriou o registro: o arquivo fica
+            in_use = connection.execute(
+                select(StoredBlob.digest).where(StoredBlob.digest == digest, StoredBlob.filename == filename)
+            ).first()
+            if in_use is None:
+                storage.delete(folder, filename)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_released_files(session):
+    session.info.pop('released_blobs', None)
+
+
+def _increment(digest, delta):
+    return db.session.execute(
+        update(StoredBlob)
+        .where(StoredBlob.digest == digest)
+        .values(ref_count=StoredBlob.ref_count + delta)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def cached_verification(digest, expected_name, expected_cpf):
+    """Verificação bem-sucedida já conhecida para este arquivo e dados esperados, ou None"""
+    entry = VerificationCache.query.filter_by(
+        digest=digest,
+        expected_name=expected_name or '',
+        expected_cpf=expected_cpf or ''
+    ).first()
+    if entry is None:
+        return None
+    result = json.loads(entry.result)
+    # Entradas negativas gravadas antes de só os sucessos serem guardados
+    return result if result.get('is_valid') else None
+
+
+def remember_verification(digest, expected_name, expected_cpf, result):
+    """Guarda um resultado positivo para reenvios futuros do mesmo arquivo"""
+    try:
+        with db.session.begin_nested():
+            db.session.add(VerificationCache(
+                digest=digest,
+                expected_name=expected_name or '',
+                expected_cpf=expected_cpf or '',
+                result=json.dumps(result)
+            ))
+    except IntegrityError:
+        pass
+
+
+def apply_verification(document, result):
+    """Atualiza o status do ``Document`` a partir do resultado da verificação"""
+    if result.get('is_valid'):
+        document.verified = True
+        document.verification_date = datetime.utcnow()
+
+
+def flag_duplicates(document):
+    """Registra no ``Document`` os documentos parecidos de outras contas e os retorna"""
+    if not document.phash:
+        document.possible_duplicates = None
+        return []
+    matches = document_hashes.find_similar(
+        int(document.phash, 16), exclude_user_id=document.user_id, exclude_document_id=document.id
+    )
+    document.possible_duplicates = json.dumps(matches) if matches else None
+    return matches
@@ -0,0 +1,337 @@
+"""
+Exportação em massa dos dados dos fãs para análise (CSV, NDJSON ou Parquet).
+
+Cada registro junta ``User``, ``Profile`` (com as escolhas das tabelas de
+associação), documentos, contas sociais e perfis de e-sports de um fã. Os
+usuários são lidos com um cursor no servidor (``yield_per``) e, para cada
+bloco, os dados relacionados vêm de uma consulta ``IN`` por tabela, então a
+memória usada depende do tamanho do bloco e não do número de fãs.
+
+No modo incremental só saem os fãs criados ou com conta social sincronizada
+depois da marca d'água (``created_at``/``last_sync``). A nova marca é o
+início da exportação, gravada em ``export_watermark`` quando ela termina.
+
+Parquet requer o pacote opcional ``pyarrow``.
+"""
+
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import or_, select
+
+from models import (db, User, Profile, ProfileGame, ProfileTeam, ProfileEvent, Document, SocialAccount,
+                    EsportsProfile, ExportWatermark)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow é opcional
+    pyarrow = None
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# (coluna, tipo) de cada registro exportado; listas viram texto separado por ';' no CSV
+FIELDS = [
+    ('user_id', 'int'),
+    ('username', 'str'),
+    ('email', 'str'),
+    ('name', 'str'),
+    ('birth_date', 'date'),
+    ('created_at', 'datetime'),
+    ('interests', 'str'),
+    ('fan_story', 'str'),
+    ('favorite_games', 'list'),
+    ('other_games', 'str'),
+    ('favorite_teams', 'list'),
+    ('other_teams', 'str'),
+    ('events_attended', 'list'),
+    ('other_events', 'str'),
+    ('purchases', 'str'),
+    ('documents', 'int'),
+    ('documents_verified', 'int'),
+    ('social_accounts', 'list'),
+    ('social_last_sync', 'datetime'),
+    ('esports_profiles', 'list'),
+    ('esports_verified', 'int'),
+    ('esports_max_relevance', 'float'),
+]
+
+CHOICE_TABLES = [
+    ('favorite_games', ProfileGame.__table__, 'game'),
+    ('favorite_teams', ProfileTeam.__table__, 'team'),
+    ('events_attended', ProfileEvent.__table__, 'event'),
+]
+
+
+class ExportError(ValueError):
+    """Parâmetros de exportação inválidos"""
+
+
+def fan_query(since=None):
+    """SELECT dos usuários com o perfil, em ordem de id, opcionalmente desde ``since``"""
+    query = (
+        select(User.id.label('user_id'), User.username, User.email, User.name, User.birth_date, User.created_at,
+               Profile.id.label('profile_id'), Profile.interests, Profile.fan_story, Profile.other_games,
+               Profile.other_teams, Profile.other_events, Profile.purchases)
+        .outerjoin(Profile, Profile.user_id == User.id)
+        .order_by(User.id)
+    )
+    if since is not None:
+        query = query.where(or_(
+            User.created_at > since,
+            User.id.in_(select(SocialAccount.user_id).where(SocialAccount.last_sync > since))
+        ))
+    return query
+
+
+def _group(rows, key):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row[key], []).append(row)
+    return grouped
+
+
+def _related(conn, user_ids, profile_ids):
+    """Dados relacionados de um bloco de usuários, uma consulta por tabela"""
+    choices = {}
+    for field, table, column in CHOICE_TABLES:
+        rows = conn.execute(
+            select(table.c.profile_id, table.c[column]).where(table.c.profile_id.in_(profile_ids))
+            .order_by(table.c.profile_id, table.c[column])
+        ).all() if profile_ids else []
+        choices[field] = {profile_id: [row[1] for row in group]
+                          for profile_id, group in _group(rows, 0).items()}
+    documents = _group(conn.execute(
+        select(Document.user_id, Document.verified).where(Document.user_id.in_(user_ids))
+    ).all(), 0)
+    socials = _group(conn.execute(
+        select(SocialAccount.user_id, SocialAccount.platform, SocialAccount.username, SocialAccount.last_sync)
+        .where(SocialAccount.user_id.in_(user_ids)).order_by(SocialAccount.id)
+    ).all(), 0)
+    esports = _group(conn.execute(
+        select(EsportsProfile.user_id, EsportsProfile.platform, EsportsProfile.verified,
+               EsportsProfile.relevance_score)
+        .where(EsportsProfile.user_id.in_(user_ids)).order_by(EsportsProfile.id)
+    ).all(), 0)
+    return choices, documents, socials, esports
+
+
+def iter_fan_chunks(conn, since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Gera listas de até ``chunk_size`` registros (dicts com as chaves de ``FIELDS``)"""
+    result = conn.execution_options(yield_per=chunk_size).execute(fan_query(since))
+    for rows in result.partitions():
+        user_ids = [row.user_id for row in rows]
+        profile_ids = [row.profile_id for row in rows if row.profile_id is not None]
+        choices, documents, socials, esports = _related(conn, user_ids, profile_ids)
+        records = []
+        for row in rows:
+            user_documents = documents.get(row.user_id, [])
+            user_socials = socials.get(row.user_id, [])
+            user_esports = esports.get(row.user_id, [])
+            sync_dates = [social.last_sync for social in user_socials if social.last_sync]
+            scores = [profile.relevance_score for profile in user_esports if profile.relevance_score is not None]
+            record = {
+                'user_id': row.user_id,
+                'username': row.username,
+                'email': row.email,
+                'name': row.name,
+                'birth_date': row.birth_date,
+                'created_at': row.created_at,
+                'interests': row.interests,
+                'fan_story': row.fan_story,
+                'other_games': row.other_games,
+                'other_teams': row.other_teams,
+                'other_events': row.other_events,
+                'purchases': row.purchases,
+                'documents': len(user_documents),
+                'documents_verified': sum(1 for document in user_documents if document.verified),
+                'social_accounts': [f'{social.platform}:{social.username}' for social in user_socials],
+                'social_last_sync': max(sync_dates) if sync_dates else None,
+                'esports_profiles': [profile.platform for profile in user_esports],
+                'esports_verified': sum(1 for profile in user_esports if profile.verified),
+                'esports_max_relevance': max(scores) if scores else None,
+            }
+            for field, _, _ in CHOICE_TABLES:
+                record[field] = choices[field].get(row.profile_id, [])
+            records.append(record)
+        yield records
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ';'.join(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def write_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in FIELDS])
+    for records in chunks:
+        for record in records:
+            writer.writerow([_text(record[name]) for name, _ in FIELDS])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def write_ndjson(chunks):
+    for records in chunks:
+        yield ''.join(
+            json.dumps(record, ensure_ascii=False, default=lambda value: value.isoformat()) + '\n'
+            for record in records
+        ).encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Arquivo somente-escrita cujo conteúdo é drenado a cada row group do Parquet"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_schema():
+    types = {
+        'int': pyarrow.int64(),
+        'str': pyarrow.string(),
+        'date': pyarrow.date32(),
+        'datetime': pyarrow.timestamp('us'),
+        'float': pyarrow.float64(),
+        'list': pyarrow.list_(pyarrow.string()),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, kind in FIELDS])
+
+
+def write_parquet(chunks):
+    """Um row group por bloco; os bytes saem à medida que cada row group é gravado"""
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for records in chunks:
+            writer.write_table(pyarrow.Table.from_pylist(records, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# formato -> (gerador de bytes, mimetype, extensão)
+FORMATS = {
+    'csv': (write_csv, 'text/csv', 'csv'),
+    'ndjson': (write_ndjson, 'application/x-ndjson', 'ndjson'),
+    'parquet': (write_parquet, 'application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def get_format(name):
+    if name not in FORMATS:
+        raise ExportError(f"Formato inválido: {name} (use {', '.join(FORMATS)})")
+    if name == 'parquet' and pyarrow is None:
+        raise ExportError("O formato parquet requer o pacote pyarrow")
+    return FORMATS[name]
+
+
+def parse_since(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Data inválida: {value} (use ISO 8601, ex.: 2025-01-31T00:00:00)")
+
+
+def get_watermark(name):
+    row = db.session.get(ExportWatermark, name)
+    return row.watermark if row else None
+
+
+def set_watermark(name, watermark, rows):
+    row = db.session.get(ExportWatermark, name)
+    if row is None:
+        row = ExportWatermark(name=name)
+        db.session.add(row)
+    row.watermark = watermark
+    row.rows = rows
+    row.updated_at = datetime.utcnow()
+    db.session.commit()
+
+
+def export_fans(fmt, since=None, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Gera os bytes da exportação no formato ``fmt``. A conexão fica aberta
+    apenas enquanto o gerador é consumido. ``stats['rows']`` recebe o total.
+    """
+    write, _, _ = get_format(fmt)
+
+    def counted(chunks):
+        for records in chunks:
+            if stats is not None:
+                stats['rows'] = stats.get('rows', 0) + len(records)
+            yield records
+
+    with db.engine.connect() as conn:
+        yield from write(counted(iter_fan_chunks(conn, since, chunk_size)))
+
+
+@click.command('export-fans')
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv')
+@click.option('--output', '-o', default='-', help='Output file (default: stdout).')
+@click.option('--since', help='Only fans created or synced after this ISO timestamp.')
+@click.option('--incremental', metavar='NAME', help='Export since the stored watermark NAME and advance it.')
+@click.option('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, show_default=True)
+@with_appcontext
+def export_fans_command(fmt, output, since, incremental, chunk_size):
+    """Export joined fan records as CSV, NDJSON or Parquet."""
+    try:
+        since = parse_since(since)
+        get_format(fmt)
+    except ExportError as e:
+        raise click.UsageError(str(e))
+    if incremental and since is None:
+        since = get_watermark(incremental)
+
+    started = datetime.utcnow()
+    stats = {'rows': 0}
+    stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    try:
+        for data in export_fans(fmt, since, chunk_size, stats):
+            stream.write(data)
+    finally:
+        if stream is not sys.stdout.buffer:
+            stream.close()
+    if incremental:
+        set_watermark(incremental, started, stats['rows'])
+    click.echo(f"Exported {stats['rows']} fans"
+               + (f" changed since {since.isoformat()}" if since else '')
+               + (f"; watermark {incremental} = {started.isoformat()}" if incremental else ''), err=True)
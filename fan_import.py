@@ -0,0 +1,423 @@
+"""
+Importação em massa de fãs (listas de ingressos de eventos, por exemplo).
+
+``flask import-fans fas.csv`` lê o arquivo (CSV ou NDJSON) em fluxo e o
+processa em blocos. Para cada bloco:
+
+* valida e normaliza e-mails e CPFs de uma vez (``cpf.validate_batch``) e as
+  escolhas (jogos, times, eventos) contra as opções do ``ProfileForm``; e-mails,
+  usernames e CPFs repetidos — no arquivo ou já cadastrados, com uma consulta
+  ``IN`` por coluna única — são rejeitados;
+* calcula os hashes das senhas informadas num pool de processos; quem não tem
+  senha recebe um convite (``FanInvite``) cujo token vai para o arquivo de
+  convites, para ser enviado por e-mail;
+* insere ``User``, ``Profile``, escolhas e convites com INSERTs em lote, numa
+  transação por bloco.
+
+Depois de cada bloco confirmado o progresso vai para o arquivo de
+checkpoint: rodar o mesmo comando de novo continua do último bloco. Linhas
+rejeitadas vão para um arquivo NDJSON com o número da linha e os motivos.
+
+O hash de senha (scrypt) custa dezenas de milissegundos de CPU por fã; listas
+grandes devem vir sem a coluna ``password`` e usar os convites.
+"""
+
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import secrets
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice, repeat
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select
+
+from cpf import validate_batch
+from fan_stats import apply_deltas
+from forms import ProfileForm, RegistrationForm
+from hashing import hash_password, password_hasher
+from models import db, normalize_email, User, Profile, ProfileGame, ProfileTeam, ProfileEvent, FanInvite
+
+DEFAULT_CHUNK_SIZE = 1000
+INVITE_DAYS = 30
+
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[a-z0-9-]{2,}$')
+USERNAME_INVALID = re.compile(r'[^a-z0-9_.]+')
+LIST_SEPARATORS = re.compile(r'[;,]')
+
+TEXT_FIELDS = ['interests', 'fan_story', 'other_games', 'other_teams', 'other_events', 'purchases']
+
+# Tamanho máximo por campo: o das colunas String de User; os textos livres do Profile são
+# Text no banco e ganham um limite só para a importação
+MAX_LENGTHS = dict(
+    {column: User.__table__.c[column].type.length for column in ('email', 'name', 'address')},
+    **{field: 5000 for field in TEXT_FIELDS}
+)
+# Os mesmos limites do cadastro pelo site
+USERNAME_MIN, USERNAME_MAX = next(
+    (validator.min, validator.max) for validator in RegistrationForm.username.kwargs['validators']
+    if hasattr(validator, 'max')
+)
+
+# campo -> (tabela de associação, coluna); os códigos válidos são as opções do ProfileForm
+CHOICE_FIELDS = {
+    'favorite_games': (ProfileGame.__table__, 'game'),
+    'favorite_teams': (ProfileTeam.__table__, 'team'),
+    'events_attended': (ProfileEvent.__table__, 'event'),
+}
+CHOICES = {field: {code for code, _ in getattr(ProfileForm, field).kwargs['choices']} for field in CHOICE_FIELDS}
+
+
+class FanImportError(ValueError):
+    """Arquivo ou checkpoint inválido para a importação"""
+
+
+def invite_token_hash(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def detect_format(path, fmt=None):
+    fmt = fmt or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        raise FanImportError(f"Formato inválido: {fmt} (use csv ou ndjson)")
+    return fmt
+
+
+def read_rows(f, fmt):
+    """Gera os registros do arquivo, um dict por linha de dados"""
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            row = {'__invalid__': f'JSON inválido: {e.msg}'}
+        yield row if isinstance(row, dict) else {'__invalid__': 'a linha não é um objeto JSON'}
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def parse_list(value):
+    if value is None:
+        return []
+    items = value if isinstance(value, list) else LIST_SEPARATORS.split(str(value))
+    return list(dict.fromkeys(str(item).strip() for item in items if str(item).strip()))
+
+
+def parse_date(value):
+    value = _text(value)
+    if value is None:
+        return None
+    for pattern in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, pattern).date()
+        except ValueError:
+            pass
+    raise ValueError(value)
+
+
+def derive_username(email):
+    """Username para linhas sem um: parte local do e-mail e um sufixo estável"""
+    local = USERNAME_INVALID.sub('_', email.split('@')[0].lower()).strip('_') or 'fan'
+    suffix = hashlib.sha1(email.encode('utf-8')).hexdigest()[:6]
+    return f'{local[:USERNAME_MAX - len(suffix) - 1]}_{suffix}'
+
+
+def validate_chunk(conn, numbered_rows):
+    """
+    Valida um bloco de ``(linha, registro)``.
+    Retorna ``(registros válidos normalizados, rejeições)``.
+    """
+    canonical_cpfs, valid_cpfs = validate_batch([row.get('cpf') for _, row in numbered_rows])
+    records = []
+    rejects = []
+    seen = {'email': set(), 'username': set(), 'cpf': set()}
+    for (line, row), cpf_value, cpf_ok in zip(numbered_rows, canonical_cpfs, valid_cpfs):
+        if '__invalid__' in row:
+            rejects.append({'line': line, 'errors': [row['__invalid__']]})
+            continue
+        errors = []
+        email = normalize_email(_text(row.get('email'))) or ''
+        if not EMAIL_PATTERN.match(email) or len(email) > MAX_LENGTHS['email']:
+            errors.append('e-mail inválido')
+        username = _text(row.get('username')) or derive_username(email)
+        if not USERNAME_MIN <= len(username) <= USERNAME_MAX:
+            errors.append(f'username deve ter de {USERNAME_MIN} a {USERNAME_MAX} caracteres')
+        password = _text(row.get('password'))
+        if password is not None and len(password) < 6:
+            errors.append('senha deve ter ao menos 6 caracteres')
+        cpf = None
+        if _text(row.get('cpf')):
+            if cpf_ok:
+                cpf = cpf_value
+            else:
+                errors.append('CPF inválido')
+        try:
+            birth_date = parse_date(row.get('birth_date'))
+        except ValueError:
+            errors.append('data de nascimento inválida (use AAAA-MM-DD ou DD/MM/AAAA)')
+            birth_date = None
+        choices = {}
+        for field in CHOICE_FIELDS:
+            choices[field] = parse_list(row.get(field))
+            unknown = [code for code in choices[field] if code not in CHOICES[field]]
+            if unknown:
+                errors.append(f"{field}: opções desconhecidas {', '.join(unknown)}")
+
+        record = {
+            'line': line,
+            'email': email,
+            'username': username,
+            'cpf': cpf,
+            'name': _text(row.get('name')),
+            'address': _text(row.get('address')),
+            'birth_date': birth_date,
+            'password': password,
+            'choices': choices,
+        }
+        record.update({field: _text(row.get(field)) for field in TEXT_FIELDS})
+        for field, max_length in MAX_LENGTHS.items():
+            if field != 'email' and record[field] and len(record[field]) > max_length:
+                errors.append(f'{field} com mais de {max_length} caracteres')
+        for key, values in seen.items():
+            if record[key] and record[key] in values:
+                errors.append(f'{key} repetido no arquivo')
+        if errors:
+            rejects.append({'line': line, 'email': email or None, 'errors': errors})
+            continue
+        for key, values in seen.items():
+            if record[key]:
+                values.add(record[key])
+        records.append(record)
+
+    # Já cadastrados: uma consulta IN por coluna única (todas indexadas)
+    taken = {}
+    for key, column in (('email', User.email), ('username', User.username), ('cpf', User.cpf)):
+        values = [record[key] for record in records if record[key]]
+        taken[key] = set(conn.execute(select(column).where(column.in_(values))).scalars()) if values else set()
+    accepted = []
+    for record in records:
+        duplicated = [f'{key} já cadastrado' for key in taken if record[key] and record[key] in taken[key]]
+        if duplicated:
+            rejects.append({'line': record['line'], 'email': record['email'], 'errors': duplicated})
+        else:
+            accepted.append(record)
+    return accepted, rejects
+
+
+def insert_chunk(conn, records, invite_days=INVITE_DAYS):
+    """
+    Insere usuários, perfis, escolhas e convites do bloco com INSERTs em lote.
+    Retorna a lista ``(email, token)`` dos convites criados.
+    """
+    now = datetime.utcnow()
+    user_table = User.__table__
+    user_ids = conn.execute(
+        insert(user_table).returning(user_table.c.id, sort_by_parameter_order=True),
+        [{
+            'username': record['username'],
+            'email': record['email'],
+            'cpf': record['cpf'],
+            'name': record['name'],
+            'address': record['address'],
+            'birth_date': record['birth_date'],
+            'password_hash': record.get('password_hash'),
+            'created_at': now,
+        } for record in records]
+    ).scalars().all()
+
+    profile_table = Profile.__table__
+    profile_ids = conn.execute(
+        insert(profile_table).returning(profile_table.c.id, sort_by_parameter_order=True),
+        [dict(
+            {field: record[field] for field in TEXT_FIELDS},
+            user_id=user_id,
+            # Colunas de texto antigas, mantidas em sincronia como faz o ChoiceList
+            **{field: ','.join(record['choices'][field]) for field in CHOICE_FIELDS}
+        ) for record, user_id in zip(records, user_ids)]
+    ).scalars().all()
+
+    # INSERTs direto na conexão não passam pelos hooks da sessão: as contagens de fan_stat vão junto
+    deltas = Counter({('fans', 'total'): len(user_ids), ('fans', 'with_profile'): len(profile_ids)})
+    for field, (table, column) in CHOICE_FIELDS.items():
+        rows = [{'profile_id': profile_id, column: code}
+                for record, profile_id in zip(records, profile_ids) for code in record['choices'][field]]
+        if rows:
+            conn.execute(insert(table), rows)
+        deltas.update((column, row[column]) for row in rows)
+    apply_deltas(conn, deltas)
+
+    invites = []
+    invite_rows = []
+    for record, user_id in zip(records, user_ids):
+        if record.get('password_hash'):
+            continue
+        token = secrets.token_urlsafe(24)
+        invites.append((record['email'], token))
+        invite_rows.append({'user_id': user_id, 'token_hash': invite_token_hash(token), 'created_at': now,
+                            'expires_at': now + timedelta(days=invite_days)})
+    if invite_rows:
+        conn.execute(insert(FanInvite.__table__), invite_rows)
+    return invites
+
+
+class Checkpoint:
+    """Progresso da importação, gravado atomicamente depois de cada bloco"""
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = {'path': os.path.abspath(source), 'size': os.path.getsize(source)}
+        self.rows = self.inserted = self.rejected = self.invites = 0
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        if data.get('source') != self.source:
+            raise FanImportError(f"O checkpoint {self.path} é de outro arquivo (use --restart para ignorá-lo)")
+        self.rows, self.inserted = data['rows'], data['inserted']
+        self.rejected, self.invites = data['rejected'], data['invites']
+        return True
+
+    def save(self):
+        data = {'source': self.source, 'rows': self.rows, 'inserted': self.inserted, 'rejected': self.rejected,
+                'invites': self.invites, 'updated_at': datetime.utcnow().isoformat()}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+def _append_lines(path, lines):
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def import_fans(path, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, checkpoint_path=None,
+                invites_path=None, rejects_path=None, restart=False, invite_days=INVITE_DAYS, progress=None):
+    """
+    Importa os fãs de ``path``. Retorna um dict com rows, inserted, rejected,
+    invites, seconds e rows_per_sec (desta execução). ``progress(stats)`` é
+    chamado depois de cada bloco.
+    """
+    fmt = detect_format(path, fmt)
+    checkpoint = Checkpoint(checkpoint_path or path + '.checkpoint.json', path)
+    invites_path = invites_path or path + '.invites.csv'
+    rejects_path = rejects_path or path + '.rejects.ndjson'
+    # Os arquivos de convites e rejeições só recebem acréscimos: tokens já emitidos nunca se perdem
+    if not restart:
+        checkpoint.load()
+    if not os.path.exists(invites_path):
+        _append_lines(invites_path, ['email,token\n'])
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = None
+    started = time.perf_counter()
+    skipped = checkpoint.rows
+    stats = {'rows': 0, 'inserted': 0, 'rejected': 0, 'invites': 0, 'resumed_at': skipped}
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            # Linha 1 do CSV é o cabeçalho; no NDJSON a numeração é a das linhas de dados
+            first_line = 2 if fmt == 'csv' else 1
+            rows = enumerate(islice(read_rows(f, fmt), skipped, None), start=first_line + skipped)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                with db.engine.connect() as conn:
+                    records, rejects = validate_chunk(conn, chunk)
+
+                # Senhas informadas: hash no pool de processos, fora da transação
+                with_password = [record for record in records if record['password']]
+                if with_password:
+                    passwords = [record.pop('password') for record in with_password]
+                    if workers > 1:
+                        if pool is None:
+                            pool = ProcessPoolExecutor(max_workers=workers,
+                                                       mp_context=multiprocessing.get_context('spawn'))
+                        hashes = pool.map(hash_password, repeat(password_hasher.method), passwords,
+                                          chunksize=max(1, len(passwords) // (workers * 4)))
+                    else:
+                        hashes = map(hash_password, repeat(password_hasher.method), passwords)
+                    for record, pwhash in zip(with_password, hashes):
+                        record['password_hash'] = pwhash
+
+                invites = []
+                if records:
+                    with db.engine.begin() as conn:
+                        invites = insert_chunk(conn, records, invite_days)
+                        # Os tokens são gravados antes do commit: se ele falhar, sobram só tokens sem efeito
+                        if invites:
+                            _append_lines(invites_path, [f'{email},{token}\n' for email, token in invites])
+                if rejects:
+                    _append_lines(rejects_path, [json.dumps(reject, ensure_ascii=False) + '\n' for reject in rejects])
+
+                for key, value in (('rows', len(chunk)), ('inserted', len(records)),
+                                   ('rejected', len(rejects)), ('invites', len(invites))):
+                    stats[key] += value
+                    setattr(checkpoint, key, getattr(checkpoint, key) + value)
+                checkpoint.save()
+                stats['seconds'] = time.perf_counter() - started
+                stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+                if progress:
+                    progress(stats)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    stats.update(invites_path=invites_path, rejects_path=rejects_path, checkpoint_path=checkpoint.path)
+    return stats
+
+
+@click.command('import-fans')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Default: from the file extension.')
+@click.option('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, show_default=True)
+@click.option('--workers', type=int, default=None, help='Password hashing processes (default: CPU count).')
+@click.option('--checkpoint', 'checkpoint_path', help='Default: PATH.checkpoint.json')
+@click.option('--invites', 'invites_path', help='CSV of invite tokens to send (default: PATH.invites.csv).')
+@click.option('--rejects', 'rejects_path', help='NDJSON of rejected lines (default: PATH.rejects.ndjson).')
+@click.option('--invite-days', type=int, default=INVITE_DAYS, show_default=True)
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first line.')
+@with_appcontext
+def import_fans_command(path, fmt, chunk_size, workers, checkpoint_path, invites_path, rejects_path,
+                        invite_days, restart):
+    """Bulk import fans from a CSV or NDJSON file."""
+    def report(stats):
+        click.echo(f"  {stats['resumed_at'] + stats['rows']} lines: {stats['inserted']} imported, "
+                   f"{stats['rejected']} rejected ({stats['rows_per_sec']:.0f} rows/s)", err=True)
+
+    try:
+        stats = import_fans(path, fmt, chunk_size, workers, checkpoint_path, invites_path, rejects_path,
+                            restart, invite_days, progress=report)
+    except FanImportError as e:
+        raise click.UsageError(str(e))
+    if stats['resumed_at']:
+        click.echo(f"Resumed after line {stats['resumed_at']}.")
+    click.echo(f"Imported {stats['inserted']} fans, rejected {stats['rejected']} "
+               f"in {stats['seconds']:.1f}s ({stats['rows_per_sec']:.0f} rows/s).")
+    if stats['invites']:
+        click.echo(f"{stats['invites']} invite tokens written to {stats['invites_path']}.")
+    if stats['rejected']:
+        click.echo(f"Rejected lines in {stats['rejects_path']}.")
@@ -0,0 +1,269 @@
+"""
+Estatísticas agregadas da base de fãs.
+
+A tabela ``fan_stat`` guarda uma contagem por (dimensão, valor): total de
+fãs, fãs com perfil, fãs por jogo/time/evento, documentos enviados e
+verificados por ``doc_type``, contas sociais por plataforma e perfis de
+e-sports (enviados e verificados) por plataforma. O painel administrativo lê
+só essa tabela, cujo tamanho depende da quantidade de valores distintos e não
+da quantidade de fãs.
+
+As contagens são mantidas incrementalmente: eventos de mapper
+(``after_insert``/``before_update``/``before_delete``) acumulam as diferenças
+de cada linha gravada na sessão — inclusive as escolhas removidas do perfil,
+que o ``delete-orphan`` apaga sem passar por ``session.deleted`` — e o hook
+``after_flush`` aplica tudo num único upsert na mesma transação. Um rollback
+desfaz as contagens junto com os dados.
+
+INSERTs em lote feitos direto na conexão (``fan_import``) chamam
+``apply_deltas`` por conta própria. ``flask rebuild-fan-stats`` recalcula
+tudo a partir das tabelas de origem para corrigir qualquer divergência.
+"""
+
+from collections import Counter
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, event, func, insert, select, text, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, attributes, object_session
+
+from models import (db, User, Profile, ProfileGame, ProfileTeam, ProfileEvent, Document, SocialAccount,
+                    EsportsProfile, FanStat)
+
+UPSERT_INSERTS = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert,
+}
+
+# Modelos cujas linhas alteram alguma contagem
+TRACKED_MODELS = (User, Profile, ProfileGame, ProfileTeam, ProfileEvent, Document, SocialAccount, EsportsProfile)
+
+# Atributos alteráveis que mudam a chave contada; o valor anterior precisa ficar no histórico
+TRACKED_ATTRIBUTES = (Document.doc_type, Document.verified, SocialAccount.platform, EsportsProfile.platform,
+                      EsportsProfile.verified)
+
+
+def stat_keys(obj, value_of):
+    """Chaves (dimensão, valor) contadas para ``obj``; ``value_of(atributo)`` devolve o valor a considerar"""
+    if isinstance(obj, User):
+        return [('fans', 'total')]
+    if isinstance(obj, Profile):
+        return [('fans', 'with_profile')]
+    if isinstance(obj, ProfileGame):
+        return [('game', _key(value_of('game')))]
+    if isinstance(obj, ProfileTeam):
+        return [('team', _key(value_of('team')))]
+    if isinstance(obj, ProfileEvent):
+        return [('event', _key(value_of('event')))]
+    if isinstance(obj, Document):
+        doc_type = _key(value_of('doc_type'))
+        keys = [('document', doc_type)]
+        if value_of('verified'):
+            keys.append(('document_verified', doc_type))
+        return keys
+    if isinstance(obj, SocialAccount):
+        return [('social', _key(value_of('platform')))]
+    if isinstance(obj, EsportsProfile):
+        platform = _key(value_of('platform'))
+        keys = [('esports', platform)]
+        if value_of('verified'):
+            keys.append(('esports_verified', platform))
+        return keys
+    return []
+
+
+def _key(value):
+    # Valores nulos entram como '' (a chave primária não aceita NULL)
+    return '' if value is None else str(value)
+
+
+def apply_deltas(conn, deltas):
+    """Soma ``deltas`` ({(dimensão, valor): diferença}) às contagens, criando as linhas que faltarem"""
+    rows = [{'dimension': dimension, 'value': value, 'count': delta}
+            for (dimension, value), delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return
+    table = FanStat.__table__
+    upsert_insert = UPSERT_INSERTS.get(conn.dialect.name)
+    if upsert_insert is not None:
+        # Linhas em ordem fixa para que transações concorrentes travem as chaves na mesma sequência
+        stmt = upsert_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.dimension, table.c.value],
+                                          set_={'count': table.c['count'] + stmt.excluded['count']})
+        conn.execute(stmt, rows)
+        return
+    for row in rows:
+        result = conn.execute(
+            update(table)
+            .where(table.c.dimension == row['dimension'], table.c.value == row['value'])
+            .values(count=table.c['count'] + row['count'])
+        )
+        if result.rowcount == 0:
+            conn.execute(insert(table), [row])
+
+
+def compute_counts(conn):
+    """Recalcula todas as contagens a partir das tabelas de origem"""
+    counts = Counter()
+    counts['fans', 'total'] = conn.execute(select(func.count(User.id))).scalar()
+    counts['fans', 'with_profile'] = conn.execute(select(func.count(Profile.id))).scalar()
+    for dimension, column in (('game', ProfileGame.game), ('team', ProfileTeam.team), ('event', ProfileEvent.event),
+                              ('social', SocialAccount.platform)):
+        for value, count in conn.execute(select(column, func.count()).group_by(column)):
+            counts[dimension, _key(value)] += count
+    for dimension, model, column in (('document', Document, Document.doc_type),
+                                     ('esports', EsportsProfile, EsportsProfile.platform)):
+        query = select(column, func.count(), func.sum(case((model.verified.is_(True), 1), else_=0))).group_by(column)
+        for value, count, verified in conn.execute(query):
+            counts[dimension, _key(value)] += count
+            counts[f'{dimension}_verified', _key(value)] += verified or 0
+    return +counts
+
+
+def rebuild(conn):
+    """
+    Substitui o conteúdo de ``fan_stat`` pelas contagens recalculadas.
+    Retorna a quantidade de chaves cuja contagem estava divergente.
+    """
+    table = FanStat.__table__
+    if conn.dialect.name == 'postgresql':
+        # Transações concorrentes esperam a reconstrução terminar para aplicar suas diferenças
+        conn.execute(text(f'LOCK TABLE {table.name} IN EXCLUSIVE MODE'))
+    current = Counter({(dimension, value): count for dimension, value, count in conn.execute(select(table))})
+    counts = compute_counts(conn)
+    drift = sum(1 for key in set(current) | set(counts) if current[key] != counts[key])
+    conn.execute(delete(table))
+    if counts:
+        conn.execute(insert(table), [{'dimension': dimension, 'value': value, 'count': count}
+                                     for (dimension, value), count in sorted(counts.items())])
+    return drift
+
+
+class FanStats:
+    """Leitura e manutenção das contagens de ``fan_stat``"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['fan_stats'] = self
+        app.cli.add_command(rebuild_fan_stats_command)
+        for model in TRACKED_MODELS:
+            for name, listener in (('after_insert', _count_insert), ('before_update', _count_update),
+                                   ('before_delete', _count_delete)):
+                if not event.contains(model, name, listener):
+                    event.listen(model, name, listener)
+        for attribute in TRACKED_ATTRIBUTES:
+            if not event.contains(attribute, 'set', _keep_previous_value):
+                # active_history carrega o valor antigo mesmo se o atributo estiver expirado
+                event.listen(attribute, 'set', _keep_previous_value, active_history=True)
+        if not event.contains(Session, 'after_flush', _apply_session_deltas):
+            event.listen(Session, 'after_flush', _apply_session_deltas)
+            event.listen(Session, 'after_rollback', _discard_session_deltas)
+
+    def counts(self):
+        """Todas as contagens positivas, como {(dimensão, valor): contagem}"""
+        rows = db.session.execute(select(FanStat.dimension, FanStat.value, FanStat.count)
+                                  .where(FanStat.count > 0))
+        return {(dimension, value): count for dimension, value, count in rows}
+
+    def summary(self):
+        """Resumo da base de fãs para o painel administrativo"""
+        counts = self.counts()
+        by_dimension = {}
+        for (dimension, value), count in counts.items():
+            by_dimension.setdefault(dimension, {})[value] = count
+
+        def ranked(dimension):
+            values = by_dimension.get(dimension, {})
+            return dict(sorted(values.items(), key=lambda item: (-item[1], item[0])))
+
+        def with_verification(dimension):
+            verified = by_dimension.get(f'{dimension}_verified', {})
+            return {value: {
+                'total': total,
+                'verified': verified.get(value, 0),
+                'verification_rate': round(verified.get(value, 0) / total, 4)
+            } for value, total in ranked(dimension).items()}
+
+        fans = by_dimension.get('fans', {})
+        return {
+            'fans': {'total': fans.get('total', 0), 'with_profile': fans.get('with_profile', 0)},
+            'games': ranked('game'),
+            'teams': ranked('team'),
+            'events': ranked('event'),
+            'documents': with_verification('document'),
+            'social': ranked('social'),
+            'esports': with_verification('esports'),
+        }
+
+    def rebuild(self):
+        with db.engine.begin() as conn:
+            return rebuild(conn)
+
+
+fan_stats = FanStats()
+
+
+def _session_deltas(target):
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault('fan_stat_deltas', Counter())
+
+
+def _count_insert(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is not None:
+        for key in stat_keys(target, lambda name: getattr(target, name)):
+            deltas[key] += 1
+
+
+def _count_delete(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is not None:
+        for key in stat_keys(target, lambda name: _previous_value(target, name)):
+            deltas[key] -= 1
+
+
+def _count_update(mapper, connection, target):
+    deltas = _session_deltas(target)
+    if deltas is None:
+        return
+    for key in stat_keys(target, lambda name: _previous_value(target, name)):
+        deltas[key] -= 1
+    for key in stat_keys(target, lambda name: getattr(target, name)):
+        deltas[key] += 1
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+def _previous_value(target, name):
+    # Antes do UPDATE/DELETE o histórico ainda guarda o valor anterior à alteração
+    history = attributes.get_history(target, name)
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, name)
+
+
+def _apply_session_deltas(session, flush_context):
+    deltas = session.info.pop('fan_stat_deltas', None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def _discard_session_deltas(session):
+    session.info.pop('fan_stat_deltas', None)
+
+
+@click.command('rebuild-fan-stats')
+@with_appcontext
+def rebuild_fan_stats_command():
+    """Recompute the fan_stat summary table from the source tables."""
+    drift = fan_stats.rebuild()
+    click.echo(f"Rebuilt fan stats; {drift} counters were out of date.")
@@ -0,0 +1,268 @@
+"""
+Cliente HTTP compartilhado para a coleta de perfis de e-sports.
+
+- uma ``requests.Session`` por host, com pool de conexões reaproveitadas;
+- limite de requisições por host (token bucket);
+- GET condicional (ETag / Last-Modified) com cache das respostas em disco;
+- redirecionamentos não são seguidos: só os hosts de ``ALLOWED_HOSTS`` são
+  buscados (ver ``is_fetchable``);
+- extração dos dados com lxml quando disponível (BeautifulSoup como fallback).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import lxml.html
+except ImportError:  # pragma: no cover - depende do ambiente
+    lxml = None
+
+DEFAULT_USER_AGENT = 'KnowYourFan/1.0 (+https://www.furia.gg/)'
+
+# (requisições por segundo, rajada máxima) por host; FETCH_RATE_LIMITS substitui
+DEFAULT_RATE_LIMITS = {
+    'default': (1.0, 5),
+    'www.hltv.org': (0.5, 2),
+}
+
+FetchResult = namedtuple('FetchResult', 'url status text from_cache')
+
+
+class FetchError(Exception):
+    """Falha ao obter uma página remota"""
+
+
+def parse_rate_limits(value):
+    """
+    Limites por host a partir de ``"host=req/s:rajada,..."`` (ex.:
+    ``"default=1:5,www.hltv.org=0.5:2"``). None usa ``DEFAULT_RATE_LIMITS``;
+    um dicionário é usado como está.
+    """
+    if not value:
+        return dict(DEFAULT_RATE_LIMITS)
+    if isinstance(value, dict):
+        return value
+    limits = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        try:
+            host, spec = item.split('=', 1)
+            rate, burst = spec.split(':', 1)
+            limits[host.strip()] = (float(rate), int(burst))
+        except ValueError:
+            raise ValueError(f'FETCH_RATE_LIMITS inválido: {item.strip()!r} (use host=req/s:rajada)') from None
+    return limits
+
+
+class TokenBucket:
+    """Limitador de taxa: ``rate`` fichas por segundo, até ``capacity`` acumuladas"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloqueia até haver uma ficha disponível"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ResponseCache:
+    """Cache em disco de respostas (corpo + validadores ETag/Last-Modified)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self, url):
+        try:
+            with open(self._path(url), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, url, text, etag=None, last_modified=None):
+        entry = {'url': url, 'text': text, 'etag': etag, 'last_modified': last_modified, 'stored_at': time.time()}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.cache-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(url))
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+
+class HttpFetcher:
+    """Busca páginas com conexões persistentes, limite de taxa e cache condicional"""
+
+    def __init__(self, cache_dir=None, rate_limits=None, pool_size=4, timeout=10, user_agent=DEFAULT_USER_AGENT):
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.rate_limits = rate_limits or DEFAULT_RATE_LIMITS
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self._sessions = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url):
+        """Retorna um ``FetchResult``; usa o cache quando o servidor responde 304"""
+        cached = self.cache.load(url) if self.cache else None
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        host = urlsplit(url).netloc
+        self._bucket_for(host).acquire()
+        try:
+            response = self._session_for(host).get(url, headers=headers, timeout=self.timeout,
+                                                   allow_redirects=False)
+        except requests.RequestException as e:
+            raise FetchError(str(e)) from e
+
+        if response.status_code == 304 and cached:
+            return FetchResult(url, 200, cached['text'], True)
+        if response.status_code != 200:
+            raise FetchError(f'{url} respondeu {response.status_code}')
+
+        if self.cache and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+            self.cache.store(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return FetchResult(url, response.status_code, response.text, False)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def _session_for(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                session.headers['User-Agent'] = self.user_agent
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size,
+                    max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504))
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def _bucket_for(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate, burst = self.rate_limits.get(host, self.rate_limits.get('default', DEFAULT_RATE_LIMITS['default']))
+                bucket = self._buckets[host] = TokenBucket(rate, burst)
+            return bucket
+
+
+def page_metadata(html):
+    """Título e meta tags (``og:*``, ``description``...) de uma página HTML"""
+    metadata = {}
+    if lxml is not None:
+        document = lxml.html.fromstring(html)
+        title = document.findtext('.//title')
+        for meta in document.iterfind('.//meta'):
+            key = meta.get('property') or meta.get('name')
+            if key and meta.get('content') is not None:
+                metadata[key] = meta.get('content')
+    else:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+        title = soup.title.string if soup.title else None
+        for meta in soup.find_all('meta'):
+            key = meta.get('property') or meta.get('name')
+            if key and meta.get('content') is not None:
+                metadata[key] = meta['content']
+    metadata['title'] = (title or '').strip()
+    return metadata
+
+
+def _strip_affixes(value, prefixes=(), suffixes=()):
+    value = (value or '').strip()
+    for prefix in prefixes:
+        if value.startswith(prefix):
+            value = value[len(prefix):]
+    for suffix in suffixes:
+        if value.endswith(suffix):
+            value = value[:-len(suffix)]
+    return value.strip()
+
+
+def extract_steam(metadata):
+    return {'username': _strip_affixes(metadata.get('og:title') or metadata['title'], prefixes=('Steam Community ::',))}
+
+
+def extract_faceit(metadata):
+    return {'username': _strip_affixes(metadata.get('og:title') or metadata['title'],
+                                       suffixes=(' - FACEIT', ' | FACEIT'))}
+
+
+def extract_hltv(metadata):
+    return {'username': _strip_affixes(metadata.get('og:title') or metadata['title'],
+                                       prefixes=('HLTV.org -',), suffixes=(' | HLTV.org',))}
+
+
+EXTRACTORS = {
+    'steam': extract_steam,
+    'faceit': extract_faceit,
+    'hltv': extract_hltv,
+}
+
+# Hosts cujas páginas podem ser buscadas, por plataforma com extrator
+ALLOWED_HOSTS = {
+    'steam': {'steamcommunity.com'},
+    'faceit': {'www.faceit.com'},
+    'hltv': {'www.hltv.org'},
+}
+
+
+def is_fetchable(platform, url):
+    """Se a URL (informada pelo usuário) pode ser buscada: plataforma com extrator e host da plataforma"""
+    if platform not in EXTRACTORS:
+        return False
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return False
+    return (parts.scheme in ('http', 'https') and port in (None, 80, 443) and not parts.username
+            and parts.hostname in ALLOWED_HOSTS.get(platform, ()))
+
+
+def extract_profile(platform, html):
+    """Dados do perfil extraídos da página, ou {} se a plataforma não tem extrator"""
+    extractor = EXTRACTORS.get(platform)
+    if extractor is None:
+        return {}
+    profile = extractor(page_metadata(html))
+    return {key: value for key, value in profile.items() if value}
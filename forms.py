@@ -2,7 +2,8 @@ from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, PasswordField, SubmitField, TextAreaField, DateField, SelectField, SelectMultipleField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, URL
-import re
+
+from cpf import normalize as normalize_cpf, is_valid as is_valid_cpf
 
 class RegistrationForm(FlaskForm):
     username = StringField('Nome de usuário', validators=[DataRequired(), Length(min=3, max=20)])
@@ -72,29 +73,13 @@ class ProfileForm(FlaskForm):
 
     def validate_cpf(self, cpf):
         # Remover caracteres não numéricos
-        cpf_digits = re.sub(r'[^0-9]', '', cpf.data)
+        cpf_digits = normalize_cpf(cpf.data) or ''
         
         if len(cpf_digits) != 11:
             raise ValidationError('CPF deve conter 11 dígitos')
         
-        # Verificar se todos os dígitos são iguais
-        if cpf_digits == cpf_digits[0] * 11:
-            raise ValidationError('CPF inválido')
-        
-        # Validação do primeiro dígito verificador
-        sum_of_products = sum(int(a) * b for a, b in zip(cpf_digits[:-2], range(10, 1, -1)))
-        expected_digit = (sum_of_products * 10) % 11
-        if expected_digit == 10:
-            expected_digit = 0
-        if int(cpf_digits[-2]) != expected_digit:
-            raise ValidationError('CPF inválido')
-        
-        # Validação do segundo dígito verificador
-        sum_of_products = sum(int(a) * b for a, b in zip(cpf_digits[:-1], range(11, 1, -1)))
-        expected_digit = (sum_of_products * 10) % 11
-        if expected_digit == 10:
-            expected_digit = 0
-        if int(cpf_digits[-1]) != expected_digit:
+        # Dígitos verificadores (e CPFs com todos os dígitos iguais)
+        if not is_valid_cpf(cpf_digits):
             raise ValidationError('CPF inválido')
 
 class DocumentUploadForm(FlaskForm):
@@ -0,0 +1,132 @@
+"""
+Hash de senhas fora das threads que atendem requisições.
+
+O cálculo do KDF (scrypt, PBKDF2 ou argon2) consome dezenas de milissegundos
+de CPU por login/cadastro. ``PasswordHasher`` envia esse trabalho para um
+pool limitado de processos (``PASSWORD_HASH_POOL_SIZE``; 0 calcula no próprio
+processo), de modo que uma rajada de logins ocupa no máximo esse número de
+núcleos e não bloqueia as demais rotas.
+
+O algoritmo e seus parâmetros vêm de ``PASSWORD_HASH_METHOD``. Hashes
+gerados com parâmetros diferentes continuam válidos e são refeitos no
+próximo login bem-sucedido (``needs_rehash``).
+
+Os processos do pool são iniciados com ``spawn``, que reimporta o script
+principal: scripts que cadastram usuários precisam do guard
+``if __name__ == '__main__'`` (ou de ``PASSWORD_HASH_POOL_SIZE=0``).
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+try:
+    import argon2
+except ImportError:  # argon2-cffi é opcional
+    argon2 = None
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+def normalize_method(method):
+    """Completa os parâmetros padrão do método (ex.: 'scrypt' -> 'scrypt:32768:8:1')"""
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        defaults = ['32768', '8', '1']
+    elif name == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    elif name == 'argon2':
+        if argon2 is None:
+            raise RuntimeError("PASSWORD_HASH_METHOD=argon2 requer o pacote argon2-cffi")
+        return 'argon2'
+    else:
+        raise ValueError(f"Método de hash desconhecido: {method}")
+    return ':'.join([name] + params + defaults[len(params):])
+
+
+def hash_password(method, password):
+    """Gera o hash de ``password``; executado nos processos do pool"""
+    if method == 'argon2':
+        return argon2.PasswordHasher().hash(password)
+    return generate_password_hash(password, method=method)
+
+
+def verify_password(pwhash, password):
+    """Confere ``password`` contra ``pwhash``; executado nos processos do pool"""
+    if not pwhash:
+        return False
+    if pwhash.startswith('$argon2'):
+        if argon2 is None:
+            return False
+        try:
+            return argon2.PasswordHasher().verify(pwhash, password)
+        except argon2.exceptions.VerificationError:
+            return False
+    return check_password_hash(pwhash, password)
+
+
+class PasswordHasher:
+    """Serviço de hash de senhas com pool de processos limitado"""
+
+    def __init__(self, app=None):
+        self.method = DEFAULT_METHOD
+        self.pool_size = 0
+        self._pool = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+        app.config.setdefault('PASSWORD_HASH_POOL_SIZE', 2)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 32)  # por processo, além dos que estão rodando
+        self.method = normalize_method(app.config['PASSWORD_HASH_METHOD'])
+        self.pool_size = app.config['PASSWORD_HASH_POOL_SIZE']
+        self._slots = threading.BoundedSemaphore(self.pool_size + app.config['PASSWORD_HASH_MAX_PENDING'])
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        return self._call(hash_password, self.method, password)
+
+    def verify(self, pwhash, password):
+        return self._call(verify_password, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True se ``pwhash`` foi gerado com outro algoritmo ou outros parâmetros"""
+        if not pwhash:
+            return False
+        if self.method == 'argon2':
+            return not pwhash.startswith('$argon2') or argon2.PasswordHasher().check_needs_rehash(pwhash)
+        return pwhash.split('$', 1)[0] != self.method
+
+    def _call(self, func, *args):
+        if not self.pool_size:
+            return func(*args)
+        # Limita as requisições esperando pelo pool; as demais aguardam aqui
+        with self._slots:
+            return self._executor().submit(func, *args).result()
+
+    def _executor(self):
+        # Processos herdados de um fork (ex.: workers do gunicorn) não compartilham o pool
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,151 @@
+"""
+Carregamento do usuário autenticado.
+
+Cada rota declara quais relacionamentos do ``current_user`` ela (e seu
+template) usa; eles são carregados de uma vez, com joinedload/selectinload,
+em vez de um SELECT preguiçoso por relacionamento.
+
+O grafo carregado (usuário, perfil, documentos...) é guardado por poucos
+segundos como uma cópia destacada da sessão e reaproveitado nas requisições
+seguintes com ``Session.merge(load=False)``, sem nenhum SELECT. Qualquer
+commit que altere o usuário ou seus dados relacionados invalida a cópia
+deste processo; nos demais workers ela expira pelo TTL.
+"""
+
+import threading
+import time
+
+from flask import current_app, request
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import joinedload, make_transient_to_detached, selectinload
+
+from changes import changed_users
+from models import (db, User, Profile, ProfileGame, ProfileTeam, ProfileEvent, Document, SocialAccount,
+                    EsportsProfile)
+
+# Relacionamentos usados por cada rota (endpoint) além do próprio usuário
+ROUTE_RELATIONSHIPS = {
+    'dashboard': {'profile', 'documents', 'social_accounts', 'esports_profiles'},
+    'profile': {'profile', 'profile_choices'},
+}
+DEFAULT_RELATIONSHIPS = {'profile'}
+
+PROFILE_LINKS = ('game_links', 'team_links', 'event_links')
+
+# Alterações nestes modelos invalidam a cópia do usuário dono
+CACHED_MODELS = (User, Profile, ProfileGame, ProfileTeam, ProfileEvent, Document, SocialAccount, EsportsProfile)
+
+
+def load_options(relationships):
+    """Opções de carregamento do SQLAlchemy para os relacionamentos pedidos"""
+    options = []
+    if 'profile_choices' in relationships:
+        profile = joinedload(User.profile)
+        options.extend(profile.selectinload(getattr(Profile, link)) for link in PROFILE_LINKS)
+    elif 'profile' in relationships:
+        options.append(joinedload(User.profile))
+    for name in ('documents', 'social_accounts', 'esports_profiles'):
+        if name in relationships:
+            options.append(selectinload(getattr(User, name)))
+    return options
+
+
+def loaded_relationships(user):
+    """Quais dos relacionamentos conhecidos já estão carregados em ``user``"""
+    unloaded = sa_inspect(user).unloaded
+    loaded = {name for name in ('profile', 'documents', 'social_accounts', 'esports_profiles')
+              if name not in unloaded}
+    if 'profile' in loaded and user.profile is not None:
+        if not set(PROFILE_LINKS) & sa_inspect(user.profile).unloaded:
+            loaded.add('profile_choices')
+    elif 'profile' in loaded:
+        loaded.add('profile_choices')
+    return loaded
+
+
+def _detached_copy(obj):
+    """Cópia do objeto só com os valores das colunas, fora de qualquer sessão"""
+    mapper = sa_inspect(obj).mapper
+    return mapper.class_(**{attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs})
+
+
+def snapshot_user(user, relationships):
+    """Copia o usuário e os relacionamentos carregados para um grafo destacado"""
+    copies = [_detached_copy(user)]
+    snapshot = copies[0]
+    if 'profile' in relationships:
+        profile = user.profile
+        if profile is not None:
+            profile_copy = _detached_copy(profile)
+            copies.append(profile_copy)
+            if 'profile_choices' in relationships:
+                for link in PROFILE_LINKS:
+                    link_copies = [_detached_copy(item) for item in getattr(profile, link)]
+                    copies.extend(link_copies)
+                    setattr(profile_copy, link, link_copies)
+            snapshot.profile = profile_copy
+        else:
+            snapshot.profile = None
+    for name in ('documents', 'social_accounts', 'esports_profiles'):
+        if name in relationships:
+            items = [_detached_copy(item) for item in getattr(user, name)]
+            copies.extend(items)
+            setattr(snapshot, name, items)
+    # Marca tudo como "recém carregado" para que merge(load=False) aceite o grafo
+    for obj in copies:
+        make_transient_to_detached(obj)
+    return snapshot
+
+
+class UserIdentityCache:
+    """Cache de curta duração do grafo do usuário autenticado, por processo"""
+
+    def __init__(self, app=None):
+        self._entries = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IDENTITY_CACHE_TTL', 5.0)
+        app.extensions['identity_cache'] = self
+        changed_users.subscribe(CACHED_MODELS, after_commit=_invalidate_changed_users)
+
+    def load_user(self, user_id):
+        """Usuário da requisição atual com os relacionamentos que a rota usa"""
+        wanted = ROUTE_RELATIONSHIPS.get(request.endpoint, DEFAULT_RELATIONSHIPS)
+        ttl = current_app.config['IDENTITY_CACHE_TTL']
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None:
+            expires, relationships, snapshot = entry
+            if expires > time.monotonic() and wanted <= relationships:
+                return db.session.merge(snapshot, load=False)
+            wanted = wanted | relationships
+
+        user = db.session.get(User, user_id, options=load_options(wanted))
+        if user is None:
+            return None
+        if ttl > 0:
+            relationships = loaded_relationships(user)
+            snapshot = snapshot_user(user, relationships)
+            with self._lock:
+                self._entries[user_id] = (time.monotonic() + ttl, relationships, snapshot)
+        return user
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = UserIdentityCache()
+
+
+def _invalidate_changed_users(user_ids):
+    identity_cache.invalidate(user_ids)
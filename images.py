@@ -0,0 +1,104 @@
+"""
+Variantes das fotos de perfil.
+
+A foto original enviada pelo fã (muitas vezes uma foto de celular com
+vários MB) é convertida em tamanhos fixos, quadrados, em WebP e JPEG, sem
+metadados EXIF (localização, modelo do aparelho...). A orientação do EXIF é
+aplicada antes de descartá-lo.
+
+Para JPEGs o Pillow decodifica direto numa escala reduzida (``draft``), o que
+limita a memória e o tempo de decodificação ao necessário para a maior
+variante. Cada variante menor é gerada a partir da anterior.
+
+As variantes são geradas pela tarefa ``profile_picture`` da fila
+(``jobs.py``) e registradas em ``Profile.picture_variants``. O original fica
+na pasta privada ``storage.PROFILE_ORIGINALS_FOLDER`` e nunca é servido.
+"""
+
+import io
+
+from PIL import Image, ImageOps
+
+DEFAULT_SIZES = (512, 256, 64)
+DEFAULT_FORMATS = ('webp', 'jpeg')
+DEFAULT_QUALITY = 80
+DEFAULT_MAX_PIXELS = 40_000_000  # ~ foto de 40 MP; acima disso o arquivo é recusado
+
+EXTENSIONS = {'webp': '.webp', 'jpeg': '.jpg'}
+
+
+class ImageError(ValueError):
+    """Arquivo que não é uma imagem válida (ou grande demais)"""
+
+
+def open_image(stream, max_size, max_pixels=DEFAULT_MAX_PIXELS):
+    """Abre a imagem decodificando só o necessário para ``max_size`` (modo draft para JPEG)"""
+    try:
+        image = Image.open(stream)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageError(f'Imagem inválida: {e}')
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageError(f'Imagem grande demais ({width}x{height})')
+    # Para JPEG, reduz a escala na decodificação (1/2, 1/4 ou 1/8) mantendo ao menos max_size
+    image.draft('RGB', (max_size, max_size))
+    # Aplica a rotação indicada no EXIF antes de descartar os metadados
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def encode(image, fmt, quality=DEFAULT_QUALITY):
+    """Codifica ``image`` em ``fmt`` sem EXIF/ICC e retorna os bytes"""
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        if image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    elif fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=quality, method=4)
+    else:
+        raise ValueError(f'Formato não suportado: {fmt}')
+    return buffer.getvalue()
+
+
+def make_variants(stream, sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS, quality=DEFAULT_QUALITY,
+                  max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    Gera as variantes quadradas da imagem em ``stream``.
+    Retorna ``{tamanho: {formato: bytes}}``.
+    """
+    sizes = sorted(sizes, reverse=True)
+    image = open_image(stream, sizes[0], max_pixels)
+    variants = {}
+    for size in sizes:
+        # Recorte central quadrado; imagens menores que o tamanho não são ampliadas
+        target = min(size, *image.size)
+        image = ImageOps.fit(image, (target, target), Image.LANCZOS)
+        variants[size] = {fmt: encode(image, fmt, quality) for fmt in formats}
+    return variants
+
+
+def store_variants(storage, stream, folder='profiles', **options):
+    """Gera as variantes e grava cada uma pelo hash do conteúdo; retorna ``{tamanho: {formato: arquivo}}``"""
+    stored = {}
+    for size, encoded in make_variants(stream, **options).items():
+        stored[str(size)] = {
+            fmt: storage.save_hashed(io.BytesIO(data), folder, EXTENSIONS[fmt]).filename
+            for fmt, data in encoded.items()
+        }
+    return stored
+
+
+def variant_options(config):
+    """Parâmetros de ``make_variants`` a partir da configuração da aplicação"""
+    return {
+        'sizes': tuple(config.get('IMAGE_VARIANT_SIZES', DEFAULT_SIZES)),
+        'formats': tuple(config.get('IMAGE_VARIANT_FORMATS', DEFAULT_FORMATS)),
+        'quality': config.get('IMAGE_QUALITY', DEFAULT_QUALITY),
+        'max_pixels': config.get('IMAGE_MAX_PIXELS', DEFAULT_MAX_PIXELS),
+    }
+
@@ -0,0 +1,416 @@
+"""
+Instrumentação da aplicação.
+
+``QueryCounter`` conta os comandos SQL emitidos durante cada requisição
+(eventos ``before_cursor_execute`` do SQLAlchemy) e, se habilitado, devolve
+o total no cabeçalho ``X-SQL-Queries``.
+
+``Metrics`` mantém, em memória, histogramas de latência por endpoint, de
+comandos SQL por requisição e da duração de cada comando SQL (eventos
+``before/after_cursor_execute``), além dos trechos marcados com ``span``
+(chamadas a ``ai_services`` e gravações do ``storage``). Tudo é exposto no
+formato texto do Prometheus em ``/metrics``. Cada observação custa um
+``bisect`` e um incremento sob um lock; os valores são por processo, então
+com vários workers do gunicorn cada um responde pelos próprios números.
+
+``SlowRequestProfiler`` é opcional (``PROFILE_SLOW_REQUESTS``): uma thread
+amostra a pilha das requisições em andamento e, quando uma delas passa do
+limite, registra as pilhas mais frequentes no log e, se configurado, grava
+as amostras em formato de pilhas colapsadas (flamegraph.pl, speedscope).
+"""
+
+import hmac
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Limites (em segundos) dos histogramas de latência
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+SQL_OPERATIONS = {'select', 'insert', 'update', 'delete', 'with', 'begin', 'commit', 'rollback', 'savepoint', 'release',
+                  'create', 'alter', 'drop', 'pragma'}
+
+
+class QueryCounter:
+    """Contador de comandos SQL por requisição"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_QUERY_COUNT_HEADER', False)
+        app.extensions['query_counter'] = self
+        if not event.contains(Engine, 'before_cursor_execute', _count_query):
+            event.listen(Engine, 'before_cursor_execute', _count_query)
+        app.after_request(self._add_header)
+
+    @staticmethod
+    def current():
+        """Comandos SQL emitidos até agora no contexto atual"""
+        return g.get('sql_query_count', 0) if has_app_context() else 0
+
+    def _add_header(self, response):
+        if current_app.config['SQL_QUERY_COUNT_HEADER']:
+            response.headers['X-SQL-Queries'] = str(self.current())
+        return response
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.sql_query_count = g.get('sql_query_count', 0) + 1
+
+
+query_counter = QueryCounter()
+
+
+class MetricCounter:
+    """Contador monotônico com rótulos"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    """Histograma cumulativo com limites fixos, no modelo do Prometheus"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Contagens por faixa (a última é +Inf), soma e total
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = [(label_values, list(counts), total, count)
+                      for label_values, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in series:
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', dict(labels, le=_format_value(bound)), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class Registry:
+    """Métricas do processo e funções que geram amostras sob demanda"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, function):
+        """Registra ``function(app)``, que gera tuplas ``(nome, tipo, ajuda, rótulos, valor)``"""
+        self.collectors.append(function)
+        return function
+
+    def render(self, app):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(_format_sample(name, labels, value) for name, labels, value in metric.samples())
+        for collector in self.collectors:
+            described = set()
+            for name, kind, help, labels, value in collector(app):
+                if name not in described:
+                    described.add(name)
+                    lines.append(f'# HELP {name} {help}')
+                    lines.append(f'# TYPE {name} {kind}')
+                lines.append(_format_sample(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_sample(name, labels, value):
+    if not labels:
+        return f'{name} {_format_value(value)}'
+    rendered = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+    return f'{name}{{{rendered}}} {_format_value(value)}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method')))
+REQUESTS = registry.register(MetricCounter(
+    'http_requests_total', 'Requests by endpoint and status code.', ('endpoint', 'method', 'status')))
+REQUEST_QUERIES = registry.register(Histogram(
+    'http_request_sql_queries', 'SQL statements issued per request.', ('endpoint',), QUERY_COUNT_BUCKETS))
+REQUEST_SQL_SECONDS = registry.register(Histogram(
+    'http_request_sql_duration_seconds', 'Time spent in SQL per request.', ('endpoint',)))
+SQL_SECONDS = registry.register(Histogram(
+    'sql_statement_duration_seconds', 'SQL statement duration by operation.', ('operation',), SQL_BUCKETS))
+SPAN_SECONDS = registry.register(Histogram(
+    'span_duration_seconds', 'Duration of instrumented calls (AI services, storage writes).', ('span',)))
+SPAN_ERRORS = registry.register(MetricCounter(
+    'span_errors_total', 'Instrumented calls that raised an exception.', ('span',)))
+SLOW_REQUESTS = registry.register(MetricCounter(
+    'http_slow_requests_total', 'Requests slower than PROFILE_SLOW_REQUESTS.', ('endpoint',)))
+
+
+@contextmanager
+def span(name):
+    """Mede o trecho ``name`` e soma a duração ao total da requisição atual"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        SPAN_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        SPAN_SECONDS.observe(elapsed, name)
+        if has_request_context():
+            spans = g.setdefault('span_seconds', Counter())
+            spans[name] += elapsed
+
+
+def traced(name):
+    """Decorador que envolve a função num ``span``"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Metrics:
+    """Histogramas por requisição e endpoint ``/metrics`` no formato do Prometheus"""
+
+    def __init__(self, app=None):
+        self.profiler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_PATH', '/metrics')
+        app.config.setdefault('METRICS_TOKEN', None)  # "Authorization: Bearer <token>"; sem token não há /metrics
+        app.config.setdefault('METRICS_SERVER_TIMING', False)  # cabeçalho Server-Timing com SQL e spans
+        app.config.setdefault('PROFILE_SLOW_REQUESTS', None)  # segundos; None desliga o profiler
+        app.config.setdefault('PROFILE_INTERVAL', 0.005)
+        app.config.setdefault('PROFILE_DIR', None)
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        if not event.contains(Engine, 'before_cursor_execute', _count_query):
+            event.listen(Engine, 'before_cursor_execute', _count_query)
+        if not event.contains(Engine, 'before_cursor_execute', _start_statement):
+            event.listen(Engine, 'before_cursor_execute', _start_statement)
+            event.listen(Engine, 'after_cursor_execute', _finish_statement)
+            event.listen(Engine, 'handle_error', _discard_statement)
+
+        if app.config['PROFILE_SLOW_REQUESTS']:
+            self.profiler = SlowRequestProfiler(app.config['PROFILE_INTERVAL'])
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        if app.config['METRICS_TOKEN']:
+            app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self._metrics_view)
+        else:
+            # Os histogramas continuam sendo coletados (e o Server-Timing funciona), só não são expostos
+            app.logger.info('METRICS_TOKEN não definido: %s desabilitado', app.config['METRICS_PATH'])
+
+    def _start_request(self):
+        g.request_start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.start()
+
+    def _finish_request(self, response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or '<unmatched>'
+        sql_seconds = g.get('sql_seconds', 0.0)
+        REQUEST_SECONDS.observe(elapsed, endpoint, request.method)
+        REQUESTS.inc(endpoint, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(g.get('sql_query_count', 0), endpoint)
+        REQUEST_SQL_SECONDS.observe(sql_seconds, endpoint)
+
+        if current_app.config['METRICS_SERVER_TIMING']:
+            timings = [f'app;dur={elapsed * 1000:.1f}', f'sql;dur={sql_seconds * 1000:.1f}']
+            timings.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in g.get('span_seconds', {}).items())
+            response.headers['Server-Timing'] = ', '.join(timings)
+
+        threshold = current_app.config['PROFILE_SLOW_REQUESTS']
+        if threshold and elapsed >= threshold:
+            SLOW_REQUESTS.inc(endpoint)
+            if self.profiler is not None:
+                self._report_slow_request(endpoint, elapsed, self.profiler.stop())
+        return response
+
+    def _teardown_request(self, exc):
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def _report_slow_request(self, endpoint, elapsed, samples):
+        if not samples:
+            return
+        top = '\n'.join(f'  {count:5d}  {stack.rsplit(";", 1)[-1]}' for stack, count in samples.most_common(5))
+        current_app.logger.warning('Requisição lenta em %s (%.0f ms, %d amostras):\n%s',
+                                endpoint, elapsed * 1000, sum(samples.values()), top)
+        directory = current_app.config['PROFILE_DIR']
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{time.strftime("%Y%m%dT%H%M%S")}-{endpoint}-{os.getpid()}.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(f'{stack} {count}\n' for stack, count in samples.items())
+
+    def _metrics_view(self):
+        token = current_app.config['METRICS_TOKEN']
+        provided = request.headers.get('Authorization', '').encode('utf-8')
+        if not hmac.compare_digest(provided, f'Bearer {token}'.encode('utf-8')):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(registry.render(current_app._get_current_object()), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
+
+
+@registry.collector
+def _social_cache_samples(app):
+    cache = app.extensions.get('social_cache')
+    if cache is None:
+        return
+    for name, value in cache.stats().items():
+        description = f'Social analysis cache {name.replace("_", " ")} in this process.'
+        if name in ('memory_entries', 'hit_ratio'):
+            yield f'social_cache_{name}', 'gauge', description, {}, value
+        else:
+            yield f'social_cache_{name}_total', 'counter', description, {}, value
+
+
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_start', []).append(time.perf_counter())
+
+
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('statement_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    operation = statement.lstrip()[:8].split(None, 1)[0].lower() if statement.strip() else ''
+    SQL_SECONDS.observe(elapsed, operation if operation in SQL_OPERATIONS else 'other')
+    if has_app_context():
+        g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+
+
+def _discard_statement(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('statement_start'):
+        connection.info['statement_start'].pop()
+
+
+class SlowRequestProfiler:
+    """
+    Amostrador de pilhas das requisições em andamento.
+
+    Uma única thread acorda a cada ``interval`` segundos e lê o frame atual
+    de cada requisição registrada (``sys._current_frames``); a requisição em
+    si não é interrompida nem rastreada.
+    """
+
+    MAX_DEPTH = 64
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Encerra a amostragem da thread atual e devolve as pilhas coletadas"""
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[self._collapse(frame)] += 1
+
+    def _collapse(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.MAX_DEPTH:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
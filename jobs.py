@@ -0,0 +1,286 @@
+"""
+Fila de tarefas em segundo plano persistida no banco de dados.
+
+As tarefas ficam na tabela ``background_job`` e são consumidas por um pool de
+threads dentro de cada processo (ou por um processo dedicado via
+``flask run-jobs``). Falhas são reprocessadas com backoff exponencial até
+``max_attempts``.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import or_, select, update
+
+from models import db, BackgroundJob, Document, Profile
+from document_store import apply_verification, flag_duplicates, remember_verification
+from storage import storage, PROFILE_ORIGINALS_FOLDER
+from phash import dhash, document_hashes
+
+
+# Corridas perdidas seguidas antes de _claim desistir até a próxima consulta do worker
+CLAIM_ATTEMPTS = 5
+
+
+class JobError(Exception):
+    """Erro recuperável: a tarefa será reprocessada se houver tentativas restantes"""
+
+
+class JobQueue:
+    """Fila de tarefas com pool de workers configurável"""
+
+    def __init__(self, app=None):
+        self.handlers = {}
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS', 2)
+        app.config.setdefault('JOB_MAX_ATTEMPTS', 3)
+        app.config.setdefault('JOB_BACKOFF_BASE', 2.0)  # segundos
+        app.config.setdefault('JOB_BACKOFF_MAX', 300.0)
+        app.config.setdefault('JOB_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOB_STALE_AFTER', 600)  # tarefas travadas voltam para a fila
+        app.config.setdefault('JOB_AUTOSTART', True)
+        app.extensions['job_queue'] = self
+        app.cli.add_command(run_jobs_command)
+
+    def handler(self, kind):
+        """Registra a função que processa tarefas do tipo ``kind``"""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def enqueue(self, kind, payload=None, user_id=None, document_id=None, max_attempts=None):
+        """Grava uma nova tarefa e acorda os workers. Retorna o ``BackgroundJob`` criado."""
+        if kind not in self.handlers:
+            raise ValueError(f'Tipo de tarefa desconhecido: {kind}')
+        job = BackgroundJob(
+            kind=kind,
+            user_id=user_id,
+            document_id=document_id,
+            payload=json.dumps(payload or {}),
+            max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+            run_after=datetime.utcnow()
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        if current_app.config['JOB_AUTOSTART']:
+            self.start()
+        self._wakeup.set()
+        return job
+
+    def start(self, workers=None):
+        """Inicia o pool de workers deste processo (seguro após fork do gunicorn)"""
+        app = current_app._get_current_object()
+        with self._lock:
+            if self._pid == os.getpid() and any(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = []
+            for i in range(workers or app.config['JOB_WORKERS']):
+                thread = threading.Thread(target=self._worker_loop, args=(app,), name=f'job-worker-{i}',
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_pending(self, limit=None):
+        """Processa tarefas prontas na thread atual. Retorna quantas foram executadas."""
+        processed = 0
+        while limit is None or processed < limit:
+            job_id = self._claim()
+            if job_id is None:
+                break
+            self._run(job_id)
+            processed += 1
+        return processed
+
+    def _worker_loop(self, app):
+        poll_interval = app.config['JOB_POLL_INTERVAL']
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    processed = self.run_pending(limit=1)
+            except Exception:
+                app.logger.exception('Erro inesperado no worker de tarefas')
+                processed = 0
+            if not processed:
+                self._wakeup.wait(poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self):
+        """Reserva atomicamente a próxima tarefa pronta; retorna o id ou None"""
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=current_app.config['JOB_STALE_AFTER'])
+        stale = (BackgroundJob.status == 'running') & (BackgroundJob.locked_at < stale_before)
+        ready = or_(
+            (BackgroundJob.status == 'pending') & (BackgroundJob.run_after <= now),
+            stale & (BackgroundJob.attempts < BackgroundJob.max_attempts)
+        )
+        try:
+            # Travadas sem tentativas restantes (o worker morreu em todas): não voltam para a fila
+            exhausted = stale & (BackgroundJob.attempts >= BackgroundJob.max_attempts)
+            if db.session.execute(select(BackgroundJob.id).where(exhausted).limit(1)).first() is not None:
+                db.session.execute(
+                    update(BackgroundJob).where(exhausted)
+                    .values(status='failed', locked_at=None, finished_at=now,
+                            error='Worker interrompido em todas as tentativas')
+                )
+            # Quem perde a corrida tenta a próxima tarefa, um número limitado de vezes
+            for _ in range(CLAIM_ATTEMPTS):
+                job_id = db.session.execute(
+                    select(BackgroundJob.id).where(ready).order_by(BackgroundJob.run_after).limit(1)
+                ).scalar()
+                if job_id is None:
+                    break
+
+                # O UPDATE condicional garante que apenas um worker fique com a tarefa
+                claimed = db.session.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == job_id, ready)
+                    .values(status='running', locked_at=now, attempts=BackgroundJob.attempts + 1)
+                ).rowcount
+                db.session.commit()
+                if claimed == 1:
+                    return job_id
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return None
+
+    def _run(self, job_id):
+        job = db.session.get(BackgroundJob, job_id)
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise RuntimeError(f'Nenhum handler registrado para {job.kind}')
+            result = handler(job, json.loads(job.payload or '{}'))
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(BackgroundJob, job_id)
+            job.error = str(e)
+            if isinstance(e, JobError) and job.attempts < job.max_attempts:
+                job.status = 'pending'
+                job.run_after = datetime.utcnow() + timedelta(seconds=self._backoff(job.attempts))
+            else:
+                job.status = 'failed'
+                job.finished_at = datetime.utcnow()
+                current_app.logger.warning('Tarefa %s (%s) falhou: %s', job.id, job.kind, e)
+        else:
+            job.status = 'done'
+            job.result = json.dumps(result)
+            job.error = None
+            job.finished_at = datetime.utcnow()
+        job.locked_at = None
+        db.session.commit()
+
+    def _backoff(self, attempts):
+        base = current_app.config['JOB_BACKOFF_BASE']
+        return min(base * (2 ** (attempts - 1)), current_app.config['JOB_BACKOFF_MAX'])
+
+
+job_queue = JobQueue()
+
+
+def job_to_dict(job):
+    """Representação JSON de uma tarefa para o endpoint de acompanhamento"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error if job.status == 'failed' else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+@job_queue.handler('verify_document')
+def verify_document(job, payload):
+    """Verifica um documento com IA e atualiza o ``Document`` correspondente"""
+    from ai_services import DocumentAIService
+    result = DocumentAIService.verify_identity_document(
+        payload['path'],
+        expected_name=payload.get('expected_name'),
+        expected_cpf=payload.get('expected_cpf')
+    )
+    # O serviço devolve 'error' quando a chamada falhou (e não quando o documento é inválido)
+    if result.get('error'):
+        raise JobError(result['error'])
+
+    # Só resultados positivos são reaproveitados: um documento recusado pode passar numa nova tentativa
+    if payload.get('digest') and result.get('is_valid'):
+        remember_verification(payload['digest'], payload.get('expected_name'), payload.get('expected_cpf'), result)
+
+    document = db.session.get(Document, job.document_id) if job.document_id else None
+    if document is not None:
+        apply_verification(document, result)
+        # A mesma foto de documento (ou uma quase idêntica) enviada por outras contas
+        result['possible_duplicates'] = flag_duplicates(document)
+    else:
+        # Tarefas agendadas antes de todo upload ter um Document
+        value = dhash(payload['path'])
+        result['possible_duplicates'] = document_hashes.find_similar(value, exclude_user_id=job.user_id) \
+            if value is not None else []
+    if result['possible_duplicates']:
+        current_app.logger.warning('Documento da tarefa %s parecido com documentos de outras contas: %s',
+                                   job.id, result['possible_duplicates'])
+    return result
+
+
+@job_queue.handler('profile_picture')
+def process_profile_picture(job, payload):
+    """Gera as variantes reduzidas da foto de perfil e as registra no ``Profile``"""
+    from images import store_variants, variant_options
+    profile = db.session.get(Profile, payload['profile_id'])
+    # A foto pode ter sido trocada depois do agendamento; a tarefa da nova foto cuida dela
+    if profile is None or profile.profile_picture != payload['filename']:
+        return {'skipped': True}
+
+    with storage.open(PROFILE_ORIGINALS_FOLDER, payload['filename']) as f:
+        variants = store_variants(storage, f, **variant_options(current_app.config))
+    profile.picture_variants = json.dumps(variants)
+    db.session.commit()
+    return variants
+
+
+@click.command('run-jobs')
+@click.option('--workers', type=int, default=None, help='Número de threads (padrão: JOB_WORKERS).')
+@click.option('--once', is_flag=True, help='Processa as tarefas pendentes e encerra.')
+@with_appcontext
+def run_jobs_command(workers, once):
+    """Executa os workers da fila de tarefas em primeiro plano."""
+    if once:
+        processed = job_queue.run_pending()
+        click.echo(f'{processed} tarefa(s) processada(s).')
+        return
+    job_queue.start(workers)
+    click.echo(f'Workers iniciados ({len(job_queue._threads)}). Ctrl+C para encerrar.')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        job_queue.stop()
@@ -0,0 +1,469 @@
+"""
+Versioned schema migrations for the Know Your Fan database.
+
+Each migration is a numbered, idempotent step registered with
+``@migration``. Applied versions are recorded in the ``schema_version``
+table, so every step runs once per database, in order.
+
+Transactional steps run inside a single transaction together with the
+insert of their version row. Steps that must not hold a long transaction
+(chunked backfills, concurrent index builds) are declared with
+``transactional=False`` and manage their own transactions through the
+helpers on ``MigrationContext``. Chunked backfills record their progress
+in ``migration_progress`` and resume where they stopped if interrupted.
+
+Works on SQLite (development) and PostgreSQL (``DATABASE_URI`` in
+production).
+"""
+
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import (Column, DateTime, Integer, MetaData, String, Table, func, insert, inspect, select,
+                        text, update)
+
+from cpf import normalize as normalize_cpf
+from fan_stats import rebuild as rebuild_fan_stats
+from models import (db, normalize_email, ProfileGame, ProfileTeam, ProfileEvent, ExportWatermark, FanInvite, FanStat,
+                    SegmentChange)
+from search import POSTGRESQL_SCHEMA, POSTGRESQL_UPDATE_VECTORS, SQLITE_SCHEMA
+
+Migration = namedtuple('Migration', 'version description func transactional')
+
+MIGRATIONS = []
+
+_meta = MetaData()
+
+schema_version = Table(
+    'schema_version', _meta,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+migration_progress = Table(
+    'migration_progress', _meta,
+    Column('name', String(100), primary_key=True),
+    Column('last_key', Integer, nullable=False, default=0),
+    Column('rows_done', Integer, nullable=False, default=0),
+    Column('updated_at', DateTime, nullable=False),
+)
+
+
+def migration(version, description, transactional=True):
+    """Register a migration step"""
+    def decorator(func):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, description, func, transactional))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+    return decorator
+
+
+class MigrationContext:
+    """Helpers available to migration steps"""
+
+    def __init__(self, engine, connection=None, echo=print):
+        self.engine = engine
+        self.connection = connection
+        self.echo = echo
+
+    @property
+    def dialect(self):
+        return self.engine.dialect.name
+
+    @property
+    def bind(self):
+        return self.connection if self.connection is not None else self.engine
+
+    def quote(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def has_table(self, table_name):
+        return inspect(self.bind).has_table(table_name)
+
+    def has_column(self, table_name, column_name):
+        return column_name in {c['name'] for c in inspect(self.bind).get_columns(table_name)}
+
+    def has_index(self, table_name, index_name):
+        return index_name in {i['name'] for i in inspect(self.bind).get_indexes(table_name)}
+
+    def execute(self, statement, *args, **kwargs):
+        if isinstance(statement, str):
+            statement = text(statement)
+        if self.connection is not None:
+            return self.connection.execute(statement, *args, **kwargs)
+        with self.engine.begin() as connection:
+            return connection.execute(statement, *args, **kwargs)
+
+    def add_column(self, table_name, column_name, column_type):
+        """ALTER TABLE ... ADD COLUMN, skipped if the column already exists"""
+        if self.has_column(table_name, column_name):
+            return False
+        self.execute(f"ALTER TABLE {self.quote(table_name)} ADD COLUMN {self.quote(column_name)} {column_type}")
+        self.echo(f"  added column {table_name}.{column_name}")
+        return True
+
+    def create_index(self, index_name, table_name, columns, unique=False, using=None):
+        """
+        Create an index if it does not exist yet.
+
+        On PostgreSQL the index is built with CREATE INDEX CONCURRENTLY (outside
+        of a transaction), so writes to the table are not blocked while it builds.
+        Steps that call this must be declared with ``transactional=False``.
+        ``using`` picks the PostgreSQL index method (e.g. ``gin``).
+        """
+        if self.has_index(table_name, index_name):
+            return False
+        column_list = ', '.join(self.quote(column) for column in columns)
+        unique_sql = 'UNIQUE ' if unique else ''
+        if self.dialect == 'postgresql':
+            using_sql = f'USING {using} ' if using else ''
+            if self.connection is not None:
+                raise RuntimeError("create_index needs a non-transactional migration on PostgreSQL")
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.execute(text(
+                    f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {self.quote(index_name)} "
+                    f"ON {self.quote(table_name)} {using_sql}({column_list})"
+                ))
+        else:
+            self.execute(
+                f"CREATE {unique_sql}INDEX IF NOT EXISTS {self.quote(index_name)} "
+                f"ON {self.quote(table_name)} ({column_list})"
+            )
+        self.echo(f"  created index {index_name} on {table_name} ({', '.join(columns)})")
+        return True
+
+    def backfill(self, name, table, columns, process, chunk_size=1000, key='id'):
+        """
+        Run ``process(connection, rows)`` over ``table`` in primary-key order.
+
+        Each chunk is committed together with its progress row, so an
+        interrupted backfill resumes after the last committed chunk.
+        """
+        key_column = table.c[key]
+        with self.engine.begin() as connection:
+            progress = connection.execute(
+                select(migration_progress.c.last_key, migration_progress.c.rows_done)
+                .where(migration_progress.c.name == name)
+            ).first()
+            if progress is None:
+                connection.execute(insert(migration_progress).values(
+                    name=name, last_key=0, rows_done=0, updated_at=datetime.utcnow()
+                ))
+                last_key, rows_done = 0, 0
+            else:
+                last_key, rows_done = progress
+            remaining = connection.execute(
+                select(func.count()).select_from(table).where(key_column > last_key)
+            ).scalar()
+
+        if rows_done:
+            self.echo(f"  resuming {name} after {key}={last_key} ({rows_done} rows already done)")
+        total = rows_done + remaining
+        started = time.perf_counter()
+        while True:
+            with self.engine.begin() as connection:
+                rows = connection.execute(
+                    select(key_column, *[table.c[c] for c in columns])
+                    .where(key_column > last_key)
+                    .order_by(key_column)
+                    .limit(chunk_size)
+                ).all()
+                if not rows:
+                    break
+                process(connection, rows)
+                last_key = rows[-1][0]
+                rows_done += len(rows)
+                connection.execute(
+                    update(migration_progress)
+                    .where(migration_progress.c.name == name)
+                    .values(last_key=last_key, rows_done=rows_done, updated_at=datetime.utcnow())
+                )
+            elapsed = time.perf_counter() - started
+            self.echo(f"  {name}: {rows_done}/{total} rows ({rows_done / total:.0%}, {elapsed:.1f}s)")
+        return rows_done
+
+
+def applied_versions(engine):
+    _meta.create_all(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return set(connection.execute(select(schema_version.c.version)).scalars())
+
+
+def run_migrations(engine, target=None, echo=print):
+    """Apply every pending migration up to ``target`` (inclusive). Returns the versions applied."""
+    applied = applied_versions(engine)
+    done = []
+    for step in MIGRATIONS:
+        if step.version in applied or (target is not None and step.version > target):
+            continue
+        echo(f"Applying migration {step.version:04d}: {step.description}")
+        record = insert(schema_version).values(
+            version=step.version, description=step.description, applied_at=datetime.utcnow()
+        )
+        if step.transactional:
+            with engine.begin() as connection:
+                step.func(MigrationContext(engine, connection, echo))
+                connection.execute(record)
+        else:
+            step.func(MigrationContext(engine, echo=echo))
+            with engine.begin() as connection:
+                connection.execute(record)
+        done.append(step.version)
+    if not done:
+        echo("Database schema is up to date.")
+    return done
+
+
+# --------------------------------------------------------------------------
+# Migration steps
+# --------------------------------------------------------------------------
+
+# Columns that existed before versioned migrations; older databases may lack some
+LEGACY_COLUMNS = {
+    'user': [
+        ('name', 'VARCHAR(100)'),
+        ('address', 'VARCHAR(200)'),
+        ('cpf', 'VARCHAR(14)'),
+        ('birth_date', 'DATE'),
+        ('created_at', 'TIMESTAMP'),
+    ],
+    'profile': [
+        ('interests', 'TEXT'),
+        ('fan_story', 'TEXT'),
+        ('favorite_games', 'TEXT'),
+        ('other_games', 'TEXT'),
+        ('favorite_teams', 'TEXT'),
+        ('other_teams', 'TEXT'),
+        ('events_attended', 'TEXT'),
+        ('other_events', 'TEXT'),
+        ('purchases', 'TEXT'),
+        ('profile_picture', 'VARCHAR(255)'),
+    ],
+    'document': [
+        ('filename', 'VARCHAR(255)'),
+        ('doc_type', 'VARCHAR(50)'),
+        ('upload_date', 'TIMESTAMP'),
+        ('verified', 'BOOLEAN'),
+        ('verification_date', 'TIMESTAMP'),
+        ('digest', 'VARCHAR(64)'),
+    ],
+    'social_account': [
+        ('account_id', 'VARCHAR(255)'),
+        ('username', 'VARCHAR(100)'),
+        ('access_token', 'TEXT'),
+        ('token_expiry', 'TIMESTAMP'),
+        ('last_sync', 'TIMESTAMP'),
+    ],
+    'esports_profile': [
+        ('profile_url', 'VARCHAR(255)'),
+        ('username', 'VARCHAR(100)'),
+        ('verified', 'BOOLEAN'),
+        ('relevance_score', 'FLOAT'),
+        ('verified_date', 'TIMESTAMP'),
+    ],
+}
+
+
+@migration(1, "Create missing tables")
+def create_missing_tables(ctx):
+    db.metadata.create_all(ctx.connection, checkfirst=True)
+
+
+@migration(2, "Add columns missing from pre-migration databases")
+def add_legacy_columns(ctx):
+    for table_name, columns in LEGACY_COLUMNS.items():
+        for column_name, column_type in columns:
+            ctx.add_column(table_name, column_name, column_type)
+
+
+# Multi-value profile columns and the association tables that replace them
+PROFILE_CHOICE_TABLES = [
+    ('favorite_games', ProfileGame.__table__, 'game'),
+    ('favorite_teams', ProfileTeam.__table__, 'team'),
+    ('events_attended', ProfileEvent.__table__, 'event'),
+]
+
+
+@migration(3, "Backfill profile_game/profile_team/profile_event from legacy columns", transactional=False)
+def backfill_profile_choices(ctx):
+    def process(connection, rows):
+        profile_ids = [row.id for row in rows]
+        for column, table, field in PROFILE_CHOICE_TABLES:
+            existing = set(connection.execute(
+                select(table.c.profile_id, table.c[field]).where(table.c.profile_id.in_(profile_ids))
+            ).all())
+            new_rows = []
+            for row in rows:
+                values = getattr(row, column) or ''
+                for value in dict.fromkeys(v.strip() for v in values.split(',') if v.strip()):
+                    if (row.id, value) not in existing:
+                        new_rows.append({'profile_id': row.id, field: value})
+            if new_rows:
+                connection.execute(insert(table), new_rows)
+
+    ctx.backfill(
+        'profile_choices',
+        db.metadata.tables['profile'],
+        [column for column, _, _ in PROFILE_CHOICE_TABLES],
+        process,
+        chunk_size=500
+    )
+
+
+@migration(4, "Index foreign keys and hot lookup columns", transactional=False)
+def index_lookup_columns(ctx):
+    ctx.create_index('ix_document_user_id', 'document', ['user_id'])
+    ctx.create_index('ix_document_digest', 'document', ['digest'])
+    ctx.create_index('ix_esports_profile_user_id', 'esports_profile', ['user_id'])
+    ctx.create_index('ix_social_account_user_platform_username', 'social_account',
+                     ['user_id', 'platform', 'username'])
+
+
+@migration(5, "Widen user.password_hash for scrypt/argon2 hashes")
+def widen_password_hash(ctx):
+    # SQLite does not enforce VARCHAR lengths; only PostgreSQL needs the ALTER
+    if ctx.dialect == 'postgresql':
+        ctx.execute(f"ALTER TABLE {ctx.quote('user')} ALTER COLUMN password_hash TYPE VARCHAR(255)")
+        ctx.echo("  widened user.password_hash to VARCHAR(255)")
+
+
+@migration(6, "Create export_watermark table")
+def create_export_watermark(ctx):
+    ExportWatermark.__table__.create(ctx.connection, checkfirst=True)
+
+
+@migration(7, "Add fan engagement score columns", transactional=False)
+def add_engagement_score(ctx):
+    ctx.add_column('user', 'engagement_score', 'FLOAT')
+    ctx.add_column('user', 'engagement_percentile', 'FLOAT')
+    # Existing fans start dirty so the next 'flask score-fans' scores everyone
+    ctx.add_column('user', 'score_dirty', 'BOOLEAN NOT NULL DEFAULT TRUE')
+    ctx.add_column('user', 'scored_at', 'TIMESTAMP')
+    ctx.create_index('ix_user_engagement_score', 'user', ['engagement_score'])
+    ctx.create_index('ix_user_engagement_percentile', 'user', ['engagement_percentile'])
+    ctx.create_index('ix_user_score_dirty', 'user', ['score_dirty'])
+
+
+@migration(8, "Add profile.picture_variants")
+def add_picture_variants(ctx):
+    ctx.add_column('profile', 'picture_variants', 'TEXT')
+
+
+@migration(9, "Add document perceptual hash columns", transactional=False)
+def add_document_phash(ctx):
+    ctx.add_column('document', 'phash', 'VARCHAR(16)')
+    for i in range(4):
+        ctx.add_column('document', f'phash_{i}', 'INTEGER')
+        ctx.create_index(f'ix_document_phash_{i}', 'document', [f'phash_{i}'])
+    # Existing uploads are hashed by 'flask phash-documents', which reads the files
+    ctx.echo("  run 'flask phash-documents' to hash documents uploaded before this migration")
+
+
+@migration(10, "Store user.cpf as canonical 11 digits", transactional=False)
+def canonicalize_cpf(ctx):
+    user = db.metadata.tables['user']
+    skipped = []
+
+    def process(connection, rows):
+        for row in rows:
+            canonical = normalize_cpf(row.cpf)
+            if row.cpf is None or canonical == row.cpf:
+                continue
+            if canonical is None or len(canonical) != 11:
+                skipped.append((row.id, row.cpf, 'not 11 digits'))
+                continue
+            # Two accounts typed the same CPF differently: keep both rows untouched for review
+            taken = connection.execute(
+                select(user.c.id).where(user.c.cpf == canonical, user.c.id != row.id)
+            ).first()
+            if taken is not None:
+                skipped.append((row.id, row.cpf, f'same CPF as user {taken.id}'))
+                continue
+            connection.execute(update(user).where(user.c.id == row.id).values(cpf=canonical))
+
+    ctx.backfill('user_cpf_canonical', user, ['cpf'], process)
+    for user_id, value, reason in skipped:
+        ctx.echo(f"  left user {user_id} cpf {value!r} as is ({reason})")
+
+
+@migration(11, "Create fan_invite table")
+def create_fan_invite(ctx):
+    FanInvite.__table__.create(ctx.connection, checkfirst=True)
+
+
+@migration(12, "Create fan_stat summary table")
+def create_fan_stat(ctx):
+    FanStat.__table__.create(ctx.connection, checkfirst=True)
+    # Existing fans are counted once here; the session hooks keep the table current from now on
+    rebuild_fan_stats(ctx.connection)
+
+
+@migration(13, "Add full-text search index over profile free text", transactional=False)
+def add_profile_search(ctx):
+    if ctx.dialect == 'sqlite':
+        for statement in SQLITE_SCHEMA:
+            ctx.execute(statement)
+        # The triggers only see new writes; existing profiles are indexed in one pass
+        ctx.execute("INSERT INTO profile_fts(profile_fts) VALUES ('rebuild')")
+        ctx.echo("  created profile_fts and its triggers")
+    elif ctx.dialect == 'postgresql':
+        ctx.add_column('profile', 'search_vector', 'TSVECTOR')
+        for statement in POSTGRESQL_SCHEMA:
+            ctx.execute(statement)
+
+        # The trigger covers new writes from here on; older rows are filled in chunks
+        def process(connection, rows):
+            connection.execute(POSTGRESQL_UPDATE_VECTORS, {'first': rows[0].id, 'last': rows[-1].id})
+
+        ctx.backfill('profile_search_vector', db.metadata.tables['profile'], [], process, chunk_size=5000)
+        ctx.create_index('ix_profile_search_vector', 'profile', ['search_vector'], using='gin')
+    else:
+        ctx.echo(f"  no full-text index for {ctx.dialect}; search falls back to LIKE")
+
+
+@migration(14, "Create segment_change log table")
+def create_segment_change(ctx):
+    SegmentChange.__table__.create(ctx.connection, checkfirst=True)
+
+
+@migration(15, "Record possible duplicate documents")
+def add_document_possible_duplicates(ctx):
+    ctx.add_column('document', 'possible_duplicates', 'TEXT')
+
+
+@migration(16, "Store user.email in lowercase", transactional=False)
+def lowercase_emails(ctx):
+    user = db.metadata.tables['user']
+    skipped = []
+
+    def process(connection, rows):
+        for row in rows:
+            normalized = normalize_email(row.email)
+            if normalized is None or normalized == row.email:
+                continue
+            # Two accounts registered the same address with different case: keep both for review
+            taken = connection.execute(
+                select(user.c.id).where(user.c.email == normalized, user.c.id != row.id)
+            ).first()
+            if taken is not None:
+                skipped.append((row.id, row.email, taken.id))
+                continue
+            connection.execute(update(user).where(user.c.id == row.id).values(email=normalized))
+
+    ctx.backfill('user_email_lowercase', user, ['email'], process)
+    for user_id, value, other_id in skipped:
+        ctx.echo(f"  left user {user_id} email {value!r} as is (same address as user {other_id})")
+
+
+@click.command('db-upgrade')
+@click.option('--target', type=int, default=None, help='Stop after this migration version.')
+@with_appcontext
+def db_upgrade_command(target):
+    """Apply pending database migrations."""
+    run_migrations(db.engine, target=target, echo=click.echo)
@@ -1,22 +1,73 @@
 from flask_sqlalchemy import SQLAlchemy
 # Importações atualizadas para compatibilidade com Flask 3.x
-from werkzeug.security import generate_password_hash, check_password_hash
+import json
 from datetime import datetime
 from flask_login import UserMixin
+from hashing import password_hasher
 
 db = SQLAlchemy()
 
+def normalize_email(value):
+    """E-mail na forma guardada em ``User.email`` (sem espaços, minúsculo); None se vazio"""
+    if value is None:
+        return None
+    return value.strip().lower() or None
+
+class ChoiceList:
+    """
+    Lista de códigos de uma escolha múltipla do ProfileForm (jogos, times, eventos),
+    guardada numa tabela de associação.
+
+    A leitura devolve a mesma lista de códigos usada em ``form.<campo>.data``; a
+    escrita sincroniza as linhas da tabela de associação e mantém a coluna de texto
+    antiga (valores separados por vírgula) atualizada enquanto ela existir.
+    """
+
+    def __init__(self, links, field, legacy_column):
+        self.links = links
+        self.field = field
+        self.legacy_column = legacy_column
+
+    def __get__(self, profile, owner):
+        if profile is None:
+            return self
+        links = getattr(profile, self.links)
+        if links:
+            return [getattr(link, self.field) for link in links]
+        # Perfis ainda não migrados para a tabela de associação
+        legacy = getattr(profile, self.legacy_column)
+        return [value.strip() for value in legacy.split(',') if value.strip()] if legacy else []
+
+    def __set__(self, profile, values):
+        values = list(dict.fromkeys(value for value in values or [] if value))
+        links = getattr(profile, self.links)
+        for link in list(links):
+            if getattr(link, self.field) not in values:
+                links.remove(link)
+        existing = {getattr(link, self.field) for link in links}
+        link_model = getattr(type(profile), self.links).property.mapper.class_
+        for value in values:
+            if value not in existing:
+                links.append(link_model(**{self.field: value}))
+        setattr(profile, self.legacy_column, ','.join(values))
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(255))
     name = db.Column(db.String(100), nullable=True)
     address = db.Column(db.String(200), nullable=True)
     cpf = db.Column(db.String(14), unique=True, nullable=True)
     birth_date = db.Column(db.Date, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Pontuação de engajamento (ver scoring.py)
+    engagement_score = db.Column(db.Float, index=True)  # 0 a 100
+    engagement_percentile = db.Column(db.Float, index=True)
+    score_dirty = db.Column(db.Boolean, default=True, nullable=False, index=True)
+    scored_at = db.Column(db.DateTime)
+    
     # Relacionamentos
     profile = db.relationship('Profile', backref='user', uselist=False)
     documents = db.relationship('Document', backref='user', lazy=True)
@@ -24,10 +75,10 @@ class User(UserMixin, db.Model):
     esports_profiles = db.relationship('EsportsProfile', backref='user', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
 
 class Profile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -42,15 +93,108 @@ class Profile(db.Model):
     other_events = db.Column(db.Text)
     purchases = db.Column(db.Text)
     profile_picture = db.Column(db.String(255))
+    picture_variants = db.Column(db.Text)  # JSON {tamanho: {formato: arquivo}} gerado por images.py
+
+    # Escolhas múltiplas normalizadas (profile_game, profile_team, profile_event)
+    game_links = db.relationship('ProfileGame', cascade='all, delete-orphan', lazy=True)
+    team_links = db.relationship('ProfileTeam', cascade='all, delete-orphan', lazy=True)
+    event_links = db.relationship('ProfileEvent', cascade='all, delete-orphan', lazy=True)
+
+    favorite_game_list = ChoiceList('game_links', 'game', 'favorite_games')
+    favorite_team_list = ChoiceList('team_links', 'team', 'favorite_teams')
+    events_attended_list = ChoiceList('event_links', 'event', 'events_attended')
+
+    def picture_for(self, size, fmt='webp'):
+        """
+        Arquivo da menor variante da foto com pelo menos ``size`` pixels, ou
+        None enquanto as variantes não foram geradas (o original, com EXIF, não é público)
+        """
+        variants = json.loads(self.picture_variants) if self.picture_variants else {}
+        available = sorted(int(key) for key in variants)
+        if not available:
+            return None
+        chosen = next((key for key in available if key >= size), available[-1])
+        files = variants[str(chosen)]
+        return files.get(fmt) or next(iter(files.values()))
+
+    @classmethod
+    def query_by_choices(cls, game=None, team=None, event=None):
+        """Perfis que têm todas as escolhas informadas (usa os índices das tabelas de associação)"""
+        query = cls.query
+        if game:
+            query = query.join(ProfileGame, ProfileGame.profile_id == cls.id).filter(ProfileGame.game == game)
+        if team:
+            query = query.join(ProfileTeam, ProfileTeam.profile_id == cls.id).filter(ProfileTeam.team == team)
+        if event:
+            query = query.join(ProfileEvent, ProfileEvent.profile_id == cls.id).filter(ProfileEvent.event == event)
+        return query
+
+class ProfileGame(db.Model):
+    __tablename__ = 'profile_game'
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id', ondelete='CASCADE'), primary_key=True)
+    game = db.Column(db.String(50), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_profile_game_game_profile', 'game', 'profile_id'),
+    )
+
+class ProfileTeam(db.Model):
+    __tablename__ = 'profile_team'
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id', ondelete='CASCADE'), primary_key=True)
+    team = db.Column(db.String(50), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_profile_team_team_profile', 'team', 'profile_id'),
+    )
+
+class ProfileEvent(db.Model):
+    __tablename__ = 'profile_event'
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id', ondelete='CASCADE'), primary_key=True)
+    event = db.Column(db.String(50), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_profile_event_event_profile', 'event', 'profile_id'),
+    )
 
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     filename = db.Column(db.String(255))
     doc_type = db.Column(db.String(50))  # RG, CPF, comprovante de residência, etc.
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     verified = db.Column(db.Boolean, default=False)
     verification_date = db.Column(db.DateTime)
+    digest = db.Column(db.String(64), index=True)  # SHA-256 do arquivo (ver StoredBlob)
+    # dHash de 64 bits (hexadecimal) e seus pedaços de 16 bits indexados (ver phash.py)
+    phash = db.Column(db.String(16))
+    phash_0 = db.Column(db.Integer, index=True)
+    phash_1 = db.Column(db.Integer, index=True)
+    phash_2 = db.Column(db.Integer, index=True)
+    phash_3 = db.Column(db.Integer, index=True)
+    # JSON com os documentos parecidos de outras contas achados na verificação (ver phash.py)
+    possible_duplicates = db.Column(db.Text)
+
+class StoredBlob(db.Model):
+    """Arquivo endereçado por conteúdo, compartilhado por todos os Documents com o mesmo digest"""
+    digest = db.Column(db.String(64), primary_key=True)
+    folder = db.Column(db.String(50), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class VerificationCache(db.Model):
+    """Resultado de verificação reaproveitado para reenvios do mesmo arquivo"""
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), nullable=False)
+    expected_name = db.Column(db.String(100), nullable=False, default='')
+    expected_cpf = db.Column(db.String(14), nullable=False, default='')
+    result = db.Column(db.Text, nullable=False)  # JSON devolvido pelo DocumentAIService
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('digest', 'expected_name', 'expected_cpf', name='uq_verification_cache_key'),
+    )
 
 class SocialAccount(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -62,12 +206,81 @@ class SocialAccount(db.Model):
     token_expiry = db.Column(db.DateTime)
     last_sync = db.Column(db.DateTime)
 
+    # Também atende as consultas só por user_id (prefixo do índice)
+    __table_args__ = (
+        db.Index('ix_social_account_user_platform_username', 'user_id', 'platform', 'username'),
+    )
+
 class EsportsProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     platform = db.Column(db.String(50))  # Steam, Battlenet, Twitch, etc.
     profile_url = db.Column(db.String(255))
     username = db.Column(db.String(100))
     verified = db.Column(db.Boolean, default=False)
     relevance_score = db.Column(db.Float, default=0.0)  # Score calculado pelo AI
-    verified_date = db.Column(db.DateTime)
\ No newline at end of file
+    verified_date = db.Column(db.DateTime)
+
+class BackgroundJob(db.Model):
+    """Tarefa executada fora do ciclo da requisição (ex.: verificação de documentos)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=True)
+    payload = db.Column(db.Text)  # JSON com os parâmetros da tarefa
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, done, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)  # JSON com o resultado
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_background_job_status_run_after', 'status', 'run_after'),
+    )
+
+class SocialAnalysisCache(db.Model):
+    """Última análise de um perfil social, compartilhada entre os workers"""
+    id = db.Column(db.Integer, primary_key=True)
+    platform = db.Column(db.String(50), nullable=False)
+    username = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON devolvido pelo SocialMediaAnalyzer
+    relevance_score = db.Column(db.Float)  # esports_relevance_score extraído do payload
+    fetched_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('platform', 'username', name='uq_social_analysis_cache_key'),
+    )
+
+class ExportWatermark(db.Model):
+    """Marca d'água das exportações incrementais (``flask export-fans --incremental``)"""
+    name = db.Column(db.String(100), primary_key=True)
+    watermark = db.Column(db.DateTime, nullable=False)  # início da última exportação concluída
+    rows = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class FanInvite(db.Model):
+    """Convite para um fã importado em massa definir a senha (ver fan_import.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 do token enviado ao fã
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    used_at = db.Column(db.DateTime)
+
+class SegmentChange(db.Model):
+    """Usuário cujos segmentos mudaram; os outros processos leem para atualizar o índice (segments.py)"""
+    __tablename__ = 'segment_change'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)  # sem FK: o usuário pode ter sido removido
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class FanStat(db.Model):
+    """Contagem agregada por (dimensão, valor), mantida por fan_stats.py"""
+    __tablename__ = 'fan_stat'
+    dimension = db.Column(db.String(30), primary_key=True)  # fans, game, team, event, document, social, esports...
+    value = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
@@ -0,0 +1,175 @@
+"""
+Hash perceptual dos documentos enviados, para achar a mesma foto de
+documento usada por contas diferentes.
+
+O dHash de 64 bits compara o brilho de pixels vizinhos numa miniatura 9x8 em
+tons de cinza, então sobrevive a recompressão, redimensionamento e pequenos
+ajustes de cor. Imagens parecidas têm hashes a poucos bits de distância
+(distância de Hamming).
+
+Para a busca não percorrer todos os documentos, o hash é guardado também em
+quatro pedaços de 16 bits, cada um numa coluna indexada (``phash_0`` a
+``phash_3``). Se dois hashes estão a até ``d`` bits de distância, pelo
+princípio da casa dos pombos ao menos um dos pedaços difere em no máximo
+``d // 4`` bits; a consulta procura, pelos índices, os pedaços a essa
+distância e só os candidatos encontrados têm a distância completa calculada.
+"""
+
+from itertools import combinations
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from PIL import Image, ImageOps
+from sqlalchemy import or_, select
+
+from models import db, Document
+from storage import storage
+
+HASH_SIZE = 8  # 8x8 = 64 bits
+CHUNK_BITS = 16
+CHUNKS = 4
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Imagens lisas (página em branco, uma cor só) dão hashes quase só de 0 ou de 1,
+# que coincidiriam entre si sem serem a mesma foto
+MIN_EDGE_BITS = 4
+
+CHUNK_COLUMNS = [Document.phash_0, Document.phash_1, Document.phash_2, Document.phash_3]
+
+
+def dhash(stream):
+    """dHash de 64 bits da imagem em ``stream``, ou None se não for uma imagem"""
+    try:
+        image = Image.open(stream)
+        # Para JPEG, decodifica já reduzido: a miniatura tem só 9x8 pixels
+        image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image).convert('L')
+        image = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def is_informative(value):
+    ones = bin(value).count('1')
+    return MIN_EDGE_BITS <= ones <= HASH_SIZE * HASH_SIZE - MIN_EDGE_BITS
+
+
+def to_chunks(value):
+    return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def chunk_neighbours(chunk, radius):
+    """Valores de 16 bits a no máximo ``radius`` bits de ``chunk``"""
+    values = [chunk]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), distance):
+            flipped = chunk
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+def set_document_hash(document, value):
+    """Grava o hash (hexadecimal) e os pedaços indexados no ``Document``"""
+    if value is None:
+        document.phash = None
+        document.phash_0 = document.phash_1 = document.phash_2 = document.phash_3 = None
+        return
+    document.phash = f'{value:016x}'
+    document.phash_0, document.phash_1, document.phash_2, document.phash_3 = to_chunks(value)
+
+
+def hash_document(document):
+    """Calcula e grava o hash do arquivo do ``Document``; retorna o hash ou None"""
+    with storage.open('documents', document.filename) as f:
+        value = dhash(f)
+    set_document_hash(document, value)
+    return value
+
+
+class DocumentHashIndex:
+    """Busca de documentos parecidos pelos pedaços indexados do hash"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PHASH_MAX_DISTANCE', 6)  # bits, de 64
+        app.config.setdefault('PHASH_MAX_MATCHES', 20)
+        app.extensions['document_hashes'] = self
+        app.cli.add_command(phash_documents_command)
+
+    def find_similar(self, value, max_distance=None, exclude_user_id=None, exclude_document_id=None):
+        """
+        Documentos com hash a até ``max_distance`` bits de ``value``, do mais
+        parecido para o menos. Retorna dicts com document_id, user_id, digest e
+        distance.
+        """
+        if not is_informative(value):
+            return []
+        if max_distance is None:
+            max_distance = current_app.config['PHASH_MAX_DISTANCE']
+        radius = max_distance // CHUNKS
+        query = select(Document.id, Document.user_id, Document.digest, Document.phash).where(or_(*[
+            column.in_(chunk_neighbours(chunk, radius))
+            for column, chunk in zip(CHUNK_COLUMNS, to_chunks(value))
+        ]))
+        if exclude_user_id is not None:
+            query = query.where(Document.user_id != exclude_user_id)
+        if exclude_document_id is not None:
+            query = query.where(Document.id != exclude_document_id)
+
+        matches = []
+        for document_id, user_id, digest, phash in db.session.execute(query):
+            distance = hamming(value, int(phash, 16))
+            if distance <= max_distance:
+                matches.append({'document_id': document_id, 'user_id': user_id, 'digest': digest,
+                                'distance': distance})
+        matches.sort(key=lambda match: (match['distance'], match['document_id']))
+        return matches[:current_app.config['PHASH_MAX_MATCHES']]
+
+
+document_hashes = DocumentHashIndex()
+
+
+@click.command('phash-documents')
+@click.option('--all', 'rehash', is_flag=True, help='Recompute hashes that are already stored.')
+@click.option('--chunk-size', type=int, default=500, show_default=True)
+@with_appcontext
+def phash_documents_command(rehash, chunk_size):
+    """Compute perceptual hashes for uploaded documents."""
+    hashed = skipped = 0
+    last_id = 0
+    while True:
+        query = Document.query.filter(Document.id > last_id, Document.filename.isnot(None))
+        if not rehash:
+            query = query.filter(Document.phash.is_(None))
+        documents = query.order_by(Document.id).limit(chunk_size).all()
+        if not documents:
+            break
+        for document in documents:
+            try:
+                value = hash_document(document)
+            except FileNotFoundError:
+                value = None
+            if value is None:
+                skipped += 1
+            else:
+                hashed += 1
+        db.session.commit()
+        last_id = documents[-1].id
+    click.echo(f"Hashed {hashed} documents; {skipped} are not images or are missing.")
@@ -0,0 +1,252 @@
+"""
+Pontuação de engajamento dos fãs.
+
+Os sinais de cada fã (relevância dos perfis de e-sports, relevância das
+análises sociais, documento verificado, eventos de que participou e
+compras declaradas) são carregados coluna a coluna em arrays NumPy e
+combinados numa única passada vetorizada. O resultado fica em
+``User.engagement_score`` (0 a 100) e ``User.engagement_percentile``, ambas
+indexadas, de modo que rankings e níveis de recompensa são uma leitura pelo
+índice.
+
+Alterações no perfil, documentos e contas marcam o usuário com
+``score_dirty`` (pelo coletor de ``changes.py``); ``flask score-fans`` recalcula só os
+marcados e depois ajusta os percentis de todos a partir da coluna já gravada.
+"""
+
+import re
+from datetime import datetime
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, func, select, update
+
+from changes import changed_users
+from models import (db, User, Profile, ProfileEvent, Document, SocialAccount, EsportsProfile,
+                    SocialAnalysisCache)
+
+# Peso de cada sinal na pontuação (somam 1)
+DEFAULT_WEIGHTS = {
+    'esports': 0.30,
+    'social': 0.25,
+    'verified': 0.15,
+    'events': 0.15,
+    'purchases': 0.15,
+}
+
+# Quantidade em que o sinal de eventos/compras chega a ~63% do máximo (1 - e^-1)
+EVENTS_SCALE = 3.0
+PURCHASES_SCALE = 3.0
+
+# Níveis de recompensa por percentil mínimo
+TIERS = [
+    (95.0, 'diamante'),
+    (80.0, 'ouro'),
+    (50.0, 'prata'),
+    (0.0, 'bronze'),
+]
+
+PURCHASE_SEPARATORS = re.compile(r'[\n,;]+')
+
+# Alterações nestes modelos mudam algum sinal da pontuação do usuário dono
+SCORED_MODELS = (Profile, ProfileEvent, Document, SocialAccount, EsportsProfile)
+
+
+def tier_for(percentile):
+    if percentile is None:
+        return None
+    for minimum, name in TIERS:
+        if percentile >= minimum:
+            return name
+    return TIERS[-1][1]
+
+
+def count_purchases(text):
+    """Número de itens na descrição livre das compras (um por linha, vírgula ou ponto e vírgula)"""
+    if not text:
+        return 0
+    return sum(1 for item in PURCHASE_SEPARATORS.split(text) if item.strip())
+
+
+def _scatter(ids, rows, dtype=np.float64):
+    """Array alinhado com ``ids`` (ordenados) preenchido com os pares (user_id, valor) de ``rows``"""
+    values = np.zeros(len(ids), dtype=dtype)
+    if rows:
+        user_ids, column = zip(*rows)
+        positions = np.searchsorted(ids, np.fromiter(user_ids, dtype=np.int64, count=len(user_ids)))
+        values[positions] = np.array([value or 0 for value in column], dtype=dtype)
+    return values
+
+
+def load_signals(conn, ids):
+    """
+    Sinais brutos dos usuários ``ids`` (array ordenado), um array por sinal.
+    Faz uma consulta agregada por sinal.
+    """
+    id_list = ids.tolist()
+    esports = conn.execute(
+        select(EsportsProfile.user_id, func.max(EsportsProfile.relevance_score))
+        .where(EsportsProfile.user_id.in_(id_list)).group_by(EsportsProfile.user_id)
+    ).all()
+    social = conn.execute(
+        select(SocialAccount.user_id, func.max(SocialAnalysisCache.relevance_score))
+        .join(SocialAnalysisCache, (SocialAnalysisCache.platform == SocialAccount.platform)
+              & (SocialAnalysisCache.username == SocialAccount.username))
+        .where(SocialAccount.user_id.in_(id_list)).group_by(SocialAccount.user_id)
+    ).all()
+    verified = conn.execute(
+        select(Document.user_id, func.count())
+        .where(Document.user_id.in_(id_list), Document.verified.is_(True)).group_by(Document.user_id)
+    ).all()
+    events = conn.execute(
+        select(Profile.user_id, func.count())
+        .join(ProfileEvent, ProfileEvent.profile_id == Profile.id)
+        .where(Profile.user_id.in_(id_list)).group_by(Profile.user_id)
+    ).all()
+    purchases = [
+        (user_id, count_purchases(text)) for user_id, text in conn.execute(
+            select(Profile.user_id, Profile.purchases)
+            .where(Profile.user_id.in_(id_list), Profile.purchases.isnot(None))
+        )
+    ]
+    return {
+        'esports': _scatter(ids, esports),
+        'social': _scatter(ids, social),
+        'verified': _scatter(ids, verified),
+        'events': _scatter(ids, events),
+        'purchases': _scatter(ids, purchases),
+    }
+
+
+def compute_scores(signals, weights=None):
+    """Pontuação de 0 a 100 para cada posição dos arrays de ``signals``"""
+    weights = weights or DEFAULT_WEIGHTS
+    normalized = {
+        'esports': np.clip(signals['esports'], 0.0, 1.0),
+        'social': np.clip(signals['social'], 0.0, 1.0),
+        'verified': (signals['verified'] > 0).astype(np.float64),
+        'events': 1.0 - np.exp(-signals['events'] / EVENTS_SCALE),
+        'purchases': 1.0 - np.exp(-signals['purchases'] / PURCHASES_SCALE),
+    }
+    total = sum(weights.values())
+    score = sum(normalized[name] * weight for name, weight in weights.items()) / total
+    return np.round(score * 100.0, 2)
+
+
+def compute_percentiles(scores):
+    """Percentual de fãs com pontuação menor ou igual (0 a 100)"""
+    if not len(scores):
+        return scores
+    ordered = np.sort(scores)
+    return np.round(np.searchsorted(ordered, scores, side='right') / len(scores) * 100.0, 2)
+
+
+def mark_users_dirty(conn, user_ids):
+    """Marca usuários para recálculo; ``user_ids`` pode ser uma lista ou um SELECT de ids"""
+    conn.execute(update(User.__table__).where(User.id.in_(user_ids)).values(score_dirty=True))
+
+
+class FanScorer:
+    """Recalcula e grava as pontuações de engajamento"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SCORE_WEIGHTS', DEFAULT_WEIGHTS)
+        app.config.setdefault('SCORE_CHUNK_SIZE', 5000)
+        app.config.setdefault('SCORE_PERCENTILE_TOLERANCE', 0.01)  # evita regravar percentis iguais
+        app.extensions['fan_scorer'] = self
+        app.cli.add_command(score_fans_command)
+        changed_users.subscribe(SCORED_MODELS, after_flush=_mark_changed_users)
+
+    def score(self, full=False):
+        """Recalcula os usuários marcados (ou todos, com ``full``). Retorna (pontuados, percentis alterados)"""
+        chunk_size = current_app.config['SCORE_CHUNK_SIZE']
+        table = User.__table__
+        scored = 0
+        last_id = 0
+        while True:
+            with db.engine.begin() as conn:
+                query = select(table.c.id).where(table.c.id > last_id).order_by(table.c.id).limit(chunk_size)
+                if not full:
+                    query = query.where(table.c.score_dirty.is_(True))
+                ids = np.array(conn.execute(query).scalars().all(), dtype=np.int64)
+                if not len(ids):
+                    break
+                # Desmarca antes de ler os sinais: alterações concorrentes voltam a marcar
+                conn.execute(update(table).where(table.c.id.in_(ids.tolist())).values(score_dirty=False))
+                scores = compute_scores(load_signals(conn, ids), current_app.config['SCORE_WEIGHTS'])
+                now = datetime.utcnow()
+                conn.execute(
+                    update(table).where(table.c.id == bindparam('user_id'))
+                    .values(engagement_score=bindparam('score'), scored_at=now),
+                    [{'user_id': int(user_id), 'score': float(score)} for user_id, score in zip(ids, scores)]
+                )
+            scored += len(ids)
+            last_id = int(ids[-1])
+        changed = self.update_percentiles() if scored else 0
+        return scored, changed
+
+    def update_percentiles(self):
+        """Recalcula os percentis de todos a partir de ``engagement_score``; grava só os que mudaram"""
+        table = User.__table__
+        tolerance = current_app.config['SCORE_PERCENTILE_TOLERANCE']
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.engagement_score, table.c.engagement_percentile)
+                .where(table.c.engagement_score.isnot(None))
+            ).all()
+            if not rows:
+                return 0
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            scores = np.array([row[1] for row in rows], dtype=np.float64)
+            current = np.array([row[2] if row[2] is not None else np.nan for row in rows], dtype=np.float64)
+            percentiles = compute_percentiles(scores)
+            changed = np.isnan(current) | (np.abs(percentiles - current) >= tolerance)
+            if changed.any():
+                conn.execute(
+                    update(table).where(table.c.id == bindparam('user_id'))
+                    .values(engagement_percentile=bindparam('percentile')),
+                    [{'user_id': int(user_id), 'percentile': float(percentile)}
+                     for user_id, percentile in zip(ids[changed], percentiles[changed])]
+                )
+            return int(changed.sum())
+
+    def leaderboard(self, limit=20, offset=0):
+        """Fãs com maior pontuação (lido pelo índice de ``engagement_score``)"""
+        return (
+            User.query.filter(User.engagement_score.isnot(None))
+            .order_by(User.engagement_score.desc(), User.id)
+            .offset(offset).limit(limit).all()
+        )
+
+
+fan_scorer = FanScorer()
+
+
+def score_to_dict(user):
+    return {
+        'user_id': user.id,
+        'username': user.username,
+        'engagement_score': user.engagement_score,
+        'engagement_percentile': user.engagement_percentile,
+        'tier': tier_for(user.engagement_percentile),
+        'scored_at': user.scored_at.isoformat() if user.scored_at else None
+    }
+
+
+def _mark_changed_users(session, user_ids):
+    mark_users_dirty(session.connection(), list(user_ids))
+
+
+@click.command('score-fans')
+@click.option('--full', is_flag=True, help='Rescore every fan, not only the ones marked dirty.')
+@with_appcontext
+def score_fans_command(full):
+    """Recompute fan engagement scores and percentiles."""
+    scored, changed = fan_scorer.score(full=full)
+    click.echo(f"Scored {scored} fans; {changed} percentiles updated.")
@@ -0,0 +1,378 @@
+"""
+Busca textual nos campos livres do perfil (``fan_story``, ``interests``,
+``other_games``, ``other_teams`` e ``other_events``).
+
+- SQLite: tabela FTS5 ``profile_fts`` com conteúdo externo (a própria
+  ``profile``) e tokenizador ``unicode61 remove_diacritics 2``; a relevância
+  é o ``bm25``.
+- PostgreSQL: coluna ``profile.search_vector`` (tsvector) com índice GIN, na
+  configuração ``kyf_portuguese`` (``unaccent`` + ``portuguese_stem``); a
+  relevância é o ``ts_rank_cd``.
+
+Nos dois casos o índice é mantido por triggers no banco, então INSERTs em
+lote fora do ORM (``fan_import``, ``benchmarks.datagen``) também entram. A
+consulta do usuário vira termos sem acento: palavras soltas (todas
+obrigatórias) e frases entre aspas. No SQLite, que não tem stemmer em
+português, cada palavra com 4 letras ou mais vira um OR das suas formas de
+plural e gênero ("campeões" encontra "campeã" e "campeão"); termos exatos
+custam bem menos ao FTS5 que buscas por prefixo. Palavras curtas ("arT",
+"Rio") são buscadas exatas.
+
+Ordenar por relevância exige pontuar todos os perfis encontrados, o que cresce
+com a base para termos comuns ("furia" aparece em quase todos). Por isso só os
+``SEARCH_MAX_CANDIDATES`` perfis mais recentes que casam com a consulta são
+pontuados: para termos raros o resultado é exato, para termos comuns é o
+ranking entre os mais recentes (a resposta traz ``truncated``), e o custo não
+depende do tamanho da base. A paginação (limit/offset) busca uma linha a mais
+para saber se há próxima página, sem contar todos os resultados, e o trecho
+destacado é montado em Python só para as linhas da página.
+"""
+
+import re
+import time
+import unicodedata
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import literal, text
+
+from models import db, Profile, User
+
+SEARCH_COLUMNS = ('fan_story', 'interests', 'other_games', 'other_teams', 'other_events')
+TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+WORD = re.compile(r'[a-z0-9]+')
+TEXT_WORD = re.compile(r'\w+')
+
+# Plural -> singular (sufixo, substituto), usado para gerar as flexões no SQLite
+PLURALS = (('oes', 'ao'), ('aes', 'ao'), ('aos', 'ao'), ('ais', 'al'), ('eis', 'el'), ('ois', 'ol'), ('uis', 'ul'),
+           ('ns', 'm'), ('res', 'r'), ('zes', 'z'), ('s', ''))
+# Terminação do singular -> terminações buscadas a partir do radical
+ENDINGS = (
+    ('ao', ('ao', 'oes', 'aes', 'aos', 'a', 'as')),  # campeão, campeões, campeã
+    ('a', ('', 'a', 'o', 'e', 'as', 'os', 'es', 'ao', 'oes')),  # torcedora, torcedor, torcedores
+    ('o', ('', 'a', 'o', 'e', 'as', 'os', 'es', 'ao', 'oes')),
+    ('e', ('', 'a', 'o', 'e', 'as', 'os', 'es')),
+    ('l', ('l', 'is')),  # mundial, mundiais
+    ('m', ('m', 'ns')),
+    ('r', ('r', 'res', 'ra', 'ras')),
+    ('z', ('z', 'zes')),
+)
+MIN_ROOT = 3
+INFLECT_MIN_LENGTH = 4
+SNIPPET_WORDS = 24
+SNIPPET_CONTEXT = 6  # palavras antes do primeiro termo encontrado
+
+_columns = ', '.join(SEARCH_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS profile_fts USING fts5({_columns}, content='profile', "
+    f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS profile_fts_insert AFTER INSERT ON profile BEGIN "
+    f"INSERT INTO profile_fts(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS profile_fts_delete AFTER DELETE ON profile BEGIN "
+    f"INSERT INTO profile_fts(profile_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); END",
+    f"CREATE TRIGGER IF NOT EXISTS profile_fts_update AFTER UPDATE OF {_columns} ON profile BEGIN "
+    f"INSERT INTO profile_fts(profile_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old_values}); "
+    f"INSERT INTO profile_fts(rowid, {_columns}) VALUES (new.id, {_new_values}); END",
+]
+
+POSTGRESQL_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'kyf_portuguese') THEN
+            CREATE TEXT SEARCH CONFIGURATION kyf_portuguese (COPY = portuguese);
+            ALTER TEXT SEARCH CONFIGURATION kyf_portuguese
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+        END IF;
+    END $$
+    """,
+    # Campos curtos (interesses, outros jogos/times/eventos) pesam mais que a história
+    """
+    CREATE OR REPLACE FUNCTION profile_search_vector(fan_story text, interests text, other_games text,
+                                                     other_teams text, other_events text)
+    RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+        SELECT setweight(to_tsvector('kyf_portuguese', concat_ws(' ', interests, other_games, other_teams,
+                                                                  other_events)), 'A')
+            || setweight(to_tsvector('kyf_portuguese', coalesce(fan_story, '')), 'B')
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION profile_search_vector_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector := profile_search_vector(NEW.fan_story, NEW.interests, NEW.other_games,
+                                                   NEW.other_teams, NEW.other_events);
+        RETURN NEW;
+    END $$
+    """,
+    "DROP TRIGGER IF EXISTS profile_search_vector_update ON profile",
+    f"""
+    CREATE TRIGGER profile_search_vector_update BEFORE INSERT OR UPDATE OF {_columns} ON profile
+    FOR EACH ROW EXECUTE FUNCTION profile_search_vector_trigger()
+    """,
+]
+
+POSTGRESQL_UPDATE_VECTORS = text(
+    f"UPDATE profile SET search_vector = profile_search_vector({_columns}) WHERE id >= :first AND id <= :last"
+)
+
+_profile_columns = ', '.join(f'p.{column}' for column in SEARCH_COLUMNS)
+
+# ``matched`` conta os perfis que casam até :candidates + 1; acima de :candidates a
+# busca foi limitada aos mais recentes (``truncated``)
+SQLITE_SEARCH = text(f"""
+    SELECT p.id AS profile_id, p.user_id, u.username, u.name, {_profile_columns}, -page.score AS rank,
+           (SELECT count(*) FROM (
+                SELECT 1 FROM profile_fts WHERE profile_fts MATCH :query LIMIT :candidates + 1
+           )) AS matched
+    FROM (
+        SELECT id, score FROM (
+            SELECT rowid AS id, bm25(profile_fts, 1.0, 2.0, 2.0, 2.0, 2.0) AS score
+            FROM profile_fts
+            WHERE profile_fts MATCH :query
+            ORDER BY rowid DESC
+            LIMIT :candidates
+        )
+        ORDER BY score, id DESC
+        LIMIT :limit OFFSET :offset
+    ) AS page
+    JOIN profile p ON p.id = page.id
+    JOIN user u ON u.id = p.user_id
+    ORDER BY page.score, page.id DESC
+""")
+
+POSTGRESQL_SEARCH = text(f"""
+    WITH q AS (
+        SELECT to_tsquery('kyf_portuguese', :query) AS query
+    ), candidates AS (
+        SELECT p.id, p.search_vector
+        FROM profile p, q
+        WHERE p.search_vector @@ q.query
+        ORDER BY p.id DESC
+        LIMIT :candidates
+    ), page AS (
+        SELECT c.id, ts_rank_cd(c.search_vector, q.query) AS rank
+        FROM candidates c, q
+        ORDER BY rank DESC, c.id DESC
+        LIMIT :limit OFFSET :offset
+    ), matched AS (
+        SELECT count(*) AS matched FROM (
+            SELECT 1 FROM profile p, q WHERE p.search_vector @@ q.query LIMIT :candidates + 1
+        ) AS m
+    )
+    SELECT p.id AS profile_id, p.user_id, u.username, u.name, {_profile_columns}, page.rank, matched.matched
+    FROM page
+    CROSS JOIN matched
+    JOIN profile p ON p.id = page.id
+    JOIN "user" u ON u.id = p.user_id
+    ORDER BY page.rank DESC, page.id DESC
+""")
+
+
+class SearchError(Exception):
+    """Consulta vazia ou inválida"""
+    pass
+
+
+def unaccent(value):
+    """Minúsculas e sem acentos ("Campeões" -> "campeoes")"""
+    decomposed = unicodedata.normalize('NFKD', value.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def parse_query(query, max_terms=8):
+    """Termos da consulta: lista de listas de palavras (uma palavra solta ou as palavras de uma frase)"""
+    terms = []
+    for phrase, word in TOKEN.findall(query or ''):
+        words = WORD.findall(unaccent(phrase or word))
+        if words:
+            terms.append(words)
+    if not terms:
+        raise SearchError('Informe ao menos uma palavra para buscar')
+    return terms[:max_terms]
+
+
+def singular(word):
+    """Singular aproximado de uma palavra sem acento ("campeoes" -> "campeao")"""
+    for suffix, replacement in PLURALS:
+        if word.endswith(suffix) and len(word) - len(suffix) + len(replacement) >= INFLECT_MIN_LENGTH:
+            return word[:len(word) - len(suffix)] + replacement
+    return word
+
+
+def inflections(word):
+    """
+    Formas de plural e gênero de uma palavra ("campeoes" -> campeao, campea,
+    campeoes...). O SQLite não tem stemmer em português, então a busca procura
+    cada forma como termo exato; formas inexistentes não custam nada ao índice.
+    Palavras curtas ("art", "rio") só casam com elas mesmas.
+    """
+    if len(word) < INFLECT_MIN_LENGTH:
+        return (word,)
+    base = singular(word)
+    forms = {word, base}
+    for ending, endings in ENDINGS:
+        root = base[:len(base) - len(ending)]
+        if base.endswith(ending) and len(root) >= MIN_ROOT:
+            forms.update(root + form for form in endings)
+            break
+    else:
+        forms.add(base + 's')
+    return tuple(sorted(forms))
+
+
+def sqlite_match(terms):
+    """Expressão MATCH do FTS5 (todos os termos obrigatórios)"""
+    parts = []
+    for words in terms:
+        if len(words) > 1:
+            parts.append('"' + ' '.join(words) + '"')
+        else:
+            parts.append('(' + ' OR '.join(f'"{form}"' for form in inflections(words[0])) + ')')
+    return ' AND '.join(parts)
+
+
+def postgresql_tsquery(terms):
+    """Texto para ``to_tsquery``: frases com ``<->``; o stemmer do PostgreSQL cuida do plural/gênero"""
+    return ' & '.join('(' + ' <-> '.join(words) + ')' if len(words) > 1 else words[0] for words in terms)
+
+
+def term_matcher(terms):
+    """Função que diz se uma palavra (sem acento) casa com algum termo, com as mesmas regras do MATCH"""
+    forms = set()
+    for words in terms:
+        forms.update(words if len(words) > 1 else inflections(words[0]))
+    return forms.__contains__
+
+
+def highlight(values, terms, marks=('[', ']')):
+    """Trecho do primeiro texto que contém algum termo, com os termos marcados"""
+    matches = term_matcher(terms)
+    start_mark, stop_mark = marks
+    for value in values:
+        tokens = list(TEXT_WORD.finditer(value or ''))
+        hits = {i for i, token in enumerate(tokens) if matches(unaccent(token.group()))}
+        if not hits:
+            continue
+        first = max(min(hits) - SNIPPET_CONTEXT, 0)
+        last = min(first + SNIPPET_WORDS, len(tokens))
+        parts = ['…' if first else '']
+        position = tokens[first].start()
+        for i in sorted(hit for hit in hits if hit < last):
+            token = tokens[i]
+            parts += [value[position:token.start()], start_mark, token.group(), stop_mark]
+            position = token.end()
+        parts.append(value[position:tokens[last - 1].end()] if last < len(tokens) else value[position:])
+        if last < len(tokens):
+            parts.append('…')
+        return ''.join(parts)
+    return None
+
+
+class FanSearch:
+    """Busca ranqueada e paginada nos textos livres dos perfis"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_LIMIT', 20)
+        app.config.setdefault('SEARCH_MAX_LIMIT', 100)
+        app.config.setdefault('SEARCH_MAX_TERMS', 8)
+        app.config.setdefault('SEARCH_MAX_CANDIDATES', 5000)
+        app.config.setdefault('SEARCH_HIGHLIGHT', ('[', ']'))  # o texto não é escapado: nada de HTML aqui
+        app.extensions['fan_search'] = self
+        app.cli.add_command(rebuild_search_index_command)
+
+    def search(self, query, limit=None, offset=0):
+        """
+        Perfis que contêm todos os termos, do mais para o menos relevante.
+        Retorna ``{'results': [...], 'limit', 'offset', 'has_more', 'truncated', 'elapsed_ms'}``;
+        ``truncated`` indica que mais de ``SEARCH_MAX_CANDIDATES`` perfis casaram
+        e só os mais recentes foram ranqueados.
+        """
+        config = current_app.config
+        limit = min(max(limit or config['SEARCH_LIMIT'], 1), config['SEARCH_MAX_LIMIT'])
+        offset = max(offset, 0)
+        terms = parse_query(query, config['SEARCH_MAX_TERMS'])
+        params = {'limit': limit + 1, 'offset': offset, 'candidates': config['SEARCH_MAX_CANDIDATES']}
+
+        started = time.perf_counter()
+        dialect = db.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                statement, params['query'] = SQLITE_SEARCH, sqlite_match(terms)
+            else:
+                statement, params['query'] = POSTGRESQL_SEARCH, postgresql_tsquery(terms)
+            rows = db.session.execute(statement, params).all()
+            sample = rows
+            if not rows and offset:
+                # Página além do fim: a primeira linha da primeira página diz se houve corte
+                sample = db.session.execute(statement, dict(params, limit=1, offset=0)).all()
+            truncated = bool(sample) and sample[0].matched > params['candidates']
+        else:
+            rows = self._like_search(terms, params)
+            truncated = False
+        elapsed = time.perf_counter() - started
+
+        return {
+            'results': [{
+                'profile_id': row.profile_id,
+                'user_id': row.user_id,
+                'username': row.username,
+                'name': row.name,
+                'rank': round(float(row.rank), 4),
+                'snippet': highlight([getattr(row, column) for column in SEARCH_COLUMNS], terms,
+                                     config['SEARCH_HIGHLIGHT'])
+            } for row in rows[:limit]],
+            'limit': limit,
+            'offset': offset,
+            'has_more': len(rows) > limit,
+            'truncated': truncated,
+            'elapsed_ms': round(elapsed * 1000, 2)
+        }
+
+    @staticmethod
+    def _like_search(terms, params):
+        # Outros bancos: varredura com LIKE, sem ranking (só para não quebrar a rota)
+        text_columns = [getattr(Profile, column) for column in SEARCH_COLUMNS]
+        query = db.session.query(Profile.id.label('profile_id'), Profile.user_id, User.username, User.name,
+                                 *text_columns, literal(0.0).label('rank')) \
+            .join(User, User.id == Profile.user_id)
+        for words in terms:
+            pattern = f"%{' '.join(words)}%"
+            query = query.filter(db.or_(*[column.ilike(pattern) for column in text_columns]))
+        return query.order_by(Profile.id.desc()).limit(params['limit']).offset(params['offset']).all()
+
+
+fan_search = FanSearch()
+
+
+def rebuild_index(engine, chunk_size=10000, echo=None):
+    """Reindexa todos os perfis (reparo; o uso normal depende só dos triggers)"""
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO profile_fts(profile_fts) VALUES ('rebuild')"))
+        return
+    if engine.dialect.name != 'postgresql':
+        return
+    with engine.connect() as conn:
+        last_id = conn.execute(text('SELECT COALESCE(MAX(id), 0) FROM profile')).scalar()
+    for first in range(1, last_id + 1, chunk_size):
+        with engine.begin() as conn:
+            conn.execute(POSTGRESQL_UPDATE_VECTORS, {'first': first, 'last': first + chunk_size - 1})
+        if echo:
+            echo(f"  {min(first + chunk_size - 1, last_id)}/{last_id}")
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuild the full-text index over profile free text."""
+    started = time.perf_counter()
+    rebuild_index(db.engine, echo=click.echo)
+    click.echo(f"Search index rebuilt in {time.perf_counter() - started:.1f}s.")
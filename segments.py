@@ -0,0 +1,420 @@
+"""
+Índice de bitmaps para segmentação do público.
+
+Para cada valor das escolhas fixas do ProfileForm (jogos, times, eventos),
+para o status de verificação de documentos e para as plataformas sociais
+vinculadas existe um bitmap com os ids dos usuários. Segmentos booleanos
+(AND/OR/NOT) são respondidos com operações entre bitmaps, sem consultar o
+banco.
+
+Os bitmaps são divididos em blocos de 65.536 ids; blocos vazios não são
+armazenados, então faixas de ids sem usuários não ocupam memória.
+
+O índice é eventualmente consistente. Cada processo guarda o seu em memória;
+toda sessão que altera usuários, perfis, documentos ou contas sociais grava
+os ids em ``segment_change`` na mesma transação. O processo que fez o commit
+atualiza o próprio índice na hora. Os demais (outros workers do gunicorn) só
+percebem a mudança na próxima sincronização, feita antes de uma consulta no
+máximo a cada ``SEGMENT_SYNC_INTERVAL`` segundos. A sincronização lê as
+mudanças posteriores à marca d'água (último id de ``segment_change`` e maior
+id de usuário, guardados também no snapshot) e os usuários novos, o que
+inclui os INSERTs em lote sem ORM de ``flask import-fans``. Se a marca d'água
+ficou para trás do que ``SEGMENT_CHANGE_RETENTION`` mantém, ou se há mudanças
+demais, o índice é reconstruído.
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, or_, select
+
+from changes import changed_users
+from models import db, User, Profile, ProfileGame, ProfileTeam, ProfileEvent, Document, SocialAccount, SegmentChange
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+DIMENSIONS = ('game', 'team', 'event', 'verified', 'social')
+REFRESH_CHUNK = 1000
+
+# Alterações nestes modelos mudam os bitmaps do usuário dono
+INDEXED_MODELS = (User, Profile, ProfileGame, ProfileTeam, ProfileEvent, Document, SocialAccount)
+
+
+class SegmentError(ValueError):
+    """Expressão de segmento inválida"""
+
+
+class Bitmap:
+    """Conjunto de inteiros não negativos em blocos de 2**16 bits"""
+
+    __slots__ = ('chunks',)
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks or {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        bitmap = cls()
+        for value in ids:
+            bitmap.add(value)
+        return bitmap
+
+    def add(self, value):
+        key = value >> CHUNK_BITS
+        self.chunks[key] = self.chunks.get(key, 0) | (1 << (value & CHUNK_MASK))
+
+    def discard(self, value):
+        key = value >> CHUNK_BITS
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return
+        chunk &= ~(1 << (value & CHUNK_MASK))
+        if chunk:
+            self.chunks[key] = chunk
+        else:
+            del self.chunks[key]
+
+    def __contains__(self, value):
+        return bool(self.chunks.get(value >> CHUNK_BITS, 0) >> (value & CHUNK_MASK) & 1)
+
+    def __and__(self, other):
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        return Bitmap({key: chunk & large[key] for key, chunk in small.items()
+                       if key in large and chunk & large[key]})
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for key, chunk in other.chunks.items():
+            chunks[key] = chunks.get(key, 0) | chunk
+        return Bitmap(chunks)
+
+    def __sub__(self, other):
+        chunks = {}
+        for key, chunk in self.chunks.items():
+            remaining = chunk & ~other.chunks.get(key, 0)
+            if remaining:
+                chunks[key] = remaining
+        return Bitmap(chunks)
+
+    def __len__(self):
+        return sum(chunk.bit_count() for chunk in self.chunks.values())
+
+    def __iter__(self):
+        for key in sorted(self.chunks):
+            base = key << CHUNK_BITS
+            chunk = self.chunks[key]
+            while chunk:
+                lowest = chunk & -chunk
+                yield base + lowest.bit_length() - 1
+                chunk ^= lowest
+
+    def slice(self, offset, limit):
+        """Ids em ordem crescente, pulando blocos inteiros até ``offset``"""
+        result = []
+        for key in sorted(self.chunks):
+            chunk = self.chunks[key]
+            count = chunk.bit_count()
+            if offset >= count:
+                offset -= count
+                continue
+            base = key << CHUNK_BITS
+            while chunk and len(result) < limit:
+                lowest = chunk & -chunk
+                if offset:
+                    offset -= 1
+                else:
+                    result.append(base + lowest.bit_length() - 1)
+                chunk ^= lowest
+            if len(result) >= limit:
+                break
+        return result
+
+    def to_json(self):
+        return {str(key): format(chunk, 'x') for key, chunk in self.chunks.items()}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls({int(key): int(chunk, 16) for key, chunk in data.items()})
+
+
+class SegmentIndex:
+    """Bitmaps por (dimensão, valor) mantidos em memória em cada processo"""
+
+    def __init__(self, app=None):
+        self.universe = Bitmap()
+        self.bitmaps = {}
+        self.built_at = None
+        # Marca d'água da sincronização com o banco
+        self.last_change_id = 0
+        self.max_user_id = 0
+        self.synced_at = None
+        self._next_sync = 0.0
+        self._next_prune = 0.0
+        self._lock = threading.RLock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEGMENT_SNAPSHOT_PATH', None)
+        app.config.setdefault('SEGMENT_SYNC_INTERVAL', 5.0)  # segundos entre sincronizações
+        app.config.setdefault('SEGMENT_SYNC_OVERLAP', 60)  # segundos relidos para commits fora de ordem
+        app.config.setdefault('SEGMENT_REBUILD_THRESHOLD', 20000)  # usuários alterados acima disso: rebuild
+        app.config.setdefault('SEGMENT_CHANGE_RETENTION', 24 * 60 * 60)
+        app.extensions['segment_index'] = self
+        app.cli.add_command(build_segments_command)
+        changed_users.subscribe(INDEXED_MODELS, after_flush=_log_changed_users,
+                                after_commit=_refresh_changed_users)
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    def ensure_ready(self):
+        """Carrega o snapshot configurado ou constrói o índice; depois sincroniza com o banco se for a hora"""
+        if not self.ready:
+            with self._lock:
+                if not self.ready:
+                    snapshot = current_app.config['SEGMENT_SNAPSHOT_PATH']
+                    if snapshot and os.path.exists(snapshot) and self.load_snapshot(snapshot):
+                        self.sync()
+                    else:
+                        self.build()
+        if time.monotonic() >= self._next_sync:
+            self.sync()
+
+    def build(self):
+        """Reconstrói todos os bitmaps a partir do banco de dados"""
+        universe = Bitmap()
+        bitmaps = {}
+        started = datetime.utcnow()
+        with db.engine.connect() as conn:
+            # A marca d'água é lida antes dos dados: o que mudar durante a leitura é reaplicado depois
+            last_change_id = conn.execute(select(func.max(SegmentChange.id))).scalar() or 0
+            for (user_id,) in conn.execute(select(User.id)).yield_per(10000):
+                universe.add(user_id)
+            for dimension, user_id, value in self._memberships(conn):
+                bitmaps.setdefault((dimension, value), Bitmap()).add(user_id)
+        with self._lock:
+            self.universe = universe
+            self.bitmaps = bitmaps
+            self.built_at = datetime.utcnow()
+            self.last_change_id = last_change_id
+            self.max_user_id = self._max_id(universe)
+            self.synced_at = started
+            self._schedule_sync()
+
+    def sync(self):
+        """
+        Aplica as mudanças feitas por outros processos desde a última
+        sincronização. Retorna quantos usuários foram atualizados
+        (ou None quando o índice foi reconstruído).
+        """
+        config = current_app.config
+        with self._lock:
+            last_change_id, max_user_id, synced_at = self.last_change_id, self.max_user_id, self.synced_at
+            self._schedule_sync()
+        started = datetime.utcnow()
+        since = (synced_at or started) - timedelta(seconds=config['SEGMENT_SYNC_OVERLAP'])
+        with db.engine.connect() as conn:
+            oldest = conn.execute(select(func.min(SegmentChange.id))).scalar()
+            if oldest is not None and oldest > last_change_id + 1:
+                # O log já foi podado além da marca d'água (snapshot antigo)
+                self.build()
+                return None
+            changes = conn.execute(
+                select(SegmentChange.id, SegmentChange.user_id)
+                .where(or_(SegmentChange.id > last_change_id, SegmentChange.changed_at >= since))
+            ).all()
+            # Usuários criados pelo ORM já estão no log; os INSERTs em lote aparecem pelo id
+            new_users = conn.execute(select(User.id).where(User.id > max_user_id)).scalars().all()
+        if time.monotonic() >= self._next_prune:
+            self._next_prune = time.monotonic() + 3600
+            with db.engine.begin() as conn:
+                conn.execute(delete(SegmentChange).where(
+                    SegmentChange.changed_at < started - timedelta(seconds=config['SEGMENT_CHANGE_RETENTION'])
+                ))
+        user_ids = {user_id for _, user_id in changes} | set(new_users)
+        if len(user_ids) > config['SEGMENT_REBUILD_THRESHOLD']:
+            self.build()
+            return None
+        self.refresh_users(user_ids)
+        with self._lock:
+            self.last_change_id = max([last_change_id] + [change_id for change_id, _ in changes])
+            self.max_user_id = max([max_user_id] + list(new_users))
+            self.synced_at = started
+        return len(user_ids)
+
+    def refresh_users(self, user_ids):
+        """Atualiza os bitmaps dos usuários informados (após cada commit e em cada sincronização)"""
+        if not self.ready or not user_ids:
+            return
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), REFRESH_CHUNK):
+            self._refresh_chunk(user_ids[start:start + REFRESH_CHUNK])
+
+    def _refresh_chunk(self, user_ids):
+        with db.engine.connect() as conn:
+            existing = set(conn.execute(select(User.id).where(User.id.in_(user_ids))).scalars())
+            memberships = list(self._memberships(conn, user_ids))
+        with self._lock:
+            for bitmap in self.bitmaps.values():
+                for user_id in user_ids:
+                    bitmap.discard(user_id)
+            for user_id in user_ids:
+                if user_id in existing:
+                    self.universe.add(user_id)
+                else:
+                    self.universe.discard(user_id)
+            for dimension, user_id, value in memberships:
+                self.bitmaps.setdefault((dimension, value), Bitmap()).add(user_id)
+
+    def _schedule_sync(self):
+        self._next_sync = time.monotonic() + current_app.config['SEGMENT_SYNC_INTERVAL']
+
+    @staticmethod
+    def _max_id(bitmap):
+        if not bitmap.chunks:
+            return 0
+        key = max(bitmap.chunks)
+        return (key << CHUNK_BITS) + bitmap.chunks[key].bit_length() - 1
+
+    def query(self, expression):
+        """Avalia uma expressão de segmento e retorna o ``Bitmap`` resultante"""
+        self.ensure_ready()
+        with self._lock:
+            return self._evaluate(expression)
+
+    def counts(self):
+        """Quantidade de usuários por (dimensão, valor)"""
+        self.ensure_ready()
+        with self._lock:
+            return {f'{dimension}:{value}': len(bitmap) for (dimension, value), bitmap in self.bitmaps.items()}
+
+    def save_snapshot(self, path):
+        with self._lock:
+            data = {
+                'built_at': self.built_at.isoformat() if self.built_at else None,
+                'synced_at': self.synced_at.isoformat() if self.synced_at else None,
+                'last_change_id': self.last_change_id,
+                'max_user_id': self.max_user_id,
+                'universe': self.universe.to_json(),
+                'bitmaps': [[dimension, value, bitmap.to_json()]
+                            for (dimension, value), bitmap in self.bitmaps.items()]
+            }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(json.dumps(data).encode('utf-8')))
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path):
+        """Carrega o snapshot; retorna False se ele não tem marca d'água (formato antigo)"""
+        with open(path, 'rb') as f:
+            data = json.loads(zlib.decompress(f.read()))
+        if 'last_change_id' not in data:
+            return False
+        with self._lock:
+            self.universe = Bitmap.from_json(data['universe'])
+            self.bitmaps = {(dimension, _decode_value(dimension, value)): Bitmap.from_json(chunks)
+                            for dimension, value, chunks in data['bitmaps']}
+            self.built_at = datetime.fromisoformat(data['built_at']) if data['built_at'] else datetime.utcnow()
+            self.synced_at = datetime.fromisoformat(data['synced_at']) if data['synced_at'] else self.built_at
+            self.last_change_id = data['last_change_id']
+            self.max_user_id = data['max_user_id']
+        return True
+
+    def _evaluate(self, expression):
+        if not isinstance(expression, dict) or len(expression) != 1:
+            raise SegmentError('Cada expressão deve ter exatamente uma chave')
+        (operator, operand), = expression.items()
+        if operator == 'and':
+            operands = self._operands(operand)
+            result = self._evaluate(operands[0])
+            for item in operands[1:]:
+                result = result & self._evaluate(item)
+            return result
+        if operator == 'or':
+            result = Bitmap()
+            for item in self._operands(operand):
+                result = result | self._evaluate(item)
+            return result
+        if operator == 'not':
+            return self.universe - self._evaluate(operand)
+        if operator in DIMENSIONS:
+            return self.bitmaps.get((operator, operand), Bitmap())
+        raise SegmentError(f'Operador ou dimensão desconhecida: {operator}')
+
+    @staticmethod
+    def _operands(operand):
+        if not isinstance(operand, list) or not operand:
+            raise SegmentError('"and"/"or" exigem uma lista não vazia')
+        return operand
+
+    @staticmethod
+    def _memberships(conn, user_ids=None):
+        """Gera (dimensão, user_id, valor) para todas as dimensões indexadas"""
+        queries = [
+            ('game', select(Profile.user_id, ProfileGame.game).join(ProfileGame, ProfileGame.profile_id == Profile.id), Profile.user_id),
+            ('team', select(Profile.user_id, ProfileTeam.team).join(ProfileTeam, ProfileTeam.profile_id == Profile.id), Profile.user_id),
+            ('event', select(Profile.user_id, ProfileEvent.event).join(ProfileEvent, ProfileEvent.profile_id == Profile.id), Profile.user_id),
+            ('verified', select(Document.user_id, Document.verified).where(Document.verified.is_(True)).distinct(), Document.user_id),
+            ('social', select(SocialAccount.user_id, SocialAccount.platform).distinct(), SocialAccount.user_id),
+        ]
+        for dimension, query, user_column in queries:
+            if user_ids is not None:
+                query = query.where(user_column.in_(user_ids))
+            for user_id, value in conn.execute(query).yield_per(10000):
+                if user_id is not None:
+                    yield dimension, user_id, value
+
+        # Usuários sem documento verificado entram em verified=false
+        if user_ids is None:
+            verified = select(Document.user_id).where(Document.verified.is_(True))
+            unverified = select(User.id).where(User.id.not_in(verified))
+        else:
+            verified = select(Document.user_id).where(Document.verified.is_(True), Document.user_id.in_(user_ids))
+            unverified = select(User.id).where(User.id.in_(user_ids), User.id.not_in(verified))
+        for (user_id,) in conn.execute(unverified).yield_per(10000):
+            yield 'verified', user_id, False
+
+
+def _decode_value(dimension, value):
+    return bool(value) if dimension == 'verified' else value
+
+
+segment_index = SegmentIndex()
+
+
+def _log_changed_users(session, user_ids):
+    # Na mesma transação: os outros processos só veem a mudança junto com o commit
+    now = datetime.utcnow()
+    session.connection().execute(insert(SegmentChange), [{'user_id': user_id, 'changed_at': now}
+                                                         for user_id in user_ids])
+
+
+def _refresh_changed_users(user_ids):
+    if segment_index.ready:
+        segment_index.refresh_users(user_ids)
+
+
+@click.command('build-segments')
+@click.option('--snapshot', type=click.Path(dir_okay=False), default=None,
+              help='Arquivo de snapshot (padrão: SEGMENT_SNAPSHOT_PATH).')
+@with_appcontext
+def build_segments_command(snapshot):
+    """Reconstrói o índice de segmentos e grava um snapshot."""
+    start = time.perf_counter()
+    segment_index.build()
+    path = snapshot or current_app.config['SEGMENT_SNAPSHOT_PATH']
+    if path:
+        segment_index.save_snapshot(path)
+        click.echo(f'Snapshot gravado em {path}')
+    click.echo(f'{len(segment_index.universe)} usuários, {len(segment_index.bitmaps)} bitmaps '
+               f'em {time.perf_counter() - start:.2f}s')
@@ -0,0 +1,222 @@
+"""
+Cache das análises de perfis sociais.
+
+Dois níveis: um LRU em memória por processo e a tabela
+``social_analysis_cache``, compartilhada por todos os workers do gunicorn.
+Cada plataforma tem seu próprio TTL; depois dele a análise antiga ainda é
+servida durante ``SOCIAL_CACHE_STALE_TTL`` segundos enquanto uma nova é
+obtida em segundo plano (stale-while-revalidate).
+
+``SocialAccount.last_sync`` marca a última sincronização da conta: uma
+análise obtida antes dela é considerada vencida nos dois níveis, e cada nova
+análise atualiza o ``last_sync`` das contas correspondentes.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, SocialAccount, SocialAnalysisCache
+from scoring import mark_users_dirty
+
+DEFAULT_TTLS = {
+    'default': 3600,
+    'twitter': 900,
+    'twitch': 900,
+    'instagram': 3600,
+    'facebook': 6 * 3600,
+}
+
+
+class SocialProfileCache:
+    """Cache em dois níveis para ``SocialMediaAnalyzer.analyze_social_profile``"""
+
+    def __init__(self, app=None, analyzer=None):
+        self.analyzer = analyzer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = None
+        self._executor_pid = None
+        self._counters = dict.fromkeys(
+            ('memory_hits', 'shared_hits', 'stale_hits', 'misses', 'refreshes', 'errors'), 0
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SOCIAL_CACHE_TTL', DEFAULT_TTLS)
+        app.config.setdefault('SOCIAL_CACHE_STALE_TTL', 24 * 3600)
+        app.config.setdefault('SOCIAL_CACHE_MAX_ENTRIES', 1024)
+        app.extensions['social_cache'] = self
+
+    def get(self, platform, username, access_token=None):
+        """Análise do perfil, do cache quando possível"""
+        key = (platform, username)
+        now = datetime.utcnow()
+        ttl = self._ttl(platform)
+
+        entry = self._memory_get(key)
+        if entry is not None and now - entry[1] < ttl:
+            # Outro worker pode ter sincronizado a conta depois desta análise
+            last_sync = self._last_sync(platform, username)
+            if last_sync is None or last_sync <= entry[1]:
+                self._count('memory_hits')
+                return entry[0]
+            self._memory_discard(key)
+
+        row = self._shared_get(platform, username)
+        if row is not None:
+            analysis, fetched_at = json.loads(row.payload), row.fetched_at
+            age = now - fetched_at
+            if age < ttl:
+                self._memory_put(key, analysis, fetched_at)
+                self._count('shared_hits')
+                return analysis
+            if age < ttl + timedelta(seconds=current_app.config['SOCIAL_CACHE_STALE_TTL']):
+                self._count('stale_hits')
+                self._refresh_async(platform, username, access_token)
+                return analysis
+
+        self._count('misses')
+        return self._refresh(platform, username, access_token)
+
+    def invalidate(self, platform, username):
+        self._memory_discard((platform, username))
+        with db.engine.begin() as conn:
+            conn.execute(
+                SocialAnalysisCache.__table__.delete()
+                .where(SocialAnalysisCache.platform == platform, SocialAnalysisCache.username == username)
+            )
+
+    def stats(self):
+        """Contadores de acertos/faltas deste processo"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['shared_hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = (lookups - stats['misses']) / lookups if lookups else 0.0
+        return stats
+
+    def _ttl(self, platform):
+        ttls = current_app.config['SOCIAL_CACHE_TTL']
+        return timedelta(seconds=ttls.get(platform, ttls.get('default', DEFAULT_TTLS['default'])))
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _memory_put(self, key, analysis, fetched_at):
+        with self._lock:
+            self._entries[key] = (analysis, fetched_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > current_app.config['SOCIAL_CACHE_MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+
+    def _memory_discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _last_sync_query(self, platform, username):
+        return (
+            select(func.max(SocialAccount.last_sync))
+            .where(SocialAccount.platform == platform, SocialAccount.username == username)
+        )
+
+    def _last_sync(self, platform, username):
+        with db.engine.connect() as conn:
+            return conn.execute(self._last_sync_query(platform, username)).scalar()
+
+    def _shared_get(self, platform, username):
+        """Linha do cache compartilhado, ignorada se a conta foi sincronizada depois dela"""
+        last_sync = self._last_sync_query(platform, username).scalar_subquery()
+        with db.engine.connect() as conn:
+            return conn.execute(
+                select(SocialAnalysisCache.payload, SocialAnalysisCache.fetched_at)
+                .where(
+                    SocialAnalysisCache.platform == platform,
+                    SocialAnalysisCache.username == username,
+                    (last_sync.is_(None)) | (last_sync <= SocialAnalysisCache.fetched_at)
+                )
+            ).first()
+
+    def _refresh(self, platform, username, access_token=None):
+        if self.analyzer is None:
+            from ai_services import SocialMediaAnalyzer
+            self.analyzer = SocialMediaAnalyzer
+        analysis = self.analyzer.analyze_social_profile(platform, username, access_token)
+        if not analysis.get('success'):
+            self._count('errors')
+            return analysis
+
+        fetched_at = datetime.utcnow()
+        self._memory_put((platform, username), analysis, fetched_at)
+        self._shared_put(platform, username, analysis, fetched_at)
+        return analysis
+
+    def _shared_put(self, platform, username, analysis, fetched_at):
+        table = SocialAnalysisCache.__table__
+        values = {
+            'payload': json.dumps(analysis),
+            'relevance_score': analysis.get('esports_relevance_score'),
+            'fetched_at': fetched_at
+        }
+        key = (table.c.platform == platform) & (table.c.username == username)
+        with db.engine.begin() as conn:
+            updated = conn.execute(update(table).where(key).values(**values)).rowcount
+        if not updated:
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(table).values(platform=platform, username=username, **values))
+            except IntegrityError:
+                # Outro worker inseriu a mesma chave primeiro
+                with db.engine.begin() as conn:
+                    conn.execute(update(table).where(key).values(**values))
+
+        # A conta passa a estar sincronizada até esta análise; a pontuação dos donos muda
+        accounts = (SocialAccount.platform == platform) & (SocialAccount.username == username)
+        with db.engine.begin() as conn:
+            conn.execute(update(SocialAccount.__table__).where(accounts).values(last_sync=fetched_at))
+            mark_users_dirty(conn, select(SocialAccount.user_id).where(accounts))
+
+    def _refresh_async(self, platform, username, access_token=None):
+        key = (platform, username)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='social-cache')
+                self._executor_pid = os.getpid()
+            executor = self._executor
+        executor.submit(self._background_refresh, current_app._get_current_object(), platform, username,
+                        access_token)
+
+    def _background_refresh(self, app, platform, username, access_token):
+        try:
+            with app.app_context():
+                self._refresh(platform, username, access_token)
+                self._count('refreshes')
+        except Exception:
+            self._count('errors')
+            app.logger.exception('Falha ao atualizar a análise de %s/%s', platform, username)
+        finally:
+            with self._lock:
+                self._refreshing.discard((platform, username))
+
+
+social_cache = SocialProfileCache()
@@ -0,0 +1,172 @@
+"""
+Entrega dos arquivos estáticos e dos uploads publicados em ``static/``.
+
+Os arquivos são servidos pelo WhiteNoise antes de chegar ao Flask, com ETag,
+respostas 304, requisições ``Range`` e as versões pré-comprimidas (``.br`` e
+``.gz``) quando o navegador as aceita.
+
+``flask collect-static`` grava uma cópia de cada asset com o hash do conteúdo
+no nome (``css/app.3f2a9c0d1b4e.css``), as versões comprimidas e o
+``manifest.json``; ``url_for('static', ...)`` passa a gerar a URL com hash.
+Arquivos com hash no nome — incluindo os uploads, cujo nome já é o SHA-256 do
+conteúdo — recebem ``Cache-Control: immutable`` e não voltam a ser pedidos.
+Caminhos de ``STATIC_PRIVATE_DIRS`` (documentos de identidade) nunca são
+servidos pelo WhiteNoise, mesmo que algum arquivo antigo ainda esteja lá.
+"""
+
+import json
+import os
+import re
+import shutil
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.exceptions import NotFound
+from whitenoise import WhiteNoise
+from whitenoise.compress import Compressor
+from whitenoise.responders import IsDirectoryError, MissingFileError
+
+from storage import hash_stream
+
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+
+# nome.<12 hex>.ext (collect-static) ou <sha256>.ext (uploads, ver storage.py)
+HASHED_NAME = re.compile(r'\.[0-9a-f]{%d}\.[^./]+$|/[0-9a-f]{64}\.[^./]+$' % HASH_LENGTH)
+
+
+def is_hashed(path, url):
+    return bool(HASHED_NAME.search(url))
+
+
+def hashed_name(name, digest):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{digest[:HASH_LENGTH]}{ext}'
+
+
+class StaticFiles(WhiteNoise):
+    """
+    WhiteNoise que também encontra arquivos criados depois da inicialização
+    (uploads), consultando o disco só quando a URL não está no índice
+    """
+
+    def __init__(self, application, root, prefix, private_dirs=(), **kwargs):
+        super().__init__(application, **kwargs)
+        self.root = os.path.abspath(root)
+        self.prefix = prefix.rstrip('/') + '/'
+        self.private_prefixes = tuple(self.prefix + d.strip('/') + '/' for d in private_dirs)
+        if os.path.isdir(self.root):
+            self.add_files(self.root, self.prefix)
+        for url in [url for url in self.files if url.startswith(self.private_prefixes)]:
+            del self.files[url]
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if self.private_prefixes and path.startswith(self.private_prefixes):
+            # Nem o WhiteNoise nem a rota 'static' do Flask entregam esses arquivos
+            return NotFound()(environ, start_response)
+        if path not in self.files and path.startswith(self.prefix):
+            static_file = self._find_new_file(path)
+            if static_file is not None:
+                self.files[path] = static_file
+        return super().__call__(environ, start_response)
+
+    def _find_new_file(self, url):
+        if not self.url_is_canonical(url):
+            return None
+        path = os.path.join(self.root, url[len(self.prefix):])
+        if os.path.commonpath((self.root, path)) != self.root or self.is_compressed_variant(path):
+            return None
+        try:
+            return self.get_static_file(path, url)
+        except (MissingFileError, IsDirectoryError):
+            return None
+
+
+class StaticAssets:
+    """Extensão Flask que instala o WhiteNoise e reescreve as URLs estáticas pelo manifest"""
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STATIC_WHITENOISE', True)
+        app.config.setdefault('STATIC_MAX_AGE', 60)  # arquivos sem hash no nome
+        app.config.setdefault('STATIC_MANIFEST', os.path.join(app.static_folder, MANIFEST_NAME))
+        app.config.setdefault('STATIC_PRIVATE_DIRS', ('uploads/documents',))
+
+        self.manifest = self.load_manifest(app.config['STATIC_MANIFEST'])
+        if self.manifest:
+            app.url_defaults(self._hashed_url)
+        if app.config['STATIC_WHITENOISE']:
+            app.wsgi_app = StaticFiles(
+                app.wsgi_app, app.static_folder, app.static_url_path,
+                private_dirs=app.config['STATIC_PRIVATE_DIRS'],
+                max_age=app.config['STATIC_MAX_AGE'],
+                immutable_file_test=is_hashed
+            )
+        app.extensions['static_assets'] = self
+        app.cli.add_command(collect_static_command)
+
+    @staticmethod
+    def load_manifest(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _hashed_url(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.manifest.get(values['filename'], values['filename'])
+
+
+static_assets = StaticAssets()
+
+
+def collect_static(static_folder, manifest_path=None, skip=('uploads',), compress=True, log=None):
+    """
+    Grava as cópias com hash e as versões comprimidas dos assets de
+    ``static_folder`` e retorna o manifest ``{nome: nome com hash}``
+    """
+    compressor = Compressor(quiet=True) if compress else None
+    manifest = {}
+    for directory, subdirs, files in os.walk(static_folder):
+        relative_dir = os.path.relpath(directory, static_folder)
+        if relative_dir == '.':
+            subdirs[:] = [name for name in subdirs if name not in skip]
+            relative_dir = ''
+        for filename in files:
+            name = os.path.join(relative_dir, filename).replace(os.sep, '/')
+            if name == MANIFEST_NAME or filename.endswith(('.gz', '.br')) or is_hashed(None, '/' + name):
+                continue
+            path = os.path.join(directory, filename)
+            with open(path, 'rb') as f:
+                digest, _ = hash_stream(f)
+            target = hashed_name(name, digest)
+            target_path = os.path.join(static_folder, target)
+            if not os.path.exists(target_path):
+                shutil.copy2(path, target_path)
+            if compressor and compressor.should_compress(filename):
+                for compressed in compressor.compress(target_path):
+                    if log:
+                        log(f"{target} -> {os.path.basename(compressed)}")
+            manifest[name] = target
+
+    with open(manifest_path or os.path.join(static_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+@click.command('collect-static')
+@click.option('--no-compress', is_flag=True, help='Skip the .gz/.br precompressed copies.')
+@click.option('--verbose', '-v', is_flag=True)
+@with_appcontext
+def collect_static_command(no_compress, verbose):
+    """Write content-hashed copies of the static assets and manifest.json."""
+    manifest = collect_static(current_app.static_folder, current_app.config['STATIC_MANIFEST'],
+                              compress=not no_compress, log=click.echo if verbose else None)
+    click.echo(f"Hashed {len(manifest)} static files into {current_app.config['STATIC_MANIFEST']}.")
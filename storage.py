@@ -0,0 +1,264 @@
+"""
+Camada de armazenamento de uploads.
+
+Os arquivos são gravados uma única vez, em blocos de tamanho fixo, num
+arquivo temporário que é renomeado atomicamente para o destino final. A
+cópia acessível pela web (``static/uploads``) é um hardlink para o mesmo
+arquivo; quando o hardlink não é possível (outro sistema de arquivos, por
+exemplo) o arquivo é servido diretamente pela rota ``uploaded_file``.
+
+Só as pastas de ``STORAGE_PUBLIC_FOLDERS`` (as fotos de perfil) são
+publicadas e servidas com cache público imutável. Documentos de identidade
+ficam fora de ``static/`` e só saem pela rota ``uploaded_document``, com
+verificação de dono/administrador e ``Cache-Control: private, no-store``.
+As fotos de perfil originais (com EXIF: localização, aparelho...) ficam em
+``PROFILE_ORIGINALS_FOLDER``, que não é publicada nem servida; só as
+variantes sem metadados geradas a partir delas vão para ``profiles``.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from flask import abort, current_app, send_from_directory
+
+from instrumentation import span
+
+CHUNK_SIZE = 64 * 1024
+
+# Fotos de perfil como enviadas; lidas só pela tarefa que gera as variantes públicas
+PROFILE_ORIGINALS_FOLDER = 'profile_originals'
+
+# Resultado de uma gravação endereçada por conteúdo; ``created`` é False quando o
+# arquivo já existia e nada foi gravado
+StoredFile = namedtuple('StoredFile', 'filename digest size created')
+
+
+def hash_stream(stream, chunk_size=CHUNK_SIZE):
+    """Calcula o SHA-256 de ``stream`` em blocos. Retorna (hexdigest, tamanho)."""
+    sha256 = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        sha256.update(chunk)
+        size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+class StorageBackend:
+    """Interface comum dos backends de armazenamento"""
+
+    def save(self, stream, folder, filename):
+        """Grava o conteúdo de ``stream`` em ``folder/filename`` e retorna o número de bytes"""
+        raise NotImplementedError
+
+    def save_hashed(self, stream, folder, extension=''):
+        """
+        Grava ``stream`` com o nome ``<sha256><extension>``.
+
+        O hash é calculado percorrendo o stream em blocos; se o conteúdo já
+        estiver armazenado nada é gravado.
+        """
+        if not stream.seekable():
+            spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            shutil.copyfileobj(stream, spooled, CHUNK_SIZE)
+            spooled.seek(0)
+            stream = spooled
+        start = stream.tell()
+        with span('storage.hash'):
+            digest, size = hash_stream(stream)
+        filename = digest + extension.lower()
+        if self.exists(folder, filename):
+            return StoredFile(filename, digest, size, False)
+        stream.seek(start)
+        with span('storage.write'):
+            self.save(stream, folder, filename)
+        return StoredFile(filename, digest, size, True)
+
+    def exists(self, folder, filename):
+        raise NotImplementedError
+
+    def open(self, folder, filename):
+        """Abre o arquivo armazenado para leitura binária"""
+        raise NotImplementedError
+
+    def delete(self, folder, filename):
+        raise NotImplementedError
+
+    def local_path(self, folder, filename):
+        """Caminho no disco local, ou None se o backend não for local"""
+        return None
+
+    def send(self, folder, filename, max_age=None):
+        """Resposta HTTP que entrega o arquivo ao navegador"""
+        raise NotImplementedError
+
+    def unpublish(self, folder):
+        """Remove as cópias públicas de ``folder``; backends sem cópia pública não fazem nada"""
+        return 0
+
+
+class LocalStorage(StorageBackend):
+    """Armazena os arquivos em disco, publicando os de ``public_folders`` em ``public_root`` por hardlink"""
+
+    def __init__(self, root, public_root=None, chunk_size=CHUNK_SIZE, public_folders=('profiles',)):
+        self.root = root
+        self.public_root = public_root
+        self.public_folders = tuple(public_folders)
+        self.chunk_size = chunk_size
+        self._known_dirs = set()
+
+    def save(self, stream, folder, filename):
+        directory = self._ensure_dir(self.root, folder)
+        final_path = os.path.join(directory, filename)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, final_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self._publish(folder, filename, final_path)
+        return size
+
+    def exists(self, folder, filename):
+        return os.path.exists(self.local_path(folder, filename))
+
+    def open(self, folder, filename):
+        return open(self.local_path(folder, filename), 'rb')
+
+    def delete(self, folder, filename):
+        paths = [self.local_path(folder, filename)]
+        if self.public_root:
+            paths.append(os.path.join(self.public_root, folder, filename))
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def local_path(self, folder, filename):
+        return os.path.join(self.root, folder, filename)
+
+    def send(self, folder, filename, max_age=None):
+        # send_from_directory já responde com ETag/304 e atende requisições Range
+        return send_from_directory(os.path.join(self.root, folder), filename, max_age=max_age)
+
+    def unpublish(self, folder):
+        """Remove de ``public_root`` os hardlinks de ``folder``, mantendo os originais. Retorna quantos"""
+        public_dir = os.path.join(self.public_root or '', folder)
+        if not self.public_root or not os.path.isdir(public_dir):
+            return 0
+        removed = 0
+        for filename in os.listdir(public_dir):
+            public_path = os.path.join(public_dir, filename)
+            original = self.local_path(folder, filename)
+            # Só apaga cópias publicadas: o original precisa existir em outro caminho
+            if os.path.abspath(public_path) == os.path.abspath(original) or not os.path.exists(original):
+                continue
+            if os.path.samefile(public_path, original):
+                os.unlink(public_path)
+                removed += 1
+        return removed
+
+    def _publish(self, folder, filename, final_path):
+        """Cria o hardlink em ``public_root`` sem duplicar os dados"""
+        if not self.public_root or folder not in self.public_folders:
+            return False
+        public_dir = self._ensure_dir(self.public_root, folder)
+        public_path = os.path.join(public_dir, filename)
+        tmp_link = os.path.join(public_dir, f'.link-{filename}')
+        try:
+            os.link(final_path, tmp_link)
+            os.replace(tmp_link, public_path)
+        except OSError:
+            # Sem hardlink o arquivo continua disponível pela rota uploaded_file
+            try:
+                os.unlink(tmp_link)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def _ensure_dir(self, root, folder):
+        directory = os.path.join(root, folder)
+        if directory not in self._known_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._known_dirs.add(directory)
+        return directory
+
+
+# Backends disponíveis via STORAGE_BACKEND (ex.: um backend S3 no futuro)
+BACKENDS = {
+    'local': LocalStorage,
+}
+
+
+class Storage:
+    """Extensão Flask que expõe o backend configurado"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STORAGE_BACKEND', 'local')
+        app.config.setdefault('STORAGE_PUBLIC_DIR', os.path.join(app.static_folder, 'uploads'))
+        app.config.setdefault('STORAGE_CHUNK_SIZE', CHUNK_SIZE)
+        app.config.setdefault('STORAGE_CACHE_MAX_AGE', 365 * 24 * 60 * 60)
+        app.config.setdefault('STORAGE_PUBLIC_FOLDERS', ('profiles',))
+
+        backend_cls = BACKENDS[app.config['STORAGE_BACKEND']]
+        if backend_cls is LocalStorage:
+            self.backend = LocalStorage(
+                app.config['UPLOAD_FOLDER'],
+                public_root=app.config['STORAGE_PUBLIC_DIR'],
+                chunk_size=app.config['STORAGE_CHUNK_SIZE'],
+                public_folders=app.config['STORAGE_PUBLIC_FOLDERS']
+            )
+        else:
+            self.backend = backend_cls(app)
+        app.extensions['storage'] = self
+
+    def __getattr__(self, name):
+        backend = self.__dict__.get('backend')
+        if backend is None:
+            raise AttributeError(name)
+        return getattr(backend, name)
+
+    def send(self, folder, filename):
+        if not self.backend.exists(folder, filename):
+            abort(404)
+        if folder not in current_app.config['STORAGE_PUBLIC_FOLDERS']:
+            # Documentos pessoais: nada de cache compartilhado nem guardado no navegador
+            response = self.backend.send(folder, filename)
+            response.cache_control.private = True
+            response.cache_control.no_store = True
+            response.cache_control.max_age = None
+            response.cache_control.public = False
+            return response
+        # O nome é o hash do conteúdo: o arquivo nunca muda para a mesma URL
+        response = self.backend.send(folder, filename, max_age=current_app.config['STORAGE_CACHE_MAX_AGE'])
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+storage = Storage()
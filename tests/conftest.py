@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+# Antes de importar app.py: a aplicação do módulo não deve iniciar workers nem pools
+os.environ.setdefault('JOB_AUTOSTART', '0')
+os.environ.setdefault('PASSWORD_HASH_POOL_SIZE', '0')
+
+from app import create_app, init_db  # noqa: E402
+from models import db  # noqa: E402
+
+
+def make_app(root):
+    """Aplicação com banco SQLite e uploads em ``root``, com o esquema criado"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(root, 'test.db'),
+        'UPLOAD_FOLDER': os.path.join(root, 'uploads'),
+        'STORAGE_PUBLIC_DIR': os.path.join(root, 'public'),
+        'JOB_AUTOSTART': False,
+        'PASSWORD_HASH_POOL_SIZE': 0,
+        'WTF_CSRF_ENABLED': False,
+    })
+    with app.app_context():
+        init_db()
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(str(tmp_path))
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
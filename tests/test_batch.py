@@ -0,0 +1,27 @@
+"""Validação do corpo das rotas de análise em lote"""
+
+from batch import parse_batch_items
+
+FIELDS = ('platform', 'username')
+
+
+def test_valid_items():
+    items = [{'platform': 'twitter', 'username': 'furia'}]
+    assert parse_batch_items({'items': items}, FIELDS, 10) == (items, None)
+
+
+def test_error_names_the_item():
+    items = [{'platform': 'twitter', 'username': 'furia'}, {'platform': ['twitter'], 'username': 123}]
+    assert parse_batch_items({'items': items}, FIELDS, 10) == (None, 'Item 1: platform, username deve ser texto não vazio')
+
+
+def test_rejects_non_objects_and_blank_fields():
+    assert parse_batch_items({'items': ['furia']}, FIELDS, 10)[1].startswith('Item 0:')
+    assert parse_batch_items({'items': [{'platform': ' ', 'username': 'x'}]}, FIELDS, 10)[1] == \
+        'Item 0: platform deve ser texto não vazio'
+
+
+def test_limits():
+    assert parse_batch_items({'items': []}, FIELDS, 10)[0] is None
+    assert parse_batch_items({'items': [{'platform': 'x', 'username': 'y'}] * 3}, FIELDS, 2)[1] == \
+        'No máximo 2 itens por lote'
@@ -0,0 +1,66 @@
+"""Um único coletor de usuários alterados por flush, compartilhado pelos assinantes"""
+
+from sqlalchemy import event
+
+from changes import changed_users
+from models import db, User, Profile, SegmentChange, SocialAccount
+
+
+def make_fan(n):
+    user = User(username=f'fan{n}', email=f'fan{n}@example.com', password_hash='x')
+    user.profile = Profile()
+    db.session.add(user)
+    return user
+
+
+def test_one_scan_and_one_profile_query_per_flush(app):
+    fans = [make_fan(1), make_fan(2)]
+    db.session.commit()
+    user_ids = {fan.id for fan in fans}
+    db.session.execute(db.update(User).values(score_dirty=False))
+    db.session.commit()
+
+    # Carrega as escolhas antes: o carregamento preguiçoso faria um autoflush no meio das alterações
+    for fan in fans:
+        fan.profile.game_links, fan.profile.event_links
+
+    received = []
+    changed_users.subscribe((User, SocialAccount), after_commit=received.append)
+    profile_lookups = []
+
+    def count_profile_lookups(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT profile.id, profile.user_id \nFROM profile'):
+            profile_lookups.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count_profile_lookups)
+    try:
+        # Escolhas de perfil (resolvidas pelo Profile) e uma conta social no mesmo flush
+        fans[0].profile.favorite_game_list = ['cs2']
+        fans[1].profile.events_attended_list = ['major_austin_2025']
+        db.session.add(SocialAccount(user_id=fans[1].id, platform='twitter', username='fan2'))
+        db.session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_profile_lookups)
+        changed_users.subscriptions.pop()
+
+    assert len(profile_lookups) == 1
+    assert received == [{fans[1].id}]
+    # segments registra os dois usuários; scoring marca os dois para recálculo
+    logged = set(db.session.execute(db.select(SegmentChange.user_id)).scalars())
+    assert user_ids <= logged
+    dirty = set(db.session.execute(db.select(User.id).where(User.score_dirty.is_(True))).scalars())
+    assert dirty == user_ids
+
+
+def test_rollback_discards_pending_users(app):
+    received = []
+    changed_users.subscribe((User,), after_commit=received.append)
+    try:
+        make_fan(1)
+        db.session.flush()
+        db.session.rollback()
+        make_fan(2)
+        db.session.commit()
+    finally:
+        changed_users.subscriptions.pop()
+    assert received == [{db.session.execute(db.select(User.id)).scalar_one()}]
@@ -0,0 +1,38 @@
+"""``cpf.validate_batch`` (NumPy) e ``cpf.is_valid`` dão o mesmo veredito para cada valor"""
+
+import random
+
+from benchmarks.datagen import cpf_for
+from cpf import format_cpf, is_valid, validate_batch
+
+
+def sample_values():
+    rng = random.Random(7)
+    values = [cpf_for(i) for i in range(1, 500)]
+    values += [format_cpf(cpf_for(i)) for i in range(500, 600)]
+    values += [''.join(rng.choice('0123456789') for _ in range(11)) for _ in range(2000)]
+    values += [str(d) * 11 for d in range(10)]
+    values += [cpf_for(7)[:10], cpf_for(7) + '0', '', 'abc', '123.456.789', None, 12345678909]
+    return values
+
+
+def test_batch_matches_scalar():
+    values = sample_values()
+    canonical, valid = validate_batch(values)
+    assert len(canonical) == len(valid) == len(values)
+    mismatches = [value for value, batch in zip(values, valid) if bool(batch) != is_valid(value)]
+    assert not mismatches
+    # A amostra tem CPFs válidos e inválidos
+    assert valid.any() and not valid.all()
+
+
+def test_repeated_digits_are_invalid():
+    repeated = [str(d) * 11 for d in range(10)]
+    _, valid = validate_batch(repeated)
+    assert not valid.any()
+    assert not any(is_valid(value) for value in repeated)
+
+
+def test_empty_batch():
+    canonical, valid = validate_batch([])
+    assert canonical == [] and len(valid) == 0
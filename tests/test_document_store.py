@@ -0,0 +1,44 @@
+"""Arquivos de documentos compartilhados por conteúdo: um arquivo por digest, apagado com o último Document"""
+
+import io
+import os
+
+from PIL import Image
+
+from models import db, User, Document, StoredBlob
+
+
+def document_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 40), (10, 120, 200)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def documents_on_disk(app):
+    return sorted(os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], 'documents')))
+
+
+def test_same_content_with_other_extension_shares_the_file(app):
+    user = User(username='fan1', email='fan1@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+
+    data = document_bytes()
+    for filename in ('rg.png', 'rg.jpg'):
+        response = client.post('/documents', data={'doc_type': 'id', 'document': (io.BytesIO(data), filename)},
+                               content_type='multipart/form-data')
+        assert response.status_code == 302
+
+    documents = Document.query.order_by(Document.id).all()
+    blob = StoredBlob.query.one()
+    assert [document.filename for document in documents] == [blob.filename] * 2
+    assert blob.ref_count == 2 and blob.filename.endswith('.png')
+    assert documents_on_disk(app) == [blob.filename]
+
+    for document in documents:
+        assert client.post(f'/documents/{document.id}/delete').status_code == 302
+    assert StoredBlob.query.count() == 0
+    assert documents_on_disk(app) == []
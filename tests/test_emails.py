@@ -0,0 +1,29 @@
+"""E-mails guardados em minúsculas: cadastro, login e importação tratam Alice@X.com como alice@x.com"""
+
+from fan_import import validate_chunk
+from models import db, User
+
+PASSWORD = 'senha-do-fa'
+
+
+def register(client, username, email):
+    return client.post('/register', data={'username': username, 'email': email, 'password': PASSWORD,
+                                          'confirm_password': PASSWORD})
+
+
+def test_register_and_login_ignore_case(app):
+    client = app.test_client()
+    assert register(client, 'alice', 'Alice@X.com').status_code == 302
+    assert db.session.execute(db.select(User.email)).scalar_one() == 'alice@x.com'
+
+    response = client.post('/login', data={'email': 'ALICE@x.com', 'password': PASSWORD})
+    assert response.status_code == 302 and response.location.endswith('/dashboard')
+
+
+def test_import_rejects_registered_email_in_other_case(app):
+    db.session.add(User(username='alice', email='alice@x.com', password_hash='x'))
+    db.session.commit()
+    with db.engine.connect() as conn:
+        accepted, rejects = validate_chunk(conn, [(2, {'email': 'Alice@X.com'}), (3, {'email': 'BOB@x.com'})])
+    assert [record['email'] for record in accepted] == ['bob@x.com']
+    assert rejects == [{'line': 2, 'email': 'alice@x.com', 'errors': ['email já cadastrado']}]
@@ -0,0 +1,63 @@
+"""As contagens mantidas pelos eventos de mapper coincidem com as recalculadas das tabelas"""
+
+from fan_stats import compute_counts, fan_stats
+from models import db, User, Profile, Document, SocialAccount, EsportsProfile
+
+
+def assert_counts_match():
+    with db.engine.connect() as conn:
+        assert fan_stats.counts() == dict(compute_counts(conn))
+
+
+def make_fan(n, games, teams, events):
+    user = User(username=f'fan{n}', email=f'fan{n}@example.com', password_hash='x')
+    user.profile = Profile()
+    user.profile.favorite_game_list = games
+    user.profile.favorite_team_list = teams
+    user.profile.events_attended_list = events
+    db.session.add(user)
+    return user
+
+
+def test_incremental_counts_match_rebuild(app):
+    fans = [make_fan(n, games, ['FURIA'], events) for n, (games, events) in enumerate([
+        (['cs2', 'valorant'], ['IEM Rio']),
+        (['cs2'], []),
+        (['lol', 'valorant', 'r6'], ['IEM Rio', 'BLAST']),
+    ])]
+    db.session.add_all([
+        Document(user=fans[0], doc_type='rg', verified=False),
+        Document(user=fans[0], doc_type='cpf', verified=True),
+        Document(user=fans[1], doc_type='rg', verified=True),
+        SocialAccount(user=fans[0], platform='twitter', username='fan0'),
+        SocialAccount(user=fans[2], platform='instagram', username='fan2'),
+        EsportsProfile(user=fans[1], platform='steam', username='fan1'),
+    ])
+    db.session.commit()
+    assert_counts_match()
+
+    # Escolhas trocadas (órfãos removidos pelo delete-orphan) e atributos contados alterados
+    fans[0].profile.favorite_game_list = ['r6']
+    fans[2].profile.events_attended_list = []
+    document = Document.query.filter_by(user_id=fans[0].id, doc_type='rg').one()
+    document.verified = True
+    document.doc_type = 'comprovante'
+    SocialAccount.query.filter_by(platform='twitter').one().platform = 'x'
+    EsportsProfile.query.one().verified = True
+    db.session.commit()
+    assert_counts_match()
+
+    # Exclusões
+    db.session.delete(Document.query.filter_by(doc_type='cpf').one())
+    db.session.delete(SocialAccount.query.filter_by(platform='instagram').one())
+    db.session.delete(fans[1].profile)
+    db.session.commit()
+    assert_counts_match()
+
+    # Alterações desfeitas não chegam às contagens
+    db.session.add(Document(user=fans[2], doc_type='rg', verified=True))
+    db.session.flush()
+    db.session.rollback()
+    assert_counts_match()
+
+    assert fan_stats.rebuild() == 0
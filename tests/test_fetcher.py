@@ -0,0 +1,162 @@
+"""
+HttpFetcher contra um servidor HTTP local (http.server numa porta livre):
+limite de taxa, novas tentativas, conexões reaproveitadas e GET condicional.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ai_services import EsportsProfileValidator
+from fetcher import DEFAULT_RATE_LIMITS, FetchError, HttpFetcher, is_fetchable, parse_rate_limits
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Responde conforme ``server.routes[path]``; registra cada requisição em ``server.requests``"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, para o pool de conexões
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address, dict(self.headers)))
+            statuses = server.routes.get(self.path, [404])
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        if status == 200 and self.headers.get('If-None-Match') == '"v1"':
+            status = 304
+        body = b'' if status == 304 else f'<html><title>{self.path}</title></html>'.encode()
+        self.send_response(status)
+        if status in (301, 302):
+            self.send_header('Location', server.base_url + '/redirected')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.routes = {}
+    httpd.base_url = f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.host = f'127.0.0.1:{httpd.server_address[1]}'
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_rate_limit_per_host(server):
+    server.routes['/page'] = [200]
+    fetcher = HttpFetcher(rate_limits={server.host: (20.0, 1)})
+    started = time.monotonic()
+    for _ in range(5):
+        fetcher.fetch(server.base_url + '/page')
+    # Rajada de 1: a primeira sai na hora, as outras quatro esperam 1/20 s cada
+    assert time.monotonic() - started >= 4 / 20 * 0.9
+    fetcher.close()
+
+
+def test_burst_is_not_delayed(server):
+    server.routes['/page'] = [200]
+    fetcher = HttpFetcher(rate_limits={'default': (1.0, 5)})
+    started = time.monotonic()
+    for _ in range(5):
+        fetcher.fetch(server.base_url + '/page')
+    assert time.monotonic() - started < 0.5
+    fetcher.close()
+
+
+def test_retries_transient_errors(server):
+    server.routes['/flaky'] = [503, 502, 200]
+    fetcher = HttpFetcher(rate_limits={'default': (100.0, 10)})
+    result = fetcher.fetch(server.base_url + '/flaky')
+    assert result.status == 200 and '/flaky' in result.text
+    assert [path for path, _, _ in server.requests] == ['/flaky'] * 3
+    fetcher.close()
+
+
+def test_gives_up_after_retries(server):
+    server.routes['/down'] = [503]
+    fetcher = HttpFetcher(rate_limits={'default': (100.0, 10)})
+    with pytest.raises(FetchError):
+        fetcher.fetch(server.base_url + '/down')
+    assert len(server.requests) == 3  # a original e duas novas tentativas
+    fetcher.close()
+
+
+def test_client_errors_are_not_retried(server):
+    fetcher = HttpFetcher(rate_limits={'default': (100.0, 10)})
+    with pytest.raises(FetchError):
+        fetcher.fetch(server.base_url + '/missing')
+    assert len(server.requests) == 1
+    fetcher.close()
+
+
+def test_connections_are_reused(server):
+    server.routes['/a'] = [200]
+    server.routes['/b'] = [200]
+    fetcher = HttpFetcher(rate_limits={'default': (100.0, 10)})
+    for path in ('/a', '/b', '/a', '/b'):
+        fetcher.fetch(server.base_url + path)
+    client_ports = {address[1] for _, address, _ in server.requests}
+    assert len(client_ports) == 1
+    fetcher.close()
+
+
+def test_conditional_get_uses_cache(server, tmp_path):
+    server.routes['/profile'] = [200]
+    fetcher = HttpFetcher(cache_dir=str(tmp_path), rate_limits={'default': (100.0, 10)})
+    first = fetcher.fetch(server.base_url + '/profile')
+    second = fetcher.fetch(server.base_url + '/profile')
+    assert not first.from_cache
+    assert second.from_cache and second.text == first.text
+    assert server.requests[1][2].get('If-None-Match') == '"v1"'
+    fetcher.close()
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits(None) == DEFAULT_RATE_LIMITS
+    assert parse_rate_limits('default=2:10, www.hltv.org=0.5:2') == {
+        'default': (2.0, 10), 'www.hltv.org': (0.5, 2)}
+    with pytest.raises(ValueError):
+        parse_rate_limits('www.hltv.org=rápido')
+
+
+def test_redirects_are_not_followed(server):
+    server.routes['/moved'] = [302]
+    server.routes['/redirected'] = [200]
+    fetcher = HttpFetcher(rate_limits={'default': (100.0, 10)})
+    with pytest.raises(FetchError):
+        fetcher.fetch(server.base_url + '/moved')
+    assert [path for path, _, _ in server.requests] == ['/moved']
+    fetcher.close()
+
+
+def test_is_fetchable():
+    assert is_fetchable('steam', 'https://steamcommunity.com/id/furia')
+    assert is_fetchable('hltv', 'https://www.hltv.org/player/1/art')
+    assert not is_fetchable('other', 'https://steamcommunity.com/id/furia')
+    assert not is_fetchable('battlenet', 'https://news.blizzard.com/furia')
+    assert not is_fetchable('steam', 'https://steamcommunity.com.evil.example/id/furia')
+    assert not is_fetchable('steam', 'https://steamcommunity.com:8080/id/furia')
+    assert not is_fetchable('steam', 'https://user@steamcommunity.com/id/furia')
+    assert not is_fetchable('steam', 'file:///etc/passwd')
+
+
+@pytest.mark.parametrize('platform', ['other', 'steam', 'riot'])
+def test_user_urls_outside_allowlist_are_never_fetched(server, monkeypatch, platform):
+    server.routes['/internal/'] = [200]
+    monkeypatch.setattr(EsportsProfileValidator, 'fetcher', HttpFetcher(rate_limits={'default': (100.0, 10)}))
+    result = EsportsProfileValidator.analyze_esports_profile(platform, server.base_url + '/internal/')
+    assert result['success']
+    assert server.requests == []
+    EsportsProfileValidator.fetcher.close()
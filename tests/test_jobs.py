@@ -0,0 +1,97 @@
+"""Fila de tarefas: reserva exclusiva, novas tentativas com backoff e tarefas travadas"""
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import JobError, job_queue
+from models import db, BackgroundJob
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    calls = []
+
+    def flaky(job, payload):
+        calls.append(job.id)
+        raise JobError('serviço indisponível')
+
+    def ok(job, payload):
+        calls.append(job.id)
+        return {'ok': True}
+
+    monkeypatch.setitem(job_queue.handlers, 'test_flaky', flaky)
+    monkeypatch.setitem(job_queue.handlers, 'test_ok', ok)
+    return calls
+
+
+def reload(job_id):
+    db.session.expire_all()
+    return db.session.get(BackgroundJob, job_id)
+
+
+def test_claim_is_exclusive(app, handlers):
+    job_id = job_queue.enqueue('test_ok').id
+    claims = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        with app.app_context():
+            barrier.wait()
+            claims.append(job_queue._claim())
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claims, key=lambda claim: claim is not None) == [None] * 7 + [job_id]
+    assert reload(job_id).attempts == 1
+
+
+def test_retries_with_backoff_until_failed(app, handlers):
+    app.config['JOB_BACKOFF_BASE'] = 10.0
+    job_id = job_queue.enqueue('test_flaky', max_attempts=3).id
+
+    for attempt, backoff in ((1, 10), (2, 20)):
+        started = datetime.utcnow()
+        assert job_queue.run_pending() == 1
+        job = reload(job_id)
+        assert (job.status, job.attempts) == ('pending', attempt)
+        assert started + timedelta(seconds=backoff - 1) <= job.run_after <= datetime.utcnow() + timedelta(seconds=backoff)
+        # Ainda no backoff: nada a executar
+        assert job_queue.run_pending() == 0
+        job.run_after = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+    assert job_queue.run_pending() == 1
+    job = reload(job_id)
+    assert (job.status, job.attempts, job.error) == ('failed', 3, 'serviço indisponível')
+    assert handlers == [job_id] * 3
+
+
+def test_stale_running_job_is_reclaimed(app, handlers):
+    job_id = job_queue.enqueue('test_ok', max_attempts=3).id
+    job = reload(job_id)
+    job.status, job.attempts = 'running', 1
+    job.locked_at = datetime.utcnow() - timedelta(seconds=app.config['JOB_STALE_AFTER'] + 1)
+    db.session.commit()
+
+    assert job_queue.run_pending() == 1
+    job = reload(job_id)
+    assert (job.status, job.attempts) == ('done', 2)
+
+
+def test_stale_job_without_attempts_left_fails(app, handlers):
+    job_id = job_queue.enqueue('test_ok', max_attempts=2).id
+    job = reload(job_id)
+    job.status, job.attempts = 'running', 2
+    job.locked_at = datetime.utcnow() - timedelta(seconds=app.config['JOB_STALE_AFTER'] + 1)
+    db.session.commit()
+
+    assert job_queue.run_pending() == 0
+    job = reload(job_id)
+    assert (job.status, job.attempts, job.locked_at) == ('failed', 2, None)
+    assert handlers == []
@@ -0,0 +1,78 @@
+"""A foto de perfil original (com EXIF) nunca é publicada; só as variantes"""
+
+import io
+import os
+
+from PIL import Image
+
+from app import profile_picture_url, unpublish_profile_originals
+from benchmarks.datagen import cpf_for
+from jobs import job_queue
+from models import db, User, Profile
+from storage import storage, PROFILE_ORIGINALS_FOLDER
+
+
+def jpeg_with_exif():
+    image = Image.new('RGB', (600, 400), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x010F] = 'Fabricante do celular'  # Make
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+def login(app, client):
+    user = User(username='fan1', email='fan1@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    return user
+
+
+def public_files(app):
+    return os.listdir(os.path.join(app.config['STORAGE_PUBLIC_DIR'], 'profiles'))
+
+
+def test_original_stays_private(app):
+    client = app.test_client()
+    user = login(app, client)
+    response = client.post('/profile', data={
+        'name': 'Fã', 'cpf': cpf_for(1), 'birth_date': '1995-05-17', 'address': 'Rua 1',
+        'favorite_games': ['cs2'], 'favorite_teams': ['furia_cs2'],
+        'profile_picture': (io.BytesIO(jpeg_with_exif()), 'foto.jpg'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    profile = db.session.get(User, user.id).profile
+    original = profile.profile_picture
+    assert storage.exists(PROFILE_ORIGINALS_FOLDER, original)
+    assert not storage.exists('profiles', original)
+    assert client.get(f'/uploads/profiles/{original}').status_code == 404
+    with app.test_request_context():
+        assert profile_picture_url(profile) == '/static/images/profile-placeholder.svg'
+
+    job_queue.run_pending()
+    db.session.refresh(profile)
+    with app.test_request_context():
+        url = profile_picture_url(profile, 64)
+        jpeg_url = profile_picture_url(profile, 64, 'jpeg')
+    assert url.startswith('/uploads/profiles/') and url.endswith('.webp')
+    assert original not in public_files(app)
+    response = client.get(jpeg_url)
+    assert response.status_code == 200
+    assert not Image.open(io.BytesIO(response.data)).getexif()
+
+
+def test_published_originals_are_moved(app):
+    storage.save_hashed(io.BytesIO(b'original'), 'profiles', '.jpg')
+    filename = next(name for name in public_files(app))
+    user = User(username='fan1', email='fan1@example.com', password_hash='x')
+    user.profile = Profile(profile_picture=filename)
+    db.session.add(user)
+    db.session.commit()
+
+    assert unpublish_profile_originals() == 1
+    assert storage.exists(PROFILE_ORIGINALS_FOLDER, filename)
+    assert not storage.exists('profiles', filename)
+    assert filename not in public_files(app)
+    assert unpublish_profile_originals() == 0
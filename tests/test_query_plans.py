@@ -0,0 +1,32 @@
+"""As consultas das páginas usam índices (mesma verificação de ``benchmarks.check_query_plans``)"""
+
+import pytest
+from sqlalchemy import text
+
+from benchmarks.check_query_plans import explain, hot_queries
+from benchmarks.datagen import seed
+from models import db
+
+USERS = 2000
+
+
+@pytest.fixture(scope='module')
+def seeded_app(tmp_path_factory):
+    from conftest import make_app
+    app = make_app(str(tmp_path_factory.mktemp('query-plans')))
+    with app.app_context():
+        seed(USERS)
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_hot_queries_use_indexes(seeded_app):
+    scans = {}
+    for name, query in hot_queries(USERS // 2).items():
+        plan, full_scans = explain(query)
+        if full_scans:
+            scans[name] = plan
+    assert not scans
@@ -0,0 +1,50 @@
+"""Os dois níveis do cache de análises sociais respeitam ``SocialAccount.last_sync``"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, User, SocialAccount
+from social_cache import social_cache
+
+
+class CountingAnalyzer:
+    def __init__(self):
+        self.calls = 0
+
+    def analyze_social_profile(self, platform, username, access_token=None):
+        self.calls += 1
+        return {'success': True, 'platform': platform, 'username': username, 'call': self.calls}
+
+
+@pytest.fixture
+def analyzer(app):
+    analyzer = CountingAnalyzer()
+    previous = social_cache.analyzer
+    social_cache.analyzer = analyzer
+    social_cache._entries.clear()
+    yield analyzer
+    social_cache.analyzer = previous
+    social_cache._entries.clear()
+
+
+def test_memory_hit(analyzer):
+    assert social_cache.get('twitter', 'furia')['call'] == 1
+    assert social_cache.get('twitter', 'furia')['call'] == 1
+    assert analyzer.calls == 1
+
+
+def test_later_sync_expires_both_tiers(analyzer):
+    user = User(username='fan1', email='fan1@example.com', password_hash='x')
+    db.session.add(SocialAccount(user=user, platform='twitter', username='furia'))
+    db.session.commit()
+    assert social_cache.get('twitter', 'furia')['call'] == 1
+
+    # Sincronização feita por outro worker depois da análise em memória
+    account = SocialAccount.query.one()
+    account.last_sync = datetime.utcnow() + timedelta(seconds=1)
+    db.session.commit()
+
+    assert social_cache.get('twitter', 'furia')['call'] == 2
+    assert social_cache.get('twitter', 'furia')['call'] == 2
+    assert analyzer.calls == 2